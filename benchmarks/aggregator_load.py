@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Load test for the fleet aggregator.
+
+Starts an aggregator on a temporary database and has many simulated
+recorders upload to it at once, each sending batches of new rows for the
+same set of applications. Reports upload latency and throughput, and fails
+if any upload failed, if rows were lost or stored twice, or if processes
+were not de-duplicated across hosts.
+
+    python benchmarks/aggregator_load.py [--recorders N] [--batches N] [--rows N]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the aggregator only needs the standard library, import it without the
+# selfspy package, which loads the Cocoa recorder
+sys.path.insert(0, os.path.join(ROOT, 'selfspy'))
+
+import aggregator
+
+APPS = ['Safari', 'Mail', 'Terminal', 'Xcode', 'Preview', 'Finder', 'Slack',
+        'Calendar', 'Notes', 'Music', 'Messages', 'Keynote']
+WINDOWS_PER_APP = 5
+
+
+class Recorder:
+    """ a simulated machine, numbering its rows and changes like a local
+        database """
+
+    def __init__(self, url, name, rows):
+        self.url = url
+        self.name = name
+        self.rows = rows
+        self.next_id = {}
+        self.seq = 0
+        self.random = random.Random(name)
+        self.latencies = []
+        self.sent = 0
+        self.errors = []
+
+        # each machine sees the applications in its own order, so local
+        # ids differ from host to host
+        apps = list(APPS)
+        self.random.shuffle(apps)
+        self.processes = [self.row('process', '2014-01-01 09:00:00', app) for app in apps]
+        self.windows = []
+        for _, process_id, _, app in self.processes:
+            for i in xrange(WINDOWS_PER_APP):
+                self.windows.append(self.row('window', '2014-01-01 09:00:00',
+                                             u'%s window %d' % (app, i), process_id, u''))
+
+    def row(self, table, created_at, *columns):
+        """ [seq, id, created_at, columns...] of a new row of table """
+        self.next_id[table] = self.next_id.get(table, 0) + 1
+        self.seq += 1
+        return [self.seq, self.next_id[table], created_at] + list(columns)
+
+    def batch(self, first):
+        now = time.strftime('%Y-%m-%d %H:%M:%S')
+        tables = {'windowevent': [], 'click': [], 'keys': []}
+        if first:
+            tables['process'] = self.processes
+            tables['window'] = self.windows
+        for _ in xrange(self.rows):
+            process_id = self.random.randint(1, len(self.processes))
+            window_id = self.random.randint(1, len(self.windows))
+            tables['windowevent'].append(self.row('windowevent', now, window_id, 'Active'))
+            tables['click'].append(self.row('click', now, 1, True, 100, 200, 3,
+                                            process_id, window_id))
+            if self.random.random() < 0.2:
+                tables['keys'].append(self.row('keys', now, now, 12, 14, 1, 2,
+                                               3.5, 40.0, process_id, window_id))
+        return {'host': self.name, 'tables': tables, 'marks': {'change': self.seq}}
+
+    def run(self, batches):
+        for i in xrange(batches):
+            body = aggregator.pack(self.batch(i == 0))
+            start = time.time()
+            try:
+                aggregator.request(self.url, 'POST', '/upload', body)
+                # an upload retried after a lost answer must not add rows
+                if i == 0:
+                    aggregator.request(self.url, 'POST', '/upload', body)
+            except Exception as e:
+                self.errors.append(e)
+                return
+            self.latencies.append(time.time() - start)
+        self.sent = sum(self.next_id.get(t, 0) for t in ('windowevent', 'click', 'keys'))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Selfspy aggregator load test')
+    parser.add_argument('--recorders', type=int, default=100, help='simulated machines')
+    parser.add_argument('--batches', type=int, default=10, help='uploads per machine')
+    parser.add_argument('--rows', type=int, default=200, help='window events and clicks per upload')
+    parser.add_argument('--tcp', action='store_true', help='use TCP instead of a Unix socket')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        store = aggregator.FleetStore(os.path.join(tmp, 'fleet.sqlite'))
+        if args.tcp:
+            server = aggregator.AggregationServer(('127.0.0.1', 0), store)
+            url = 'http://127.0.0.1:%d' % server.server_address[1]
+        else:
+            path = os.path.join(tmp, 'aggregator.sock')
+            server = aggregator.UnixAggregationServer(path, store)
+            url = 'unix://' + path
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        recorders = [Recorder(url, 'host-%03d' % i, args.rows) for i in xrange(args.recorders)]
+        threads = [threading.Thread(target=r.run, args=(args.batches,)) for r in recorders]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+        server.shutdown()
+
+        latencies = [l for r in recorders for l in r.latencies]
+        sent = sum(r.sent for r in recorders)
+        stored = sum(store.conn.execute('SELECT count(*) FROM %s' % t).fetchone()[0]
+                     for t in ('windowevent', 'click', 'keys'))
+        processes = store.conn.execute('SELECT count(*) FROM process').fetchone()[0]
+        windows = store.conn.execute('SELECT count(*) FROM window').fetchone()[0]
+        unmapped = store.conn.execute('SELECT count(*) FROM click WHERE window_id IS NULL '
+                                      'OR process_id IS NULL').fetchone()[0]
+
+        print('%d recorders, %d uploads in %.2f s: %.0f rows/s' % (
+            args.recorders, len(latencies), elapsed, stored / elapsed if elapsed else 0))
+        print('upload latency: p50 %.1f ms, p99 %.1f ms, max %.1f ms' % (
+            percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+            max(latencies or [0]) * 1000))
+        print('rows sent %d, stored %d; %d processes, %d windows' % (sent, stored, processes, windows))
+
+        failed = False
+        errors = [e for r in recorders for e in r.errors]
+        if errors:
+            print('FAIL: %d uploads failed, first: %r' % (len(errors), errors[0]))
+            failed = True
+        if stored != sent:
+            print('FAIL: %d rows sent but %d stored' % (sent, stored))
+            failed = True
+        if processes != len(APPS) or windows != len(APPS) * WINDOWS_PER_APP:
+            print('FAIL: processes or windows were not de-duplicated across hosts')
+            failed = True
+        if unmapped:
+            print('FAIL: %d clicks point to no process or window' % unmapped)
+            failed = True
+        sys.exit(1 if failed else 0)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
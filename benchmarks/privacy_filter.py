@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark for the privacy rules checked in the recorder's hooks.
+
+Compiles a realistic set of rules (denied processes, title and URL
+patterns, quiet hours, private places) and times each check the recorder
+makes per event, failing if any of them costs more than the budget. Windows
+not seen before only come with screen changes, not with every key press or
+mouse move, and get a budget of their own.
+
+    python benchmarks/privacy_filter.py [--budget US] [--window-budget US] [--events N] [--places N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the rules only need the standard library, import them without the
+# selfspy package, which loads the Cocoa recorder
+sys.path.insert(0, os.path.join(ROOT, 'selfspy'))
+
+import privacy
+
+# microseconds per event, measured on a 2013 MacBook Air
+DEFAULT_BUDGET = 5.0
+DEFAULT_WINDOW_BUDGET = 20.0
+
+PROCESSES = ['1Password', 'Keychain Access', 'Messages', 'Signal', 'Banking']
+TITLES = [r'private browsing', r'incognito', r'\bpassword\b', r'medical',
+          r'^inbox \(\d+\)', r'salary', r'tax return', r'bank statement']
+URLS = [r'^https?://([^/]*\.)?mybank\.com/', r'^https?://mail\.google\.com/',
+        r'/account/security', r'^https?://([^/]*\.)?health\.[a-z]+/']
+INTERVALS = [(22, 0, 7, 0, True), (12, 0, 13, 0, False), (18, 30, 20, 0, False)]
+PLACES = [(48.8566, 2.3522), (40.7128, -74.0060), (51.5074, -0.1278)]
+
+APPS = ['Safari', 'Mail', 'Terminal', 'Xcode', 'Preview', 'Finder', 'Slack',
+        'Calendar', 'Notes', 'Music', 'Messages', 'Keynote']
+
+
+def windows(n):
+    rng = random.Random(0)
+    return [(rng.choice(APPS), u'Document %d - some longer window title' % rng.randint(0, 5000),
+             'https://example.com/page/%d?q=%d' % (rng.randint(0, 5000), rng.randint(0, 99)))
+            for _ in xrange(n)]
+
+
+def per_event(fn, events):
+    """ microseconds per call of fn over events, the best of three runs """
+    best = None
+    for _ in range(3):
+        start = time.time()
+        for event in events:
+            fn(*event)
+        elapsed = (time.time() - start) / len(events) * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Selfspy privacy filter microbenchmark')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='maximum cost of a check in microseconds (default %s)' % DEFAULT_BUDGET)
+    parser.add_argument('--window-budget', type=float, default=DEFAULT_WINDOW_BUDGET,
+                        help='maximum cost of checking a new window (default %s)' % DEFAULT_WINDOW_BUDGET)
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--places', type=int, default=1000,
+                        help='private places, the check should not depend on how many')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    places = PLACES + [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in xrange(args.places)]
+    rules = privacy.PrivacyFilter(PROCESSES, TITLES, URLS, INTERVALS, places)
+    now = time.time()
+    moves = [(now + i * 0.1,) for i in xrange(args.events)]
+    seen = windows(200)
+    fresh = windows(args.events)
+    # half of the locations near a place, as when moving about at home
+    locations = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in xrange(args.events // 2)]
+    locations += [(lat + rng.uniform(-0.002, 0.002), lon + rng.uniform(-0.002, 0.002))
+                  for lat, lon in (rng.choice(places) for _ in xrange(args.events // 2))]
+
+    results = [
+        ('allows (key, click, move)', per_event(rules.allows, moves), args.budget),
+        ('window, seen before', per_event(rules.window, seen * (args.events // len(seen))), args.budget),
+        ('window, new', per_event(lambda *w: (rules.cache.clear(), rules.window(*w)), fresh),
+         args.window_budget),
+        ('place, %d places' % len(places), per_event(rules.place, locations), args.budget),
+    ]
+
+    failed = False
+    for name, cost, budget in results:
+        over = cost > budget
+        failed = failed or over
+        print('%-28s %6.2f us%s' % (name, cost, '  OVER BUDGET' if over else ''))
+    print('budget %.2f us per event, %.2f us per new window' % (args.budget, args.window_budget))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Startup-time benchmark for Selfspy.
+
+Measures how long it takes to import everything the recorder needs before
+it can start recording (the storage engine and the sniffer), and fails if
+that exceeds a budget or if any of the UI-only modules got pulled in.
+
+    python benchmarks/startup.py [--budget SECONDS] [--runs N] [--top N]
+
+On interpreters that support it (3.7+), the per-module breakdown reported by
+`python -X importtime` is printed as well; on Python 2 only the wall-clock
+time of a fresh interpreter importing the recorder is measured.
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds, measured on a 2013 MacBook Air; raise it deliberately, not casually
+DEFAULT_BUDGET = 1.5
+
+RECORDER_MODULE = 'selfspy.activity_store'
+
+# modules that must only be imported on first use
+DEFERRED_MODULES = ['selfspy.reviewer', 'selfspy.debriefer',
+                    'selfspy.preferences', 'selfspy.locationTracking',
+                    'selfspy.helpers', 'dateutil', 'mutagen', 'CoreLocation',
+                    'WebKit', 'selfspy.aggregator', 'selfspy.spooler',
+                    'selfspy.mirror', 'selfspy.replica', 'selfspy.query_service',
+                    'selfspy.retention', 'selfspy.maintenance',
+                    'selfspy.storage_budget', 'selfspy.partitions',
+                    'selfspy.sampling', 'selfspy.privacy', 'httplib']
+
+PROBE = """
+import sys, time, json
+start = time.time()
+import %s
+elapsed = time.time() - start
+print(json.dumps({'elapsed': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (RECORDER_MODULE, DEFERRED_MODULES)
+
+
+def run_probe():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    out = subprocess.check_output([sys.executable, '-c', PROBE], env=env)
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def importtime_breakdown(top):
+    """ returns the `top` slowest imports as (cumulative us, module) pairs """
+    if sys.version_info < (3, 7):
+        return None
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                             'import ' + RECORDER_MODULE],
+                            env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    rows = []
+    for line in err.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Selfspy startup-time benchmark')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='maximum import time in seconds (default %s)' % DEFAULT_BUDGET)
+    parser.add_argument('--runs', type=int, default=5,
+                        help='fresh interpreters to start, the best run counts')
+    parser.add_argument('--top', type=int, default=15,
+                        help='slowest imports to list when -X importtime is available')
+    args = parser.parse_args()
+
+    results = [run_probe() for _ in range(args.runs)]
+    best = min(r['elapsed'] for r in results)
+    loaded = results[0]['loaded']
+
+    breakdown = importtime_breakdown(args.top)
+    if breakdown:
+        print('slowest imports (cumulative):')
+        for cumulative, name in breakdown:
+            print('  %8.1f ms  %s' % (cumulative / 1000.0, name))
+
+    print('import %s: %.3f s (budget %.3f s)' % (RECORDER_MODULE, best, args.budget))
+
+    failed = False
+    if best > args.budget:
+        print('FAIL: startup is over budget')
+        failed = True
+    if loaded:
+        print('FAIL: modules that should be deferred were imported: %s' % ', '.join(loaded))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
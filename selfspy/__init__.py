@@ -26,9 +26,8 @@ import sys
 import argparse
 import ConfigParser
 
-from lockfile import LockFile
-
-from selfspy.activity_store import ActivityStore
+# the recorder and its dependencies are imported in main, so tools such as
+# python -m selfspy.export only load the modules they use
 from selfspy import config as cfg
 
 # Cryptography is no longer used
@@ -64,6 +63,9 @@ def parse_config():
 
 
 def main():
+    from lockfile import LockFile
+    from selfspy.activity_store import ActivityStore
+
     print "Selfspy started. Python version " + sys.version
 
     args = vars(parse_config())
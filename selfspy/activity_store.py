@@ -26,24 +26,32 @@ import datetime
 
 import sqlalchemy
 import re
-import random
 
-from Foundation import *
-from AppKit import *
+# Explicit imports: a star import forces PyObjC to load every symbol of the
+# framework, which dominated startup time before recording could begin.
+import objc
+from Foundation import NSLog, NSMutableArray, NSMutableDictionary
+from AppKit import NSAlert, NSWarningAlertStyle, NSUserDefaultsController
 
 from Cocoa import NSNotificationCenter, NSTimer, NSWorkspace
-import Quartz
-from Quartz import (CGWindowListCopyWindowInfo, kCGWindowListOptionOnScreenOnly,
-                    kCGNullWindowID)
+from PyObjCTools import AppHelper
 
 from selfspy import sniff_cocoa as sniffer
 from selfspy import config as cfg
 from selfspy import models
+from selfspy.keystats import KeyStats
+from selfspy.buffers import KeyBuffer, MousePath
+from selfspy.timeline import Timeline, to_seconds
+from selfspy.names import NameCache
+from selfspy import app_tree
+# the services below (retention, maintenance, queries, replicas, uploads,
+# spooling, mirroring, sampling and privacy rules) are imported where they
+# are constructed or first used, so recording starts before they load
 from selfspy.models import (RecordingEvent, Process, ProcessEvent, Window,
                             WindowEvent, Geometry, Click, Keys, Experience,
-                            Location, Debrief, Bookmark, Snapshot)
+                            Location, Debrief, Bookmark, Snapshot,
+                            PrivacyTimeInterval)
 
-from urlparse import urlparse
 
 NOW = datetime.datetime.now
 SKIP_MODIFIERS = {"", "Shift_L", "Control_L", "Super_L", "Alt_L", "Super_R",
@@ -59,25 +67,18 @@ class Display:
         self.geo_id = None
 
 
-class KeyPress:
-    def __init__(self, key, time, is_repeat):
-        self.key = key
-        self.time = time
-        self.is_repeat = is_repeat
-
-
-class MouseMove:
-    def __init__(self, xy, time):
-        self.xy = xy
-        self.time = time
-
-
 class ActivityStore:
     def __init__(self, db_name):
-        # check if a selfspy thumbdrive is plugged in and available
-        # if so, store screenshots and DB there, otherwise store locally
-        self.lookupThumbdrive()
-        self.defineCurrentDrive()
+        from selfspy.mirror import Mirror, VolumeWatcher
+        from selfspy import sampling
+
+        # everything is written to the local data directory, and mirrored
+        # to a selfspy thumbdrive whenever one is plugged in
+        cfg.CURRENT_DIR = os.path.expanduser(cfg.LOCAL_DIR)
+        self.volumes = VolumeWatcher()
+        self.mirror = Mirror(cfg.CURRENT_DIR, db_name, os.path.join(cfg.CURRENT_DIR, 'mirror'))
+        self.last_mirror = 0
+        self.background = {}  # name -> thread of the work run off the main thread
 
         screenshot_directory = os.path.join(cfg.CURRENT_DIR, 'screenshots')
         try:
@@ -92,8 +93,14 @@ class ActivityStore:
             pass
 
         db_name = os.path.join(cfg.CURRENT_DIR, db_name)
+        self.db_path = db_name
         try:
-            self.session_maker = models.initialize(db_name)
+            if cfg.PARTITION_BY_MONTH:
+                from selfspy import partitions
+                self.session_maker, self.partitions = partitions.initialize(db_name)
+            else:
+                self.session_maker = models.initialize(db_name)
+                self.partitions = None
         except sqlalchemy.exc.OperationalError:
             print "Database operational error. Your storage device may be full. Exiting Selfspy..."
 
@@ -105,8 +112,9 @@ class ActivityStore:
 
             sys.exit()
 
-        self.key_presses = []
-        self.mouse_path = []
+        self.key_presses = KeyBuffer()
+        self.key_stats = KeyStats()
+        self.mouse_path = MousePath()
 
         self.current_window = Display()
         self.current_apps = []
@@ -121,15 +129,19 @@ class ActivityStore:
         self.last_move_time = time.time()
         self.last_commit = time.time()
         self.last_screenshot = time.time()
-        self.last_experience = time.time()
         self.last_active = NOW()
 
         self.screenshots_active = True
         # times below are in seconds
         self.screenshot_time_min = 0.2
         self.screenshot_time_max = 60
-        self.exp_time = 120         # time before first experience sample shows
+        self.experience_time = sampling.TICK
         self.thumbdrive_time = 10
+        self.mirror_time = 60
+        self.retention_time = 1
+        self.upload_time = 300
+        self.spool_time = 60
+        self.maintenance_idle_time = 60 # no input for a minute before compacting the database
         self.snapshot_time = 60
         self.inactivity_time = 120 # after two minutes of inactivity we write this is the database
 
@@ -174,6 +186,9 @@ class ActivityStore:
         s = objc.selector(self.getAppsAndWindows_,signature='v@:@')
         NSNotificationCenter.defaultCenter().addObserver_selector_name_object_(self, s, 'getAppsAndWindows', None)
 
+        s = objc.selector(self.getAppWindows_,signature='v@:@')
+        NSNotificationCenter.defaultCenter().addObserver_selector_name_object_(self, s, 'getAppWindows', None)
+
         s = objc.selector(self.getProcessTimes_,signature='v@:@')
         NSNotificationCenter.defaultCenter().addObserver_selector_name_object_(self, s, 'getProcessTimes', None)
 
@@ -199,7 +214,35 @@ class ActivityStore:
         NSNotificationCenter.defaultCenter().addObserver_selector_name_object_(self, s, 'closeNotification', None)
 
     def run(self):
+        from selfspy.retention import RetentionEngine
+        from selfspy.storage_budget import StorageBudget
+        from selfspy.maintenance import Maintenance
+        from selfspy.query_service import QueryService
+        from selfspy.replica import Replica
+
         self.session = self.session_maker()
+        self.timeline = Timeline(self.session, self.partitions)
+        self.names = NameCache(self.session)
+        self.active_windows = None  # around the time last reviewed
+        self.retention = RetentionEngine(self.session, partitions=self.partitions)
+        self.retention.backfill_media()
+        self.storage = StorageBudget(cfg.CURRENT_DIR)
+        self.maintenance = Maintenance(self.session, self.db_path, self.storage)
+        self.queries = QueryService(self.db_path, self.partitions, dispatch=AppHelper.callAfter)
+        self.replica = Replica(self.db_path)
+        self.experiences = None
+        self.loadPrivacy()
+        self.uploader = None
+        if cfg.AGGREGATOR_URL:
+            from selfspy.aggregator import Uploader
+            self.uploader = Uploader(self.db_path, cfg.AGGREGATOR_URL)
+        self.spooler = None
+        if cfg.SPOOL_TARGET:
+            from selfspy.spooler import Spooler, sink_for
+            self.spooler = Spooler(self.db_path, cfg.CURRENT_DIR,
+                                   os.path.join(cfg.CURRENT_DIR, 'spool'),
+                                   sink_for(cfg.SPOOL_TARGET),
+                                   max_bytes=cfg.SPOOL_MAX_MB * 1024 * 1024)
 
         self.sniffer = sniffer.Sniffer()
         self.sniffer.screen_hook = self.got_screen_change
@@ -225,14 +268,32 @@ class ActivityStore:
         s = objc.selector(self.runMaxScreenshotLoop,signature='v@:')
         self.screenshotTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(self.screenshot_time_max, self, s, None, False)
 
+        # Timer showing the experience-sample window at the times planned for the day
+        self.configureExperiences()
         s = objc.selector(self.runExperienceLoop,signature='v@:')
-        self.experienceTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(self.exp_time, self, s, None, False)
+        self.experienceTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(self.experience_time, self, s, None, True)
 
         s = objc.selector(self.runStateSnapshotLoop,signature='v@:')
         self.stateSnapshotTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(self.snapshot_time, self, s, None, True)
 
-        # Timer for checking if thumbdrive/memory card is available
-        s = objc.selector(self.defineCurrentDrive,signature='v@:')
+        # Timer for deleting expired data a batch at a time
+        s = objc.selector(self.runRetentionLoop,signature='v@:')
+        self.retentionTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(self.retention_time, self, s, None, True)
+
+        # Timer for uploading new rows to the fleet aggregator
+        self.uploadTimer = None
+        if self.uploader:
+            s = objc.selector(self.runUploadLoop,signature='v@:')
+            self.uploadTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(self.upload_time, self, s, None, True)
+
+        # Timer for packaging new data into the spool and shipping it
+        self.spoolTimer = None
+        if self.spooler:
+            s = objc.selector(self.runSpoolLoop,signature='v@:')
+            self.spoolTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(self.spool_time, self, s, None, True)
+
+        # Timer for checking if thumbdrive/memory card is available and mirroring to it
+        s = objc.selector(self.runMirrorLoop,signature='v@:')
         self.thumbdriveTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(self.thumbdrive_time, self, s, None, True)
         self.thumbdriveTimer.fire() # get location immediately
 
@@ -246,6 +307,12 @@ class ActivityStore:
                 self.stateSnapshotTimer.invalidate()
             if self.thumbdriveTimer:
                 self.thumbdriveTimer.invalidate()
+            if self.retentionTimer:
+                self.retentionTimer.invalidate()
+            if self.uploadTimer:
+                self.uploadTimer.invalidate()
+            if self.spoolTimer:
+                self.spoolTimer.invalidate()
         except(AttributeError):
             pass
 
@@ -288,6 +355,14 @@ class ActivityStore:
             win_width is the width of the window
             win_height is the height of the window """
 
+        # nothing is written about windows the privacy rules exclude
+        regularApps = [app for app in regularApps if self.privacy.allows_window(app.localizedName(), None)]
+        regularWindows = [w for w in regularWindows if self.privacy.allows_window(w['process'], w['title'], w['url'])]
+        self.privacy.window(process_name, window_name, browser_url)
+        if not self.privacy.allows():
+            self.leaveWindow()
+            return
+
         # find apps that have opened or become active since the last check
         for app in regularApps:
             db_process = self.session.query(Process).filter_by(name=app.localizedName()).scalar()
@@ -296,6 +371,7 @@ class ActivityStore:
                 self.session.add(process_to_add)
                 self.trycommit()
                 db_process = self.session.query(Process).filter_by(name=app.localizedName()).scalar()
+                self.names.add_process(db_process.id, db_process.name)
             process_id = db_process.id
 
             if app not in self.current_apps:
@@ -371,6 +447,7 @@ class ActivityStore:
                 self.session.add(cur_process)
                 self.trycommit()
                 cur_process = self.session.query(Process).filter_by(name=process_name).scalar()
+                self.names.add_process(cur_process.id, cur_process.name)
 
             if cur_process.name != self.active_app['name']:
 
@@ -423,47 +500,33 @@ class ActivityStore:
                 self.current_window.geo_id = cur_geometry.id
                 self.take_screenshot()
 
-    def filter_many(self):
-        specials_in_row = 0
-        lastpress = None
-        newpresses = []
-
-        for press in self.key_presses:
-            key = press.key
-            if specials_in_row and key != lastpress.key:
-                if specials_in_row > 1:
-                    lastpress.key = '%s]x%d>' % (lastpress.key[:-2], specials_in_row)
-                newpresses.append(lastpress)
-                specials_in_row = 0
-
-            if len(key) > 1:
-                specials_in_row += 1
-                lastpress = press
-            else:
-                newpresses.append(press)
-
-        if specials_in_row:
-            if specials_in_row > 1:
-                lastpress.key = '%s]x%d>' % (lastpress.key[:-2], specials_in_row)
-            newpresses.append(lastpress)
-
-        self.key_presses = newpresses
+    def leaveWindow(self):
+        """ ends the active window, when switching to one that is not recorded """
+        if self.active_app['id'] != '':
+            self.session.add(ProcessEvent(self.active_app['id'], "Inactive"))
+        if self.active_window['id'] != '':
+            self.session.add(WindowEvent(self.active_window['id'], "Inactive"))
+        self.store_keys()
+        self.mouse_path.clear()
+        self.trycommit()
+        self.active_app = {'id': '', 'name': ''}
+        self.active_window = {'id': '', 'title': '', 'process': '', 'url': ''}
+        self.current_window = Display()
 
     def store_keys(self):
         """ Stores the current queued key-presses """
-        self.filter_many()
-
         if self.key_presses:
-            keys = [press.key for press in self.key_presses]
-            timings = [press.time for press in self.key_presses]
-            add = lambda count, press: count + (0 if press.is_repeat else 1)
-            nrkeys = reduce(add, self.key_presses, 0)
+            # runs of the same special key count as one press
+            timings, nrkeys = self.key_presses.filtered()
 
             # we don't store the keys pressed for privacy reasons
             # but we do keep their timings and numbers.
             curtext = u""
             keys = []
 
+            if not self.storage.key_timings():
+                timings = []
+
             self.session.add(Keys(curtext.encode('utf8'),
                                   keys,
                                   timings,
@@ -471,12 +534,14 @@ class ActivityStore:
                                   self.started,
                                   self.current_window.proc_id,
                                   self.current_window.win_id,
-                                  self.current_window.geo_id))
+                                  self.current_window.geo_id,
+                                  self.key_stats))
 
             self.trycommit()
 
             self.started = NOW()
-            self.key_presses = []
+            self.key_presses.clear()
+            self.key_stats.reset()
             self.last_key_time = time.time()
 
     def got_key(self, keycode, state, string, is_repeat):
@@ -489,36 +554,40 @@ class ActivityStore:
             repeat is True if the current key is a repeat sent by the keyboard """
         now = time.time()
 
-        if string in SKIP_MODIFIERS:
+        if string in SKIP_MODIFIERS or not self.privacy.allows(now):
             return
 
+        self.key_stats.add(string, now - self.last_key_time, is_repeat)
+
         if len(state) > 1 or (len(state) == 1 and state[0] != "Shift"):
             string = '<[%s: %s]>' % (' '.join(state), string)
         elif len(string) > 1:
             string = '<[%s]>' % string
 
-        self.key_presses.append(KeyPress(string, now - self.last_key_time, is_repeat))
+        self.key_presses.append(string, now - self.last_key_time, is_repeat)
         self.last_key_time = now
 
         self.take_screenshot()
 
     def store_click(self, button, x, y):
         """ Stores incoming mouse-clicks """
-
-        #Put mouse locations and timings in arrays
-        locs = [loc.xy for loc in self.mouse_path]
-        timings = [loc.time for loc in self.mouse_path]
-
+        if not self.storage.raw_events():
+            self.mouse_path.clear()
+            return
+        if self.storage.mouse_paths():
+            path, timings = self.mouse_path.path(), self.mouse_path.timings()
+        else:
+            path, timings = [], []
         self.session.add(Click(button,
                                True,
                                x, y,
                                len(self.mouse_path),
-                               locs,
+                               path,
                                timings,
                                self.current_window.proc_id,
                                self.current_window.win_id,
                                self.current_window.geo_id))
-        self.mouse_path = []
+        self.mouse_path.clear()
         self.trycommit()
 
     def got_mouse_click(self, button, x, y):
@@ -526,6 +595,8 @@ class ActivityStore:
             Mouse buttons: left: 1, middle: 2, right: 3, scroll up: 4, down:5, left:6, right:7
             x,y are the coordinates of the keypress
             press is True if it pressed down, False if released"""
+        if not self.privacy.allows():
+            return
         if button in [4, 5, 6, 7]:
             if time.time() - self.last_scroll[button] < SCROLL_COOLOFF:
                 return
@@ -542,22 +613,35 @@ class ActivityStore:
         now = time.time()
 
         if now-self.last_move_time > 1/frequency:
-            self.mouse_path.append(MouseMove([x,y], now - self.last_move_time))
+            if self.privacy.allows(now):
+                self.mouse_path.append(x, y, now - self.last_move_time)
             self.last_move_time = now
 
     def store_location(self, lat, lon):
         # now = time.time()
         # print "adding location to DB"
+        if not self.storage.raw_events():
+            return
         self.session.add(Location(lat, lon))
         self.trycommit()
 
     def got_location_change(self, lat, lon):
         # print "location change"
-        self.store_location(lat, lon)
+        was_allowed = self.privacy.place_allowed
+        if self.privacy.place(lat, lon) != was_allowed:
+            if was_allowed:
+                NSLog("Entered a private place, recording paused")
+                self.leaveWindow()
+            else:
+                NSLog("Left the private place, recording resumed")
+        if self.privacy.allows():
+            self.store_location(lat, lon)
 
     # removed project
     def store_experience(self, message, screenshot, user_initiated, ignored):
         self.session.add(Experience( message, screenshot, user_initiated, ignored))
+        if screenshot and os.path.exists(screenshot):
+            self.retention.add_media('screenshots', screenshot)
         self.trycommit()
 
     def gotExperience_(self, notification):
@@ -575,6 +659,8 @@ class ActivityStore:
         memory_id = notification.object().debriefController.memoryStrength.intValue()
 
         self.session.add(Debrief(experience_id, doing_report, audio_file, memory_id))
+        if audio_file and os.path.exists(audio_file):
+            self.retention.add_media('audio', audio_file)
         self.trycommit()
 
     def populateDebriefWindow_(self, notification):
@@ -611,63 +697,128 @@ class ActivityStore:
             controller.deleteAudioButton.setHidden_(True)
 
 
+    def metadataAt(self, t):
+        """ (process name, window title, browser url) of the window active
+            at t in seconds, None if no window was active. t has to be
+            covered by active_windows. """
+        window_id = self.active_windows.at(t)
+        if window_id is None:
+            return None
+        info = self.names.window_info(window_id)
+        if info is None:
+            return None
+        title, process_id, browser_url = info
+        return self.names.process_name(process_id), title, browser_url
+
     def queryMetadata_(self, notification):
-        controller = notification.object().reviewController
-        try:
-            q = self.session.query(Window).filter(Window.created_at.like(controller.dateQuery + "%")).add_column(Window.process_id).all()
-            if len(q) > 0:
-                p = self.session.query(Process).filter(Process.id == q[0][1]).add_column(Process.name).all()
-                if p[0][1] == "Safari" or p[0][1] == "Google Chrome":
-                    u = self.session.query(Window).filter(Window.created_at.like(controller.dateQuery + "%")).add_column(Window.browser_url).all()
-                    controller.queryResponse2.append(u[0][1])
-                controller.queryResponse.append(p[0][1])
-        except UnicodeEncodeError:
-                pass
+        """ answers with the process and URL of the window active when the
+            screenshot in dateQuery was taken. The activations around it
+            are read by the query service the first time the reviewer gets
+            there, and looked up in memory after that. """
+        from selfspy import query_service
+
+        reviewer = notification.object()
+        controller = reviewer.reviewController
+        t = to_seconds(controller.dateQuery.rstrip('.'))
+
+        def answer(windows):
+            self.active_windows = windows
+            if reviewer.reviewController is not controller:
+                return  # the reviewer was closed since
+            try:
+                metadata = self.metadataAt(t)
+                if metadata:
+                    process_name, title, browser_url = metadata
+                    if process_name == "Safari" or process_name == "Google Chrome":
+                        controller.queryResponse2.append(browser_url)
+                    controller.queryResponse.append(process_name)
+            except UnicodeEncodeError:
+                    pass
+
+        if self.active_windows is not None and self.active_windows.covers(t):
+            answer(self.active_windows)
+        else:
+            self.queries.submit(query_service.active_windows, self.partitions, t, callback=answer)
 
     def getAppsAndWindows_(self, notification):
-        controller = notification.object().reviewController
-        controller.results = NSMutableArray([])
+        """ queries the next page of apps for the reviewer's app list, their
+            windows are only loaded once an app is selected """
+        from selfspy import query_service
+
+        reviewer = notification.object()
+        controller = reviewer.reviewController
+        if not controller.appsLoaded:
+            app_tree.backfill_hostnames(self.session)
+            controller.results = NSMutableArray([])
+
+        def show(page):
+            if reviewer.reviewController is not controller:
+                return  # the reviewer was closed since
+            first_new = len(controller.results)
+            try:
+                for process_id, name in page:
+                    app_dict = NSMutableDictionary({'checked':False, 'image':'', 'appId':NSMutableArray([process_id]), 'appName': name, 'windows':NSMutableArray([]), 'windows_mixed':NSMutableArray([]), 'windowsLoaded':0, 'windowsExhausted':False})
+                    controller.results.append(app_dict)
+            except UnicodeEncodeError:
+                    pass
+            controller.appsLoaded += len(page)
+            controller.appsExhausted = len(page) < app_tree.APP_PAGE_SIZE
+            reviewer.showApps(reviewer, first_new=first_new)
+
+        def failed(error):
+            # the next scroll to the end asks again
+            controller.appsPending = False
+
+        self.queries.submit(query_service.apps, controller.appsLoaded, callback=show, errback=failed)
+
+    def getAppWindows_(self, notification):
+        """ queries the next page of window rows of the app in windowQuery """
+        from selfspy import query_service
+
+        reviewer = notification.object()
+        app_data = reviewer.reviewController.windowQuery
+        saved = app_data.get('savedWindows') or {}
+        default = 1 if app_data['checked'] == 1 else 0
+
+        def show(page):
+            try:
+                for name, ids in page:
+                    window_dict = NSMutableDictionary({'checked':saved.get(name, default), 'windowId':NSMutableArray(ids), 'windowName':name, 'image':''})
+                    app_data['windows'].append(window_dict)
+            except UnicodeEncodeError:
+                    pass
+            app_data['windowsLoaded'] += len(page)
+            app_data['windowsExhausted'] = len(page) < app_tree.WINDOW_PAGE_SIZE
+            reviewer.showWindows(reviewer, app_data=app_data)
 
-        try:
-            q_apps = self.session.query(Process).all()
-            q_windows = self.session.query(Window).all()
-
-            for a in q_apps:
-                app_dict = NSMutableDictionary({'checked':False, 'image':'', 'appId':NSMutableArray([a.id]), 'appName': a.name, 'windows':NSMutableArray([]), 'windows_mixed':NSMutableArray([])})
-                controller.results.append(app_dict)
-
-            for w in q_windows:
-                if w.browser_url == 'NO_URL' or w.browser_url == '' or not w.browser_url:
-                    windowName = w.title if w.title else 'NO_TITLE'
-                    window_dict = NSMutableDictionary({'checked':False, 'windowId':NSMutableArray([w.id]), 'windowName':windowName, 'image':''})
-                    controller.results[w.process_id-1]['windows'].append(window_dict)
-                else:
-                    short_url = urlparse(w.browser_url).hostname
-                    try:
-                        window_dict = (d for d in controller.results[w.process_id-1]['windows'] if d['windowName'] == short_url).next()
-                        window_dict['windowId'].append(w.id)
-                    except:
-                        window_dict = NSMutableDictionary({'checked':False, 'windowId':NSMutableArray([w.id]), 'windowName':short_url, 'image':''})
-                        controller.results[w.process_id-1]['windows'].append(window_dict)
+        def failed(error):
+            app_data['windowsPending'] = False
 
-        except UnicodeEncodeError:
-                pass
+        self.queries.submit(query_service.app_windows, app_data['appId'][0],
+                            app_data['windowsLoaded'], callback=show, errback=failed)
 
 
     def getProcessTimes_(self, notification):
-        controller = notification.object().reviewController
-        try:
-            q = self.session.query(ProcessEvent).add_column(ProcessEvent.event_type).add_column(ProcessEvent.created_at).add_column(ProcessEvent.process_id).all()
-            if len(q) > 0:
-                controller.processTimesResponse.append(q)
-        except UnicodeEncodeError:
-                pass
+        """ answers with the timeline bounds and at most one process segment
+            per pixel column of the reviewer's timeline """
+        from selfspy import query_service
+
+        reviewer = notification.object()
+        controller = reviewer.reviewController
+        # materializing new intervals writes, so it stays on the recorder's
+        # session, reading them is done off the main thread
+        self.timeline.refresh()
+
+        def draw(times):
+            if times and reviewer.reviewController is controller:
+                controller.processTimesResponse.append(times)
+                reviewer.drawTimeline(reviewer)
+
+        self.queries.submit(query_service.process_times, controller.timelineWidth, callback=draw)
 
     def getProcessIDFromName(self, name):
         try:
-            q = self.session.query(Process).filter(Process.name == name).add_column(Process.id).all()
-            if len(q) > 0:
-                return q[0][1]
+            return self.names.process_id(name)
         except UnicodeEncodeError:
                 pass
         return None
@@ -684,12 +835,9 @@ class ActivityStore:
 
     def getProcessNameFromID_(self, notification):
         controller = notification.object().reviewController
-        try:
-            q = self.session.query(Process).filter(Process.id == controller.processNameQuery).add_column(Process.name).all()
-            if len(q) > 0:
-                controller.processNameResponse.append(q[0][1])
-        except UnicodeEncodeError:
-                pass
+        name = self.names.process_name(controller.processNameQuery)
+        if name is not None:
+            controller.processNameResponse.append(name)
 
     def getPriorExperiences_(self, notification):
         prior_messages = self.session.query(Experience).distinct(Experience.message).group_by(Experience.message).order_by(Experience.id.desc()).limit(5)
@@ -697,47 +845,55 @@ class ActivityStore:
             if(m.message != ''):
                 notification.object().experienceText.addItemWithObjectValue_(m.message)
 
+    def loadPrivacy(self):
+        # the rules are read once, changes to them apply after a restart
+        from selfspy.privacy import PrivacyFilter
+        self.privacy = PrivacyFilter.load(self.session, cfg.PRIVACY_TITLE_PATTERNS,
+                                          cfg.PRIVACY_URL_PATTERNS, cfg.PRIVACY_RADIUS)
+
+    def quietHours(self):
+        return [(t.fromHour, t.fromMinute, t.toHour, t.toMinute, t.weekend)
+                for t in self.session.query(PrivacyTimeInterval)]
+
+    def configureExperiences(self):
+        # the preferences are only read here, when they change
+        values = NSUserDefaultsController.sharedUserDefaultsController().values()
+        interval = values.valueForKey_('experienceTime')
+        enabled = bool(values.valueForKey_('experienceLoop'))
+        if self.experiences is None:
+            from selfspy import sampling
+            self.experiences = sampling.ExperienceSchedule(
+                os.path.join(cfg.CURRENT_DIR, 'experience_schedule.json'),
+                interval, enabled, self.quietHours)
+        else:
+            self.experiences.configure(interval, enabled)
+
     def runExperienceLoop(self):
-        experienceLoop = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('experienceLoop')
-        if(experienceLoop):
+        now = time.time()
+        idle = now - max(self.last_key_time, self.last_move_time)
+        if self.experiences.due(now, idle):
             NSLog("Showing Experience Sampling Window on Cycle...")
             expController = sniffer.ExperienceController.show()
             expController.user_initiated = False
-            self.last_experience = time.time()
-
-            s = objc.selector(self.runExperienceLoop,signature='v@:')
-            self.exp_time = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('experienceTime')
-            self.experienceTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(self.exp_time, self, s, None, False)
 
     def checkExperienceOnPrefChange_(self, notification):
-        if(self.experienceTimer):
-            self.experienceTimer.invalidate()
+        self.configureExperiences()
 
-        self.exp_time = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('experienceTime')
-        time_since_last_experience = time.time() - self.last_experience
+    def getDebriefExperiences_(self, notification):
+        from selfspy import query_service
 
-        experienceLoop = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('experienceLoop')
-        if(experienceLoop):
-            if (time_since_last_experience > self.exp_time):
-                self.runExperienceLoop()
-            else:
-                sleep_time = self.exp_time - time_since_last_experience + 0.01
-                s = objc.selector(self.runExperienceLoop,signature='v@:')
-                self.experienceTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(sleep_time, self, s, None, False)
+        debriefer = notification.object()
 
-    def getDebriefExperiences_(self, notification):
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
-        q = self.session.query(Experience).filter(Experience.created_at.like(today + '%')).all()
-        m = []
-        for row in q:
-            m.append({'id': row.id, 'created_at': row.created_at, 'message':row.message, 'screenshot':row.screenshot})
-
-        # get a random sample of up to 8 random experiences
-        if len(m) > 7:
-            e = random.sample(m, 7)
-        else:
-            e = random.sample(m, len(m))
-        notification.object().experiences = e
+        def start(e):
+            # a random sample of up to 7 of today's experiences
+            debriefer.experiences = e
+            debriefer.startDebrief(debriefer)
+
+        def failed(error):
+            # shows the debriefer's message for a day without experiences
+            start([])
+
+        self.queries.submit(query_service.experiences_of_day, callback=start, errback=failed)
 
     def checkMaxScreenshotOnPrefChange_(self, notification):
         self.screenshotTimer.invalidate()
@@ -771,83 +927,66 @@ class ActivityStore:
             now = datetime.datetime.now()
             delete_from_time = now - delta
 
-        # delete data from all tables
-        q = self.session.query(Click).filter(Click.created_at > delete_from_time).delete()
-        q = self.session.query(Debrief).filter(Debrief.created_at > delete_from_time).delete()
-        q = self.session.query(Experience).filter(Experience.created_at > delete_from_time).delete()
-        q = self.session.query(Geometry).filter(Geometry.created_at > delete_from_time).delete()
-        q = self.session.query(Keys).filter(Keys.created_at > delete_from_time).delete()
-        q = self.session.query(Location).filter(Location.created_at > delete_from_time).delete()
-        q = self.session.query(Process).filter(Process.created_at > delete_from_time).delete()
-        q = self.session.query(Snapshot).filter(Process.created_at > delete_from_time).delete()
-        q = self.session.query(Window).filter(Window.created_at > delete_from_time).delete()
-
-        screenshot_directory = os.path.expanduser(os.path.join(cfg.CURRENT_DIR,"screenshots"))
-        screenshot_files = os.listdir(screenshot_directory)
+        # delete data from all tables, screenshots and recordings in
+        # batches, done by runRetentionLoop while recording goes on
+        self.trycommit()
+        self.retention.purge_since(None if minutes_to_delete == -1 else delete_from_time)
 
-        for f in screenshot_files:
-            if f[0:19] > delete_from_time.strftime("%y%m%d-%H%M%S%f") or  minutes_to_delete == -1 :
-                os.remove(os.path.join(screenshot_directory,f))
+        def purged():
+            # deleted ids can be handed out again
+            self.names.invalidate()
+            self.timeline.reset()
+            self.active_windows = None
+            print "You deleted the last " + text + " of your history"
 
-        print "You deleted the last " + text + " of your history"
+        self.retention.then(purged)
+        self.retention.vacuum()
+        print "Deleting the last " + text + " of your history"
 
 
     def take_screenshot(self):
       # We check whether the screenshot option is on and then limit the screenshot taking rate to user defined rate
       self.screenshots_active = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('screenshots')
       self.screenshot_time_min = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('imageTimeMin') / 1000.0
+      # fewer and smaller screenshots, or none, when the disk is filling up
+      interval = self.storage.screenshot_interval(self.screenshot_time_min)
 
-      if (self.screenshots_active
-        and (time.time() - self.last_screenshot) > self.screenshot_time_min) :
+      if (self.screenshots_active and interval is not None
+        and (time.time() - self.last_screenshot) > interval
+        and self.privacy.allows()) :
           try:
               folder = os.path.join(cfg.CURRENT_DIR,"screenshots")
               filename = datetime.datetime.now().strftime("%y%m%d-%H%M%S%f")
               path = os.path.join(folder,""+filename+".jpg")
 
-              self.sniffer.screenshot(path)
+              saved = self.sniffer.screenshot(path, scale=self.storage.screenshot_scale())
+              # a screenshot failing for want of space is caught by the
+              # regular check of screenshot_scale, at most CHECK_INTERVAL later
+              if saved:
+                  self.retention.add_media('screenshots', saved)
+                  self.storage.note_written(saved)
               self.last_screenshot = time.time()
           except:
               print "error with image backup"
 
-    def lookupThumbdrive(self, namefilter=""):
-        for dir in os.listdir('/Volumes') :
-            if namefilter in dir :
-                volume = os.path.join('/Volumes', dir)
-                try :
-                    if (os.path.ismount(volume)) :
-                        subDirs = os.listdir(volume)
-                        for filename in subDirs:
-                            if "selfspy.cfg" == filename :
-                                print "backup drive found ", volume
-                                cfg.THUMBDRIVE_DIR = volume
-                                return cfg.THUMBDRIVE_DIR
-                except OSError:
-                    print "Couldn't read drive ", volume
-                    # raise
+    def runMirrorLoop(self):
+        volume = self.volumes.volume()
+        if volume != cfg.THUMBDRIVE_DIR:
+            cfg.THUMBDRIVE_DIR = volume
+            self.last_mirror = 0  # mirror a drive as soon as it is plugged in
+        if volume and time.time() - self.last_mirror > self.mirror_time:
+            self.last_mirror = time.time()
+            self.runInBackground('mirror', lambda: self.mirrorTo(volume))
 
-        return None
-
-    def defineCurrentDrive(self):
-        if (self.isThumbdrivePlugged()) :
-            cfg.CURRENT_DIR = cfg.THUMBDRIVE_DIR
-        else :
-            cfg.CURRENT_DIR = os.path.expanduser(cfg.LOCAL_DIR)
+    def mirrorTo(self, volume):
+        try:
+            self.mirror.run(volume)
+        except (IOError, OSError) as e:
+            print "Could not mirror to %s: %s" % (volume, e)
 
     def checkDrive_(self, notification):
-        self.lookupThumbdrive_()
-        self.defineCurrentDrive()
-
-    def isThumbdrivePlugged(self):
-        if (cfg.THUMBDRIVE_DIR != None and cfg.THUMBDRIVE_DIR != ""):
-            if (os.path.ismount(cfg.THUMBDRIVE_DIR)):
-                return True
-            else :
-                print "Thumbdrive defined but not plugged\n TODO: display alert message"
-                cfg.THUMBDRIVE_DIR = None
-                self.lookupThumbdrive()
-                return False
-        else :
-            return False
+        self.volumes.mtime = None  # list the volumes again
+        self.runMirrorLoop()
 
     def computerPaused(self, now):
         recording = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('recording')
@@ -882,8 +1021,50 @@ class ActivityStore:
         self.trycommit()
 
 
+    def runRetentionLoop(self):
+        if not self.retention.busy() and self.retention.policies_due():
+            self.retention.apply_policies()
+            self.retention.vacuum()
+        self.retention.run_for()
+
+    def runInBackground(self, name, target):
+        # uploads and spooling run on their own thread and database
+        # connections, so a slow network never holds up the recorder
+        import threading
+
+        thread = self.background.get(name)
+        if thread and thread.is_alive():
+            return
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        self.background[name] = thread
+
+    def runUploadLoop(self):
+        self.runInBackground('upload', self.upload)
+
+    def upload(self):
+        import socket
+        import httplib
+
+        try:
+            self.uploader.upload()
+        except (IOError, socket.error, httplib.HTTPException) as e:
+            print "Could not upload to the aggregator: %s" % e
+
+    def runSpoolLoop(self):
+        self.runInBackground('spool', self.spooler.run)
+
+    def refreshReplica(self):
+        age = self.replica.age()
+        if cfg.REPLICA_INTERVAL and (age is None or age > cfg.REPLICA_INTERVAL):
+            self.runInBackground('replica', self.replica.snapshot)
+
     def runStateSnapshotLoop(self):
         processListNames = self.sniffer.getProcessList()
+        # processes that are not to be recorded are left out of snapshots too
+        processListNames = [name for name in processListNames
+                            if self.privacy.allows_window(name, None)]
         # NSLog("snapshot : " + str(processListNames))
         processListIDs = map(self.getProcessIDFromName, processListNames)
         # NSLog("snapshot : " + str(processListIDs))
@@ -893,8 +1074,15 @@ class ActivityStore:
         # NSLog("snapshot : " + str(ss))
         cleanProcessListIDs = filter(None, list(ss))
         # NSLog("snapshot : " + str(cleanProcessListIDs))
-        snapshot = Snapshot(str(cleanProcessListIDs))
-        self.session.add(snapshot)
+        if self.storage.raw_events() and self.privacy.allows():
+            snapshot = Snapshot(str(cleanProcessListIDs))
+            self.session.add(snapshot)
+
+        last_input = max(self.last_key_time, self.last_move_time)
+        if time.time() - last_input > self.maintenance_idle_time:
+            self.trycommit()
+            self.maintenance.idle_work()
+        self.refreshReplica()
       
         now = NOW()
         if ((now - self.last_active).total_seconds() > 120) :
@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Collects the recordings of many machines into one database. The server
+# only needs the standard library, so it can run on any box with
+#
+#     python selfspy/aggregator.py --db fleet.sqlite --port 8765
+#     python selfspy/aggregator.py --db fleet.sqlite --socket /tmp/selfspy.sock
+#
+# and recorders upload to it with Uploader when config.AGGREGATOR_URL is set.
+#
+# Uploads follow the change feed of the recorder database (see changes.py)
+# rather than row ids, which SQLite hands out again once the newest rows
+# were deleted. Every row is sent with the sequence number of its Change,
+# the rows that were already there when a host first uploaded with minus
+# their id, and is stored under that number.
+
+import os
+import json
+import zlib
+import socket
+import sqlite3
+import httplib
+import urllib
+import argparse
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+UPLOAD_ROWS = 5000  # changes, or rows per table recorded before the first upload, per upload
+IN_CHUNK = 500  # ids looked up per query, below SQLite's limit of bound parameters
+
+# host-local ids of these are mapped to rows shared by all hosts, matched
+# on the listed columns
+DIMENSIONS = (
+    ('process', ('name',)),
+    ('window', ('title', 'process_id', 'browser_url')),
+)
+
+# columns uploaded besides id and created_at. Typed text, key names and
+# mouse paths stay on the machines they were recorded on.
+EVENTS = (
+    ('processevent', ('process_id', 'event_type')),
+    ('windowevent', ('window_id', 'event_type')),
+    ('click', ('button', 'press', 'x', 'y', 'nrmoves', 'process_id', 'window_id')),
+    ('keys', ('started', 'nrkeys', 'nrpresses', 'nrbackspaces', 'nrbursts',
+              'typing_time', 'wpm', 'process_id', 'window_id')),
+    ('recordingevent', ('time', 'event_type')),
+    ('experience', ('message', 'user_initiated', 'ignored', 'after_break')),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS host (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS process (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS window (id INTEGER PRIMARY KEY, process_id INTEGER NOT NULL,
+    title TEXT NOT NULL, browser_url TEXT NOT NULL, UNIQUE (process_id, title, browser_url));
+CREATE TABLE IF NOT EXISTS host_process (host_id INTEGER NOT NULL, local_id INTEGER NOT NULL,
+    process_id INTEGER NOT NULL, PRIMARY KEY (host_id, local_id));
+CREATE TABLE IF NOT EXISTS host_window (host_id INTEGER NOT NULL, local_id INTEGER NOT NULL,
+    window_id INTEGER NOT NULL, PRIMARY KEY (host_id, local_id));
+CREATE TABLE IF NOT EXISTS watermark (host_id INTEGER NOT NULL, table_name TEXT NOT NULL,
+    last_id INTEGER NOT NULL, PRIMARY KEY (host_id, table_name));
+"""
+
+# event rows are keyed by host and sequence number, and indexed by host
+# first, so each host's rows are stored and read together. id is the id
+# the row has on its host.
+EVENT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS %(table)s (host_id INTEGER NOT NULL, seq INTEGER NOT NULL,
+    id INTEGER NOT NULL, created_at TEXT, %(columns)s, PRIMARY KEY (host_id, seq));
+CREATE INDEX IF NOT EXISTS ix_%(table)s_host_created_at ON %(table)s (host_id, created_at);
+"""
+
+
+def pack(obj):
+    return zlib.compress(json.dumps(obj, separators=(',', ':')))
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(data))
+
+
+class FleetStore:
+    """ The aggregated database. Uploads are applied one at a time, each in
+        a transaction along with the watermarks the host sent, and rows are
+        stored by sequence number, so a retried upload is not stored twice.
+        A local id given to a new process or window, after the host deleted
+        the one that had it, is mapped to the new one from then on. """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.executescript(SCHEMA)
+        for table, columns in EVENTS:
+            self.conn.executescript(EVENT_SCHEMA % {'table': table,
+                                                   'columns': ', '.join(columns)})
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.load_ids()
+
+    def load_ids(self):
+        """ caches the shared and per-host ids, read again after a failed
+            upload as they may hold ids of rows that were rolled back """
+        self.hosts = dict(self.conn.execute('SELECT name, id FROM host'))
+        self.processes = dict(self.conn.execute('SELECT name, id FROM process'))
+        self.windows = dict(((p, t, u), i) for i, p, t, u in
+                            self.conn.execute('SELECT id, process_id, title, browser_url FROM window'))
+        self.local = {}  # (dimension, host id, local id) -> shared id
+        for dimension in ('process', 'window'):
+            for host_id, local_id, shared_id in self.conn.execute(
+                    'SELECT host_id, local_id, %s_id FROM host_%s' % (dimension, dimension)):
+                self.local[(dimension, host_id, local_id)] = shared_id
+
+    def host_id(self, name):
+        host_id = self.hosts.get(name)
+        if host_id is None:
+            host_id = self.conn.execute('INSERT INTO host (name) VALUES (?)', (name,)).lastrowid
+            self.hosts[name] = host_id
+        return host_id
+
+    def watermarks(self, host):
+        with self.lock:
+            host_id = self.hosts.get(host)
+            if host_id is None:
+                return {}
+            return dict(self.conn.execute('SELECT table_name, last_id FROM watermark '
+                                          'WHERE host_id = ?', (host_id,)))
+
+    def apply(self, upload):
+        """ stores an upload, returns the host's new watermarks """
+        with self.lock:
+            try:
+                host_id = self.host_id(upload['host'])
+                tables = upload.get('tables', {})
+
+                for row in tables.get('process', []):
+                    _, local_id, _, name = row
+                    shared = self.processes.get(name)
+                    if shared is None:
+                        shared = self.conn.execute('INSERT INTO process (name) VALUES (?)',
+                                                   (name,)).lastrowid
+                        self.processes[name] = shared
+                    self.map_local('process', host_id, local_id, shared)
+
+                for row in tables.get('window', []):
+                    _, local_id, _, title, process_id, browser_url = row
+                    key = (self.local.get(('process', host_id, process_id), 0),
+                           title or u'', browser_url or u'')
+                    shared = self.windows.get(key)
+                    if shared is None:
+                        shared = self.conn.execute('INSERT INTO window (process_id, title, browser_url) '
+                                                   'VALUES (?, ?, ?)', key).lastrowid
+                        self.windows[key] = shared
+                    self.map_local('window', host_id, local_id, shared)
+
+                for table, rows in tables.items():
+                    if rows:
+                        self.store_events(host_id, table, rows)
+
+                self.conn.executemany('INSERT OR REPLACE INTO watermark (host_id, table_name, last_id) '
+                                      'VALUES (?, ?, ?)',
+                                      [(host_id, t, i) for t, i in upload.get('marks', {}).items()])
+                self.conn.commit()
+                return dict(self.conn.execute('SELECT table_name, last_id FROM watermark '
+                                              'WHERE host_id = ?', (host_id,)))
+            except Exception:
+                self.conn.rollback()
+                self.load_ids()
+                raise
+
+    def map_local(self, dimension, host_id, local_id, shared):
+        if self.local.get((dimension, host_id, local_id)) != shared:
+            self.conn.execute('INSERT OR REPLACE INTO host_%s (host_id, local_id, %s_id) '
+                              'VALUES (?, ?, ?)' % (dimension, dimension),
+                              (host_id, local_id, shared))
+            self.local[(dimension, host_id, local_id)] = shared
+
+    def store_events(self, host_id, table, rows):
+        columns = dict(EVENTS).get(table)
+        if columns is None:
+            return
+        remap = [(i + 3, name[:-3]) for i, name in enumerate(columns)
+                 if name in ('process_id', 'window_id')]
+        values = []
+        for row in rows:
+            row = list(row)
+            for i, dimension in remap:
+                row[i] = self.local.get((dimension, host_id, row[i]))
+            values.append([host_id] + row)
+        self.conn.executemany('INSERT OR IGNORE INTO %s (host_id, seq, id, created_at, %s) VALUES (%s)'
+                              % (table, ', '.join(columns), ', '.join('?' * (len(columns) + 4))),
+                              values)
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ GET /watermarks?host=<name>  the host's watermarks, see read_feed
+        POST /upload                 a zlib compressed JSON upload """
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if url.path != '/watermarks':
+            return self.send_error(404)
+        host = urlparse.parse_qs(url.query).get('host', [''])[0]
+        self.reply(self.server.store.watermarks(host.decode('utf-8')))
+
+    def do_POST(self):
+        if self.path != '/upload':
+            return self.send_error(404)
+        try:
+            upload = unpack(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+        except (ValueError, zlib.error):
+            return self.send_error(400)
+        self.reply(self.server.store.apply(upload))
+
+    def reply(self, obj):
+        body = pack(obj)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Encoding', 'deflate')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AggregationServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, store):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.store = store
+
+
+class UnixAggregationServer(AggregationServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        SocketServer.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    def __init__(self, path, timeout):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def connection(url, timeout=30):
+    """ connection to an aggregator at http://host:port or unix:///path """
+    parts = urlparse.urlparse(url)
+    if parts.scheme == 'unix':
+        return UnixHTTPConnection(parts.path, timeout)
+    return httplib.HTTPConnection(parts.netloc, timeout=timeout)
+
+
+def request(url, method, path, body=None):
+    conn = connection(url)
+    try:
+        conn.request(method, path, body, {'Content-Type': 'application/json',
+                                          'Content-Encoding': 'deflate'})
+        response = conn.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise IOError("aggregator answered %d %s" % (response.status, response.reason))
+        return unpack(data)
+    finally:
+        conn.close()
+
+
+def select(paths, sql, params=()):
+    """ the rows sql reads from each of the database files paths """
+    rows = []
+    for path in paths:
+        conn = sqlite3.connect(path)
+        try:
+            rows.extend(list(r) for r in conn.execute(sql, params))
+        except sqlite3.OperationalError:
+            pass  # table not in this file, or from before a column was added
+        finally:
+            conn.close()
+    return rows
+
+
+def feed_start(db_path, sources, tables=DIMENSIONS + EVENTS):
+    """ the watermarks of a first upload: the change feed is followed from
+        its current end, and the rows recorded before, up to history_end,
+        are read by id. Rows inserted while the ids are looked up have a
+        change after the end and lower history_end to below their ids. """
+    conn = sqlite3.connect(db_path)
+    try:
+        seq = conn.execute('SELECT max(id) FROM change').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        seq = 0
+    marks = {'change': seq}
+    for table, _ in tables:
+        ids = [r[0] for r in select(sources.get(table, []), 'SELECT max(id) FROM "%s"' % table)]
+        marks['history_end:' + table] = max([i for i in ids if i is not None] or [0])
+    try:
+        for table, first in conn.execute('SELECT table_name, min(row_id) FROM change '
+                                         'WHERE id > ? GROUP BY table_name', (seq,)):
+            if 'history_end:' + table in marks:
+                marks['history_end:' + table] = min(marks['history_end:' + table], first - 1)
+    except sqlite3.OperationalError:
+        pass
+    finally:
+        conn.close()
+    return marks
+
+
+def read_feed(db_path, marks, limit=UPLOAD_ROWS, tables=DIMENSIONS + EVENTS):
+    """ ({table: rows}, watermarks) of the next upload of a recorder
+        database after marks, None if nothing was recorded since. Rows are
+        [seq, id, created_at, columns...].
+
+        The rows recorded before the first upload are read first, by id,
+        limit per event table and all processes and windows at once, with
+        minus their id as seq. The watermarks are then 'history:<table>',
+        the last id read of each table, up to 'history_end:<table>'. After
+        that the rows are those of up to limit changes after 'change'. A
+        row is only read for its change if its created_at is the one the
+        change was written with, and not that of a later row given the
+        same id. """
+    from selfspy.export import table_sources
+
+    sources = table_sources(db_path)
+    new_marks = dict(marks)
+    if 'change' not in new_marks:
+        new_marks.update(feed_start(db_path, sources, tables))
+
+    read = {}
+    for table, columns in tables:
+        start = new_marks.get('history:' + table, 0)
+        end = new_marks.get('history_end:' + table, 0)
+        if start >= end:
+            continue
+        dimension = table in dict(DIMENSIONS)
+        rows = select(sources.get(table, []),
+                      'SELECT id, created_at, %s FROM "%s" WHERE id > ? AND id <= ? ORDER BY id%s'
+                      % (', '.join(columns), table, '' if dimension else ' LIMIT %d' % limit),
+                      (start, end))
+        rows.sort()
+        if not dimension:
+            rows = rows[:limit]
+        if rows:
+            read[table] = [[-row[0]] + row for row in rows]
+        done = dimension or len(rows) < limit
+        new_marks['history:' + table] = end if done else rows[-1][0]
+    if read:
+        return read, new_marks
+
+    conn = sqlite3.connect(db_path)
+    try:
+        changes = conn.execute('SELECT id, table_name, row_id, created_at FROM change '
+                               'WHERE id > ? ORDER BY id LIMIT %d' % limit,
+                               (new_marks['change'],)).fetchall()
+    except sqlite3.OperationalError:
+        changes = []
+    finally:
+        conn.close()
+    if changes:
+        new_marks['change'] = changes[-1][0]
+
+    wanted = {}  # table -> {row id: (seq, created_at)}, the last change of an id wins
+    for seq, table, row_id, created_at in changes:
+        wanted.setdefault(table, {})[row_id] = (seq, created_at)
+    for table, columns in tables:
+        ids = sorted(wanted.get(table, ()))
+        rows = []
+        for i in xrange(0, len(ids), IN_CHUNK):
+            chunk = ids[i:i + IN_CHUNK]
+            for row in select(sources.get(table, []),
+                              'SELECT id, created_at, %s FROM "%s" WHERE id IN (%s)'
+                              % (', '.join(columns), table, ', '.join('?' * len(chunk))), chunk):
+                seq, created_at = wanted[table][row[0]]
+                if row[1] == created_at:
+                    rows.append([seq] + row)
+        if rows:
+            read[table] = sorted(rows)
+
+    if not read and new_marks == marks:
+        return None
+    return read, new_marks
+
+
+class Uploader:
+    """ Sends the rows recorded since the last upload to an aggregator. The
+        aggregator keeps the watermarks, so nothing is stored locally and
+        a machine can be reinstalled without uploading twice. """
+
+    def __init__(self, db_path, url, host=None, rows=UPLOAD_ROWS):
+        self.db_path = db_path
+        self.url = url
+        self.host = host or socket.gethostname()
+        self.rows = rows
+
+    def batch(self, marks):
+        """ the next upload, None if there is nothing new """
+        feed = read_feed(self.db_path, marks, self.rows)
+        if feed is None:
+            return None
+        tables, marks = feed
+        return {'host': self.host, 'tables': tables, 'marks': marks}
+
+    def upload(self):
+        """ uploads until the aggregator is up to date, returns the number
+            of rows sent """
+        sent = 0
+        marks = request(self.url, 'GET', '/watermarks?' + urllib.urlencode({'host': self.host}))
+        while True:
+            batch = self.batch(marks)
+            if batch is None:
+                return sent
+            marks = request(self.url, 'POST', '/upload', pack(batch))
+            sent += sum(len(rows) for rows in batch['tables'].values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collect the recordings of '
+        'several selfspy machines into one database.')
+    parser.add_argument('--db', required=True, help='Aggregated database file')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help='Listen on this Unix socket instead')
+    args = parser.parse_args()
+
+    store = FleetStore(args.db)
+    if args.socket:
+        server = UnixAggregationServer(args.socket, store)
+        print "Aggregating into %s, listening on %s" % (args.db, args.socket)
+    else:
+        server = AggregationServer((args.host, args.port), store)
+        print "Aggregating into %s, listening on %s:%d" % (args.db, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
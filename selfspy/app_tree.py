@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from selfspy.models import Process, Window, url_hostname
+
+APP_PAGE_SIZE = 100
+WINDOW_PAGE_SIZE = 200
+BACKFILL_BATCH = 1000
+
+# Browser tabs are grouped by hostname, other windows are listed one by one
+# under their title. A window without a URL has an empty hostname.
+WINDOW_ROWS = """
+SELECT CASE WHEN hostname = '' THEN coalesce(title, 'NO_TITLE') ELSE hostname END AS name,
+       group_concat(id)
+FROM window
+WHERE process_id = :process_id
+GROUP BY CASE WHEN hostname = '' THEN 'w' || id ELSE 'h' || hostname END
+ORDER BY name
+LIMIT :limit OFFSET :offset
+"""
+
+
+def backfill_hostnames(session, batch=BACKFILL_BATCH):
+    """ Fills in Window.hostname for rows written before the column existed """
+    while True:
+        rows = (session.query(Window.id, Window.browser_url)
+                .filter(Window.hostname == None).limit(batch).all())
+        if not rows:
+            break
+        for window_id, browser_url in rows:
+            (session.query(Window).filter(Window.id == window_id)
+             .update({'hostname': url_hostname(browser_url)}, synchronize_session=False))
+        session.commit()
+
+
+def app_page(session, offset=0, limit=APP_PAGE_SIZE):
+    """ (process_id, name) of a page of apps, ordered by name """
+    return (session.query(Process.id, Process.name)
+            .order_by(Process.name).offset(offset).limit(limit).all())
+
+
+def window_page(session, process_id, offset=0, limit=WINDOW_PAGE_SIZE):
+    """ (name, [window ids]) of a page of the window rows shown for an app """
+    rows = session.execute(WINDOW_ROWS, {'process_id': process_id,
+                                         'limit': limit, 'offset': offset})
+    return [(name, [int(i) for i in ids.split(',')]) for name, ids in rows]
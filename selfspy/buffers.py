@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from array import array
+
+KEY_CAPACITY = 1024  # presses, grows if a single window gets more
+MOUSE_CAPACITY = 4096  # points, about 7 minutes of moves at 10Hz
+MAX_KEY_NAMES = 4096  # distinct key names kept interned between flushes
+
+
+class KeyBuffer:
+    """ Columnar buffer of the key presses queued for the current window.
+        Key names are interned to small ints, times and repeat flags are kept
+        in preallocated arrays that are reused after every flush. """
+
+    def __init__(self, capacity=KEY_CAPACITY):
+        self.times = array('d', [0.0]) * capacity
+        self.ids = array('H', [0]) * capacity
+        self.repeats = array('b', [0]) * capacity
+        self.n = 0
+
+        self.names = []
+        self.name_ids = {}
+        self.special = []  # per key id, True for multi-character key names
+        self.has_special = False
+
+    def __len__(self):
+        return self.n
+
+    def append(self, key, time, is_repeat):
+        key_id = self.name_ids.get(key)
+        if key_id is None:
+            key_id = len(self.names)
+            self.name_ids[key] = key_id
+            self.names.append(key)
+            self.special.append(len(key) > 1)
+        if self.special[key_id]:
+            self.has_special = True
+
+        n = self.n
+        if n == len(self.times):
+            self.times.extend(self.times)
+            self.ids.extend(self.ids)
+            self.repeats.extend(self.repeats)
+        self.times[n] = time
+        self.ids[n] = key_id
+        self.repeats[n] = is_repeat
+        self.n = n + 1
+
+    def clear(self):
+        self.n = 0
+        self.has_special = False
+        if len(self.names) > MAX_KEY_NAMES:
+            self.names = []
+            self.name_ids = {}
+            self.special = []
+
+    def filtered(self):
+        """ Returns the timings and the number of non-repeat presses after
+            collapsing each run of the same special key into its last press """
+        n = self.n
+        if not self.has_special:
+            return self.times[:n].tolist(), n - sum(self.repeats[:n])
+
+        times = self.times
+        ids = self.ids
+        repeats = self.repeats
+        special = self.special
+
+        timings = []
+        nrkeys = 0
+        last = -1  # last press of the current run of special keys
+        for i in xrange(n):
+            key_id = ids[i]
+            if last >= 0 and key_id != ids[last]:
+                timings.append(times[last])
+                nrkeys += not repeats[last]
+                last = -1
+            if special[key_id]:
+                last = i
+            else:
+                timings.append(times[i])
+                nrkeys += not repeats[i]
+        if last >= 0:
+            timings.append(times[last])
+            nrkeys += not repeats[last]
+        return timings, nrkeys
+
+
+class MousePath:
+    """ Ring buffer of the mouse moves since the last click. Coordinates are
+        packed pairwise in one array; when full, the oldest points are
+        overwritten. """
+
+    def __init__(self, capacity=MOUSE_CAPACITY):
+        self.capacity = capacity
+        self.coords = array('d', [0.0]) * (2 * capacity)
+        self.times = array('d', [0.0]) * capacity
+        self.start = 0
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self, x, y, time):
+        i = (self.start + self.n) % self.capacity
+        self.coords[2 * i] = x
+        self.coords[2 * i + 1] = y
+        self.times[i] = time
+        if self.n == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.n += 1
+
+    def clear(self):
+        self.start = 0
+        self.n = 0
+
+    def _ordered(self, values, width):
+        end = self.start + self.n
+        if end <= self.capacity:
+            return values[width * self.start:width * end].tolist()
+        return (values[width * self.start:].tolist() +
+                values[:width * (end - self.capacity)].tolist())
+
+    def path(self):
+        """ the points as [x, y] pairs, oldest first """
+        flat = self._ordered(self.coords, 2)
+        return map(list, zip(flat[::2], flat[1::2]))
+
+    def timings(self):
+        return self._ordered(self.times, 1)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from selfspy.models import Change
+
+FEED_LIMIT = 1000  # changes returned per call by default
+
+
+def changes_since(session, seq=0, limit=FEED_LIMIT):
+    """ (seq, table name, row id, created_at) of up to limit rows inserted
+        after the change numbered seq, oldest first. Pass the last seq
+        returned to get the next ones. Rows may have been deleted since
+        they were inserted. """
+    return (session.query(Change.id, Change.table_name, Change.row_id, Change.created_at)
+            .filter(Change.id > seq).order_by(Change.id).limit(limit).all())
+
+
+def last_seq(session):
+    """ seq of the latest change, 0 if there is none, to start following
+        the feed from now on """
+    last = session.query(Change.id).order_by(Change.id.desc()).first()
+    return last[0] if last else 0
@@ -23,4 +23,43 @@ THUMBDRIVE_DIR = None
 CURRENT_DIR = None
 DBNAME = 'selfspy.sqlite'
 LOCK_FILE = 'selfspy.pid'
+KEYMAP_CACHE = 'keymap.cache'
 LOCK = None
+
+# days of data kept by the retention policies, None keeps everything
+RETENTION_RAW_DAYS = None  # clicks, locations, snapshots and typed text
+RETENTION_MEDIA_DAYS = None  # screenshots and audio recordings
+
+# free space on the data drive, in MB, below which less is recorded: smaller
+# and fewer screenshots, then no screenshots, mouse paths or key timings,
+# then only window changes and typing counts. See storage_budget.py.
+STORAGE_REDUCED_MB = 5000
+STORAGE_MINIMAL_MB = 2000
+STORAGE_ROLLUPS_MB = 500
+# space selfspy may use in MB, the tiers start at 80%, 95% and 100% of it.
+# None only looks at the free space.
+STORAGE_BUDGET_MB = None
+
+# seconds between the snapshots the recorder takes into the replica
+# directory for analysis, see replica.py. None only takes them on demand.
+REPLICA_INTERVAL = None
+
+# regular expressions, matched case-insensitively, of the window titles and
+# URLs nothing is recorded in, see privacy.py. For example [r'private browsing'].
+# Checking is quicker when they are all written in lowercase
+PRIVACY_TITLE_PATTERNS = []
+PRIVACY_URL_PATTERNS = []
+# meters around the places of the privacylocation table in which nothing is recorded
+PRIVACY_RADIUS = 200
+
+# write the raw event tables to one file per month, only applies to new databases
+PARTITION_BY_MONTH = False
+
+# aggregator to upload recordings to, http://host:port or unix:///path/to.sock,
+# see selfspy/aggregator.py. None keeps everything on this machine.
+AGGREGATOR_URL = None
+
+# where to ship spooled segments of new data and media: a directory, or a
+# receiver at http://host:port, see selfspy/spooler.py. None disables it.
+SPOOL_TARGET = None
+SPOOL_MAX_MB = 512  # spooled data kept while the target is unreachable
@@ -33,8 +33,6 @@ import config as cfg
 
 from datetime import datetime
 
-import mutagen.mp4
-
 # Experience Sampling window controller
 class DebriefController(NSWindowController):
 
@@ -78,6 +76,7 @@ class DebriefController(NSWindowController):
             s.executeAndReturnError_(None)
 
             # Stop playback once end of audio file is reached
+            import mutagen.mp4
             length = mutagen.mp4.MP4(self.audio_file).info.length
             s = objc.selector(self.stopAudioPlay,signature='v@:')
             self.playbackTimer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(length, self, s, None, False)
@@ -192,6 +191,11 @@ class DebriefController(NSWindowController):
         else:
             self.debriefController.close()
 
+    def startDebrief(self, self2=None):
+        """ called by the activity store once experiences are set """
+        self.currentExperience = 0
+        self.advanceExperienceWindow_(self, self)
+
     def windowDidLoad(self):
         NSWindowController.windowDidLoad(self)
 
@@ -216,10 +220,7 @@ class DebriefController(NSWindowController):
         self.debriefController.window().standardWindowButton_(NSWindowCloseButton).setKeyEquivalentModifierMask_(NSCommandKeyMask)
         self.debriefController.window().standardWindowButton_(NSWindowCloseButton).setKeyEquivalent_("w")
 
-        # get random set of experiences
+        # get random set of experiences, startDebrief is called once they are loaded
         NSNotificationCenter.defaultCenter().postNotificationName_object_('getDebriefExperiences',self)
 
-        self.currentExperience = 0
-        self.advanceExperienceWindow_(self, self)
-
     show = classmethod(show)
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import json
+import zlib
+import base64
+import sqlite3
+import argparse
+import datetime
+
+from selfspy import config as cfg
+from selfspy.partitions import RAW_TABLES, Partitions
+
+CHUNK_ROWS = 50000  # rows read from the database at a time
+WATERMARK_FILE = '_watermark.json'
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+# columns holding times as strings written by datetime.now()
+TIME_COLUMNS = {'created_at', 'started', 'time'}
+
+
+def parse_time(s):
+    if not s:
+        return None
+    s = str(s)
+    try:
+        if '.' in s:
+            return datetime.datetime.strptime(s, '%Y-%m-%d %H:%M:%S.%f')
+        return datetime.datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def load_json(blob):
+    if blob is None:
+        return None
+    try:
+        return json.loads(zlib.decompress(blob))
+    except (zlib.error, ValueError):
+        return None
+
+
+def decode_text(blob):
+    if blob is None:
+        return None
+    try:
+        return str(blob).decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def undecodable(decode):
+    """ a converter giving blobs decode can not read, such as those written
+        encrypted by earlier versions, in base64 """
+    def convert(blob):
+        if blob is None or decode(blob) is not None:
+            return None
+        return base64.b64encode(str(blob))
+    return convert
+
+
+def path_axis(i):
+    def axis(blob):
+        path = load_json(blob)
+        if path is None:
+            return None
+        return [float(p[i]) for p in path]
+    return axis
+
+
+# (table, column) -> [(exported column, converter, arrow type name)], for the
+# columns stored compressed or encoded. Keys text and keys that can not be
+# decoded, having been encrypted, go to a base64 column instead
+DECODED = {
+    ('keys', 'text'): [('text', decode_text, 'string'),
+                       ('text_encrypted', undecodable(decode_text), 'string')],
+    ('keys', 'keys'): [('keys', load_json, 'list<string>'),
+                       ('keys_encrypted', undecodable(load_json), 'string')],
+    ('keys', 'timings'): [('timings', load_json, 'list<double>')],
+    ('click', 'timings'): [('timings', load_json, 'list<double>')],
+    ('click', 'path'): [('path_x', path_axis(0), 'list<double>'),
+                        ('path_y', path_axis(1), 'list<double>')],
+}
+
+
+def sqlite_type(declared):
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return 'int64'
+    if 'BOOL' in declared:
+        return 'bool'
+    if 'FLOAT' in declared or 'REAL' in declared or 'DOUBLE' in declared:
+        return 'double'
+    if 'BLOB' in declared:
+        return 'binary'
+    return 'string'
+
+
+def arrow_type(pa, name):
+    if name.startswith('list<'):
+        return pa.list_(arrow_type(pa, name[5:-1]))
+    return {'int64': pa.int64(), 'bool': pa.bool_(), 'double': pa.float64(),
+            'binary': pa.binary(), 'string': pa.string(),
+            'timestamp': pa.timestamp('us')}[name]
+
+
+def table_sources(db_path):
+    """ {table: [database files holding its rows]}, the monthly partitions
+        of a partitioned database included """
+    sources = {}
+    conn = sqlite3.connect(db_path)
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                                "AND name NOT LIKE 'sqlite_%'"):
+        sources[name] = [db_path]
+    conn.close()
+
+    partitions = Partitions(db_path)
+    for month in partitions.months():
+        for table in RAW_TABLES:
+            sources.setdefault(table, []).append(partitions.path(month))
+    return sources
+
+
+class Exporter:
+    """ Streams the tables of a selfspy database to columnar files, one
+        directory per table and one per day below it:
+            out/<table>/date=<YYYY-MM-DD>/part-<first id>.parquet
+        Only rows with ids above the watermark of the previous export are
+        read, so running it again appends what was recorded since. """
+
+    def __init__(self, db_path, out_dir, fmt='parquet', chunk_rows=CHUNK_ROWS):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Exporting needs pyarrow, install it with pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+
+        self.db_path = db_path
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.chunk_rows = chunk_rows
+        self.watermark_path = os.path.join(out_dir, WATERMARK_FILE)
+        self.watermarks = {}
+        if os.path.exists(self.watermark_path):
+            with open(self.watermark_path) as f:
+                self.watermarks = json.load(f)
+
+    def save_watermarks(self):
+        tmp = self.watermark_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.watermarks, f, indent=1, sort_keys=True)
+        os.rename(tmp, self.watermark_path)
+
+    def export(self, tables=None):
+        """ exports tables, all of them if None, returns {table: rows written} """
+        written = {}
+        for table, files in sorted(table_sources(self.db_path).items()):
+            if tables and table not in tables:
+                continue
+            written[table] = 0
+            for path in files:
+                written[table] += self.export_table(table, path)
+        return written
+
+    def columns(self, conn, table):
+        """ [(source column, [(exported column, converter, type name)])] """
+        columns = []
+        for _, name, declared, _, _, _ in conn.execute('PRAGMA table_info("%s")' % table):
+            if (table, name) in DECODED:
+                columns.append((name, DECODED[(table, name)]))
+            elif name in TIME_COLUMNS:
+                columns.append((name, [(name, parse_time, 'timestamp')]))
+            else:
+                columns.append((name, [(name, None, sqlite_type(declared))]))
+        return columns
+
+    def export_table(self, table, path):
+        conn = sqlite3.connect(path)
+        conn.text_factory = str
+        try:
+            columns = self.columns(conn, table)
+            names = [name for name, _ in columns]
+            if 'id' not in names or 'created_at' not in names:
+                return 0
+            fields = [self.pa.field(out, arrow_type(self.pa, kind))
+                      for _, outs in columns for out, _, kind in outs]
+            schema = self.pa.schema(fields)
+            created_index = names.index('created_at')
+            id_index = names.index('id')
+
+            cursor = conn.execute('SELECT %s FROM "%s" WHERE id > ? ORDER BY id'
+                                  % (', '.join('"%s"' % n for n in names), table),
+                                  (self.watermarks.get(table, 0),))
+            total = 0
+            while True:
+                rows = cursor.fetchmany(self.chunk_rows)
+                if not rows:
+                    break
+                days = {}
+                for row in rows:
+                    day = str(row[created_index])[0:10] or 'unknown'
+                    days.setdefault(day, []).append(row)
+                for day, day_rows in sorted(days.items()):
+                    self.write(table, day, day_rows, columns, schema, day_rows[0][id_index])
+                total += len(rows)
+                # ids keep growing across partitions, so one watermark per table
+                self.watermarks[table] = max(self.watermarks.get(table, 0), rows[-1][id_index])
+                self.save_watermarks()
+            return total
+        finally:
+            conn.close()
+
+    def write(self, table, day, rows, columns, schema, first_id):
+        arrays = []
+        for i, (name, outs) in enumerate(columns):
+            values = [row[i] for row in rows]
+            for out, convert, kind in outs:
+                if convert is not None:
+                    column = [convert(v) for v in values]
+                elif kind == 'string':
+                    column = [v if v is None else str(v).decode('utf-8', 'replace') for v in values]
+                elif kind == 'bool':
+                    column = [v if v is None else bool(v) for v in values]
+                elif kind == 'binary':
+                    column = [v if v is None else str(v) for v in values]
+                else:
+                    column = values
+                arrays.append(self.pa.array(column, type=arrow_type(self.pa, kind)))
+        batch = self.pa.Table.from_arrays(arrays, schema=schema)
+
+        directory = os.path.join(self.out_dir, table, 'date=' + day)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, 'part-%d%s' % (first_id, FORMATS[self.fmt]))
+        if self.fmt == 'parquet':
+            self.pq.write_table(batch, path)
+        else:
+            writer = self.pa.RecordBatchFileWriter(path, schema)
+            writer.write_table(batch)
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the selfspy database to '
+        'Parquet or Arrow files partitioned by day, for analysis with pandas, '
+        'DuckDB or Spark. Run again to export what was recorded since.')
+    parser.add_argument('-d', '--data-dir', default=cfg.LOCAL_DIR,
+        help='Data directory for selfspy, where the database is stored. Default is %s' % cfg.LOCAL_DIR)
+    parser.add_argument('-o', '--out', required=True, help='Directory to export to')
+    parser.add_argument('-f', '--format', choices=sorted(FORMATS), default='parquet')
+    parser.add_argument('-t', '--table', action='append',
+        help='Table to export, can be given several times. Default is all tables')
+    parser.add_argument('-s', '--snapshot', action='store_true',
+        help='Export from a snapshot of the database, so the recorder is not held up')
+    args = parser.parse_args()
+
+    db_path = os.path.join(os.path.expanduser(args.data_dir), cfg.DBNAME)
+    if not os.path.exists(db_path):
+        print "No database at %s" % db_path
+        sys.exit(1)
+    if args.snapshot:
+        from selfspy.replica import Replica
+        db_path = Replica(db_path).refresh()
+
+    exporter = Exporter(db_path, os.path.expanduser(args.out), args.format)
+    for table, rows in sorted(exporter.export(args.table).items()):
+        print "%s: %d rows" % (table, rows)
+
+
+if __name__ == '__main__':
+    main()
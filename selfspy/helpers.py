@@ -15,6 +15,7 @@ from CBGraphView import CBGraphView
 TIMELINE_WIDTH = 960
 TIMELINE_HEIGHT = 20
 WINDOW_PADDING = 18
+THUMBNAIL_SIZE = 960  # longest side of the screenshots shown in the reviewer
 
 
 def unixTimeFromString(self, s=None):
@@ -29,16 +30,54 @@ def getScreenshotPath(self, self2=None):
 
 def generateScreenshotList(self, self2=None):
      path = getScreenshotPath(self)
-     list_of_files = [ f for f in listdir(path) if isfile(join(path,f)) ]
+     list_of_files = sorted(f for f in listdir(path) if isfile(join(path,f)))
      return list_of_files
 
+def loadScreenshotImage(path):
+    pool = NSAutoreleasePool.alloc().init()
+    image = NSImage.alloc().initWithContentsOfFile_(path)
+    del pool
+    return image
+
+def screenshotImageCost(image):
+    reps = image.representations()
+    if not reps:
+        return 0
+    return reps[0].pixelsWide() * reps[0].pixelsHigh() * 4
+
+def writeScreenshotThumbnail(src, dst):
+    """ writes a copy of src downscaled to fit the reviewer to dst """
+    import Quartz
+    import LaunchServices
+
+    pool = NSAutoreleasePool.alloc().init()
+    try:
+        source = Quartz.CGImageSourceCreateWithURL(NSURL.fileURLWithPath_(src), None)
+        if source is None:
+            return False
+        options = {
+            Quartz.kCGImageSourceCreateThumbnailFromImageAlways: True,
+            Quartz.kCGImageSourceCreateThumbnailWithTransform: True,
+            Quartz.kCGImageSourceThumbnailMaxPixelSize: THUMBNAIL_SIZE,
+        }
+        thumbnail = Quartz.CGImageSourceCreateThumbnailAtIndex(source, 0, options)
+        if thumbnail is None:
+            return False
+        dest = Quartz.CGImageDestinationCreateWithURL(
+            NSURL.fileURLWithPath_(dst), LaunchServices.kUTTypeJPEG, 1, None)
+        Quartz.CGImageDestinationAddImage(dest, thumbnail,
+            {Quartz.kCGImageDestinationLossyCompressionQuality: 0.6})
+        return bool(Quartz.CGImageDestinationFinalize(dest))
+    finally:
+        del pool
+
 def generateDateQuery(self, s=None):
     self.dateQuery = '20' + s[0:2] + '-' + s[2:4] + '-' + s[4:6] + ' ' + s[7:9] + ':' + s[9:11] + ':' + s[11:13] + '.'
 
 def mapFilenameDateToNumber(self, s=None):
     return int('20' + s[0:2] + s[2:4] + s[4:6] + s[7:9] + s[9:11] + s[11:13])
 
-def addProcessTimelineSegment(self, process_id, front_bound, back_bound, reviewer):
+def addProcessTimelineSegment(self, process_id, front_bound, back_bound, reviewer, name=None):
     if front_bound >= reviewer.slider_min and back_bound <= reviewer.slider_max:
 
         # generate unique grayscale color for timeline segment
@@ -63,11 +102,15 @@ def addProcessTimelineSegment(self, process_id, front_bound, back_bound, reviewe
         this_view.setBackgroundColor_(color)
         this_view.setWantsLayer_(YES)
 
-        # add tooltip to segment
-        self.processNameQuery = process_id
-        NSNotificationCenter.defaultCenter().postNotificationName_object_('getProcessNameFromID', self)
-        this_view.setToolTip_(str(self.processNameResponse[0]))
-        self.processNameResponse = []
+        # add tooltip to segment, names come with the segments from the
+        # activity store so only look them up one by one if missing
+        if name is None:
+            self.processNameQuery = process_id
+            NSNotificationCenter.defaultCenter().postNotificationName_object_('getProcessNameFromID', self)
+            if self.processNameResponse:
+                name = self.processNameResponse[0]
+            del self.processNameResponse[:]
+        this_view.setToolTip_(unicode(name))
         reviewer.nested_timeline_views.append(this_view)
 
 ## TIMELINE HELPERS
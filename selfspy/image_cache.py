@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+CACHE_BUDGET = 96 * 1024 * 1024  # bytes of decoded images kept in memory
+PREFETCH_FRAMES = 4  # screenshots loaded ahead of and behind the current one
+THUMBNAIL_DIR = 'thumbnails'
+
+
+def read_file(path):
+    """ default loader, keeps the encoded bytes """
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class ImageCache:
+    """ LRU cache of screenshots with a memory budget. Images are read
+        from a downscaled copy in the thumbnails subdirectory, which is
+        written the first time a screenshot is loaded if a thumbnailer is
+        given. A worker thread loads the frames around the one shown so
+        stepping through them does not wait on the disk. A screenshot is
+        only loaded by one thread at a time, others asking for it wait.
+
+        loader(path) returns an image or None, cost(image) its size in
+        bytes and thumbnailer(src, dst) writes a downscaled copy of src to
+        dst and returns True if it did. """
+
+    def __init__(self, directory, loader=read_file, cost=len, thumbnailer=None,
+                 budget=CACHE_BUDGET, prefetch_frames=PREFETCH_FRAMES):
+        self.directory = directory
+        self.thumbnail_directory = os.path.join(directory, THUMBNAIL_DIR)
+        self.loader = loader
+        self.cost = cost
+        self.thumbnailer = thumbnailer
+        self.budget = budget
+        self.prefetch_frames = prefetch_frames
+
+        self.images = OrderedDict()  # filename -> (image, cost), oldest first
+        self.used = 0
+        self.lock = threading.Lock()
+        self.loading = {}  # filename -> Event set once it is loaded
+
+        self.wanted = []  # filenames the worker should load, next one first
+        self.wakeup = threading.Condition(self.lock)
+        self.worker = None
+        self.closed = False
+
+    def thumbnail_path(self, filename):
+        return os.path.join(self.thumbnail_directory, filename)
+
+    def get(self, filename):
+        """ the image for a screenshot, loaded now if it is not cached """
+        with self.lock:
+            entry = self.images.pop(filename, None)
+            if entry:
+                self.images[filename] = entry
+                return entry[0]
+        return self.load(filename)
+
+    def load(self, filename):
+        while True:
+            with self.lock:
+                entry = self.images.get(filename)
+                if entry:
+                    return entry[0]
+                loading = self.loading.get(filename)
+                if loading is None:
+                    loading = self.loading[filename] = threading.Event()
+                    break
+            # loaded by another thread, unless it failed and we try again
+            loading.wait()
+            with self.lock:
+                entry = self.images.get(filename)
+            if entry:
+                return entry[0]
+            if self.closed:
+                return None
+
+        try:
+            image = None
+            thumbnail = self.thumbnail_path(filename)
+            if not os.path.exists(thumbnail) and self.thumbnailer:
+                self.write_thumbnail(filename, thumbnail)
+            if os.path.exists(thumbnail):
+                image = self.loader(thumbnail)
+            if image is None:
+                image = self.loader(os.path.join(self.directory, filename))
+            if image is not None:
+                self.store(filename, image)
+            return image
+        finally:
+            with self.lock:
+                del self.loading[filename]
+            loading.set()
+
+    def write_thumbnail(self, filename, thumbnail):
+        """ writes the thumbnail next to where it goes and renames it into
+            place, so it is only ever seen whole """
+        if not os.path.isdir(self.thumbnail_directory):
+            try:
+                os.makedirs(self.thumbnail_directory)
+            except OSError:
+                pass
+        tmp = thumbnail + '.tmp'
+        try:
+            written = self.thumbnailer(os.path.join(self.directory, filename), tmp)
+        except Exception:
+            written = False
+        try:
+            if written:
+                os.rename(tmp, thumbnail)
+            elif os.path.exists(tmp):
+                os.remove(tmp)
+        except OSError:
+            pass
+
+    def store(self, filename, image):
+        cost = self.cost(image)
+        with self.lock:
+            old = self.images.pop(filename, None)
+            if old:
+                self.used -= old[1]
+            self.images[filename] = (image, cost)
+            self.used += cost
+            while self.used > self.budget and len(self.images) > 1:
+                _, (_, evicted) = self.images.popitem(last=False)
+                self.used -= evicted
+
+    def prefetch(self, filenames, index, direction=1):
+        """ queue the frames around filenames[index] for loading, those in
+            the direction of travel first """
+        k = self.prefetch_frames
+        ahead = [index + direction * i for i in xrange(1, k + 1)]
+        behind = [index - direction * i for i in xrange(1, k // 2 + 1)]
+        wanted = [filenames[i] for i in ahead + behind if 0 <= i < len(filenames)]
+
+        with self.lock:
+            if self.closed:
+                return
+            self.wanted = [f for f in wanted if f not in self.images]
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run)
+                self.worker.daemon = True
+                self.worker.start()
+            self.wakeup.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.wanted and not self.closed:
+                    self.wakeup.wait()
+                if self.closed:
+                    return
+                filename = self.wanted.pop(0)
+                if filename in self.images:
+                    continue
+            try:
+                self.load(filename)
+            except Exception:
+                pass
+
+    def close(self):
+        """ stop prefetching and drop the cached images """
+        with self.lock:
+            self.closed = True
+            self.wanted = []
+            self.images.clear()
+            self.used = 0
+            self.wakeup.notify()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+
+BURST_GAP = 2.0  # seconds without a key press that end a typing burst
+CHARS_PER_WORD = 5
+
+# upper bounds in seconds of the inter-key interval histogram buckets, the
+# last bucket holds everything from the last bound up
+IKI_BOUNDS = (0.1, 0.2, 0.4, 0.8, 1.6)
+IKI_COLUMNS = ('iki_lt100', 'iki_lt200', 'iki_lt400', 'iki_lt800',
+               'iki_lt1600', 'iki_ge1600')
+
+BACKSPACE_KEYS = {"Backspace", "BackSpace"}  # Cocoa and X names
+
+
+class KeyStats:
+    """ Typing statistics for the key presses of one Keys row, updated as
+        presses come in so nothing has to be recomputed from the timings """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.presses = 0
+        self.nonrepeats = 0
+        self.backspaces = 0
+        self.bursts = 0
+        self.typing_time = 0.0
+        self.iki_hist = [0] * len(IKI_COLUMNS)
+
+    def add(self, key, interval, is_repeat):
+        """ key is the key name as given by the sniffer, interval the time in
+            seconds since the previous key press """
+        self.presses += 1
+        if not is_repeat:
+            self.nonrepeats += 1
+        if key in BACKSPACE_KEYS:
+            self.backspaces += 1
+
+        self.iki_hist[bisect.bisect_left(IKI_BOUNDS, interval)] += 1
+        if self.presses == 1 or interval > BURST_GAP:
+            self.bursts += 1
+        else:
+            self.typing_time += interval
+
+    def backspace_ratio(self):
+        if not self.presses:
+            return 0.0
+        return self.backspaces / float(self.presses)
+
+    def wpm(self):
+        if self.typing_time <= 0:
+            return 0.0
+        return (self.nonrepeats / float(CHARS_PER_WORD)) / (self.typing_time / 60.0)
+
+    def columns(self):
+        """ the statistics as Keys column values """
+        values = {'nrpresses': self.presses,
+                  'nrbackspaces': self.backspaces,
+                  'nrbursts': self.bursts,
+                  'typing_time': self.typing_time,
+                  'wpm': self.wpm()}
+        values.update(zip(IKI_COLUMNS, self.iki_hist))
+        return values
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+from sqlalchemy.exc import OperationalError
+
+from selfspy import config as cfg
+from selfspy.models import DatabaseStats
+
+INCREMENTAL = 2  # PRAGMA auto_vacuum value
+VACUUM_PAGES = 200  # free pages released per incremental vacuum step
+IDLE_BUDGET = 0.5  # seconds of maintenance work per idle check
+ANALYZE_INTERVAL = 24 * 3600  # seconds between ANALYZE runs
+STATS_INTERVAL = 3600  # seconds between two DatabaseStats rows
+
+
+def auto_vacuum(session):
+    return session.execute("PRAGMA auto_vacuum").scalar()
+
+
+def incremental_vacuum(session, pages=VACUUM_PAGES):
+    """ releases up to pages free pages to the file system, returns the
+        number of free pages left """
+    session.execute("PRAGMA incremental_vacuum(%d)" % pages)
+    session.commit()
+    return session.execute("PRAGMA freelist_count").scalar()
+
+
+def file_stats(session, path):
+    """ (file size, page count, free pages, share of the pages that are free) """
+    page_count = session.execute("PRAGMA page_count").scalar()
+    freelist_count = session.execute("PRAGMA freelist_count").scalar()
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    fragmentation = freelist_count / float(page_count) if page_count else 0.0
+    return size, page_count, freelist_count, fragmentation
+
+
+class Maintenance:
+    """ Keeps the database file compact and its query statistics fresh.
+        The work is split into short steps run while the user is idle:
+        releasing free pages with incremental_vacuum, a daily ANALYZE, and
+        a DatabaseStats row every hour to follow the file over time.
+
+        Databases created before incremental auto_vacuum was enabled are
+        left as they are, a full VACUUM blocking the recorder and needing
+        as much free space again as the file. convert() does it, with
+        selfspy stopped. """
+
+    def __init__(self, session, path, storage=None):
+        self.session = session
+        self.path = path
+        self.storage = storage
+        self.last_analyze = 0
+        self.last_stats = 0
+        self.incremental = auto_vacuum(session) == INCREMENTAL
+        if not self.incremental:
+            print ("The database does not release free pages, run python -m "
+                   "selfspy.maintenance --convert with selfspy stopped to compact it")
+
+    def idle_work(self, budget=IDLE_BUDGET):
+        """ runs maintenance steps until there is nothing left to do or
+            budget seconds were spent """
+        start = time.time()
+        while time.time() - start < budget:
+            try:
+                if not self.step():
+                    return
+            except OperationalError:
+                # the database is busy, try again at the next idle period
+                self.session.rollback()
+                return
+
+    def step(self):
+        """ does the most urgent piece of maintenance, False if there was
+            nothing to do """
+        now = time.time()
+        if now - self.last_stats > STATS_INTERVAL:
+            self.record_stats()
+            self.last_stats = now
+        elif self.incremental and self.session.execute("PRAGMA freelist_count").scalar() > 0:
+            incremental_vacuum(self.session)
+        elif now - self.last_analyze > ANALYZE_INTERVAL:
+            self.analyze()
+            self.last_analyze = now
+        else:
+            return False
+        return True
+
+    def analyze(self):
+        # PRAGMA optimize only analyzes the tables whose statistics are
+        # out of date, older SQLite versions silently ignore it
+        if sqlite3.sqlite_version_info >= (3, 18, 0):
+            self.session.execute("PRAGMA optimize")
+        else:
+            self.session.execute("ANALYZE")
+        self.session.commit()
+
+    def record_stats(self):
+        size, page_count, freelist_count, fragmentation = file_stats(self.session, self.path)
+        stats = DatabaseStats(size, page_count, freelist_count, fragmentation)
+        if self.storage is not None:
+            metrics = self.storage.metrics()
+            stats.free_bytes = metrics['free_bytes']
+            stats.usage_bytes = metrics['usage_bytes']
+            stats.tier = unicode(metrics['tier'])
+        self.session.add(stats)
+        self.session.commit()
+
+    def history(self, limit=None):
+        """ the recorded DatabaseStats, oldest first """
+        q = self.session.query(DatabaseStats).order_by(DatabaseStats.id)
+        if limit:
+            q = q.limit(limit)
+        return q.all()
+
+
+def convert(path):
+    """ turns on incremental auto_vacuum for the database at path. The
+        VACUUM doing it rewrites the whole file, through a copy and a
+        journal, so it is only started with twice its size free. Returns
+        if the database was converted. """
+    from selfspy.storage_budget import free_bytes
+
+    size = os.path.getsize(path)
+    free = free_bytes(os.path.dirname(os.path.abspath(path)))
+    if free < 2 * size:
+        print "Converting needs %d MB free, only %d MB are" % (2 * size >> 20, free >> 20)
+        return False
+    conn = sqlite3.connect(path)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL:
+            return True
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintenance of the selfspy database')
+    parser.add_argument('-d', '--data-dir', default=cfg.LOCAL_DIR,
+        help='Data directory for selfspy, where the database is stored. Default is %s' % cfg.LOCAL_DIR)
+    parser.add_argument('--convert', action='store_true',
+        help='Rewrite a database created by an older version so it releases '
+        'free pages. Selfspy has to be stopped.')
+    args = parser.parse_args()
+
+    from lockfile import LockFile
+
+    data_dir = os.path.expanduser(args.data_dir)
+    db_path = os.path.join(data_dir, cfg.DBNAME)
+    if not os.path.exists(db_path):
+        print "No database at %s" % db_path
+        sys.exit(1)
+    if args.convert:
+        if LockFile(os.path.join(data_dir, cfg.LOCK_FILE)).is_locked():
+            print "Selfspy is running, stop it before converting the database"
+            sys.exit(1)
+        if not convert(db_path):
+            sys.exit(1)
+        print "Converted %s" % db_path
+
+
+if __name__ == '__main__':
+    main()
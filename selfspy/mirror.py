@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import sqlite3
+
+VOLUMES_DIR = '/Volumes'
+MARKER = 'selfspy.cfg'  # file at the root of a volume selfspy mirrors to
+MIRROR_ID = 'selfspy-mirror.json'  # identifies the mirror on the volume
+
+BLOCK_SIZE = 64 * 1024  # bytes compared and copied at a time
+CHUNK_BLOCKS = 64  # blocks read per read lock, writers wait for at most that
+PASSES = 3  # reads a chunk at a time before one holds the locks throughout
+MIRROR_RATE = 8 * 1024 * 1024  # bytes written to the volume per second
+MEDIA_BATCH = 1000  # media index rows read at a time
+
+
+class VolumeWatcher:
+    """ Finds the mounted volume holding a selfspy.cfg file. Mounting or
+        unmounting changes the modification time of /Volumes, so the
+        volumes are only listed again when it changed, and each of them is
+        only looked into once while it stays mounted. """
+
+    def __init__(self, root=VOLUMES_DIR, marker=MARKER):
+        self.root = root
+        self.marker = marker
+        self.mtime = None
+        self.checked = {}  # volume path -> it has the marker
+        self.current = None
+
+    def volume(self):
+        """ the mirror volume, None if none is mounted """
+        try:
+            mtime = os.stat(self.root).st_mtime
+        except OSError:
+            return None
+        if mtime != self.mtime:
+            self.mtime = mtime
+            self.scan()
+        elif self.current is not None and not os.path.ismount(self.current):
+            self.scan()
+        return self.current
+
+    def scan(self):
+        mounted = [os.path.join(self.root, name) for name in os.listdir(self.root)]
+        mounted = [path for path in mounted if os.path.ismount(path)]
+        self.checked = dict((path, has_marker) for path, has_marker in self.checked.items()
+                            if path in mounted)
+        for path in mounted:
+            if path not in self.checked:
+                self.checked[path] = os.path.exists(os.path.join(path, self.marker))
+        found = sorted(path for path, has_marker in self.checked.items() if has_marker)
+        current = found[0] if found else None
+        if current != self.current:
+            print "Mirror drive %s" % ("found: " + current if current else "removed")
+        self.current = current
+
+
+def database_files(data_dir, db_name):
+    """ names of the database file and its monthly partitions, if any """
+    base, ext = os.path.splitext(db_name)
+    pattern = re.compile(re.escape(base) + r'-\d{4}-\d{2}' + re.escape(ext) + '$')
+    return [db_name] + sorted(n for n in os.listdir(data_dir) if pattern.match(n))
+
+
+def lock(conn):
+    """ starts a read transaction on conn, its shared lock keeps writers
+        from committing until conn.rollback() """
+    conn.execute('BEGIN')
+    conn.execute('SELECT count(*) FROM sqlite_master').fetchone()
+
+
+def change_counter(f):
+    """ the file change counter of a database header, bumped by every commit """
+    f.seek(24)
+    return f.read(4)
+
+
+def read_consistent(paths, blocks, write, passes=PASSES):
+    """ Reads the database files paths as they were at one point in time,
+        calling write(path, offset, data) for the blocks whose checksums
+        differ from blocks[path]. Returns {path: (checksums, size)}.
+
+        The files are read CHUNK_BLOCKS blocks at a time, each under a read
+        lock of its own, so writers are never held up for long. A commit in
+        between bumps a change counter, and the files are read again,
+        writing the blocks that changed since, until a pass saw no commit.
+        After passes of them, the last one holds the locks throughout. """
+    conns = dict((path, sqlite3.connect(path)) for path in paths)
+    files = dict((path, open(path, 'rb', 0)) for path in paths)
+    known = dict((path, list(blocks.get(path, []))) for path in paths)
+
+    def counters(hold):
+        found = {}
+        for path in paths:
+            if not hold:
+                lock(conns[path])
+            try:
+                found[path] = change_counter(files[path])
+            finally:
+                if not hold:
+                    conns[path].rollback()
+        return found
+
+    try:
+        for attempt in xrange(passes + 1):
+            hold = attempt == passes
+            if hold:
+                for path in paths:
+                    lock(conns[path])
+            start = counters(hold)
+            read = {}
+            for path in paths:
+                f = files[path]
+                sums = []
+                size = 0
+                while True:
+                    if not hold:
+                        lock(conns[path])
+                    try:
+                        f.seek(len(sums) * BLOCK_SIZE)
+                        chunk = [f.read(BLOCK_SIZE) for _ in xrange(CHUNK_BLOCKS)]
+                    finally:
+                        if not hold:
+                            conns[path].rollback()
+                    chunk = [data for data in chunk if data]
+                    for data in chunk:
+                        crc = zlib.adler32(data) & 0xffffffff
+                        i = len(sums)
+                        if i >= len(known[path]) or known[path][i] != crc:
+                            write(path, size, data)
+                        sums.append(crc)
+                        size += len(data)
+                    if len(chunk) < CHUNK_BLOCKS:
+                        break
+                read[path] = (sums, size)
+                known[path] = sums
+            if hold or counters(hold) == start:
+                return read
+    finally:
+        for conn in conns.values():
+            conn.rollback()
+            conn.close()
+        for f in files.values():
+            f.close()
+
+
+class Throttle:
+    """ sleeps as needed to keep writes under rate bytes per second """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.start = time.time()
+        self.written = 0
+
+    def wrote(self, n):
+        self.written += n
+        ahead = self.written / float(self.rate) - (time.time() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+class Mirror:
+    """ Copies the database, its partitions and the media of the data
+        directory to a volume, rsync-like: media files are copied when their
+        size or modification time differ from the copy, and database files
+        block by block, only writing the blocks whose checksum changed
+        since the last run.
+
+        The changed blocks are read with read_consistent, so the copy is of
+        a committed state while the recorder keeps committing, staged on
+        the local disk and written to the volume afterwards at MIRROR_RATE.
+        state_dir keeps the checksums of what is on each volume. """
+
+    def __init__(self, data_dir, db_name, state_dir, rate=MIRROR_RATE):
+        self.data_dir = data_dir
+        self.db_name = db_name
+        self.state_dir = state_dir
+        self.rate = rate
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+
+    def mirror_id(self, volume):
+        """ the id of the mirror on volume, created if it has none """
+        path = os.path.join(volume, MIRROR_ID)
+        try:
+            with open(path) as f:
+                return json.load(f)['id']
+        except (IOError, ValueError, KeyError):
+            mirror_id = uuid.uuid4().hex
+            with open(path, 'w') as f:
+                json.dump({'id': mirror_id}, f)
+            return mirror_id
+
+    def load_state(self, mirror_id):
+        try:
+            with open(os.path.join(self.state_dir, mirror_id + '.json')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {'databases': {}, 'media': 0}
+
+    def save_state(self, mirror_id, state):
+        path = os.path.join(self.state_dir, mirror_id + '.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.rename(path + '.tmp', path)
+
+    def run(self, volume):
+        """ brings the mirror on volume up to date, returns the number of
+            bytes written to it """
+        mirror_id = self.mirror_id(volume)
+        state = self.load_state(mirror_id)
+        throttle = Throttle(self.rate)
+        try:
+            for name in database_files(self.data_dir, self.db_name):
+                self.mirror_db(volume, name, state, throttle)
+            self.mirror_media(volume, state, throttle)
+        finally:
+            self.save_state(mirror_id, state)
+        return throttle.written
+
+    # database
+
+    def stage(self, name, known, delta_file):
+        """ copies the blocks differing from the mirror to delta_file.
+            Returns [(offset, length)] of them, in the order they are to be
+            written, and the new size, modification time and checksums of
+            the file, or None if it did not change. """
+        path = os.path.join(self.data_dir, name)
+        st = os.stat(path)
+        if st.st_size == known['size'] and st.st_mtime == known['mtime']:
+            return None
+        changed = []
+
+        def write(_, offset, data):
+            changed.append((offset, len(data)))
+            delta_file.write(data)
+
+        sums, size = read_consistent([path], {path: known['blocks']}, write)[path]
+        return changed, size, st.st_mtime, sums
+
+    def mirror_db(self, volume, name, state, throttle):
+        empty = {'size': 0, 'mtime': 0, 'blocks': []}
+        target = os.path.join(volume, name)
+        known = state['databases'].get(name, empty)
+        if not os.path.exists(target):
+            known = empty
+
+        # the changed blocks are staged on the local disk, so the database
+        # is never locked while writing to the volume
+        delta_path = os.path.join(self.state_dir, 'delta.tmp')
+        with open(delta_path, 'w+b') as delta_file:
+            delta = self.stage(name, known, delta_file)
+            if delta is None:
+                return
+            changed, size, mtime, sums = delta
+
+            # the mirror is only a consistent database once all blocks are
+            # written, forget the checksums until then in case we are cut short
+            state['databases'][name] = empty
+            delta_file.seek(0)
+            with open(target, 'r+b' if os.path.exists(target) else 'wb') as f:
+                for offset, length in changed:
+                    f.seek(offset)
+                    f.write(delta_file.read(length))
+                    throttle.wrote(length)
+                f.truncate(size)
+                f.flush()
+                os.fsync(f.fileno())
+        os.remove(delta_path)
+        state['databases'][name] = {'size': size, 'mtime': mtime, 'blocks': sums}
+
+    # media
+
+    def mirror_media(self, volume, state, throttle):
+        """ copies the screenshots and recordings indexed since the last run,
+            and any whose copy differs in size or modification time """
+        conn = sqlite3.connect(os.path.join(self.data_dir, self.db_name))
+        try:
+            while True:
+                try:
+                    rows = conn.execute('SELECT id, kind, filename FROM mediafile WHERE id > ? '
+                                        'ORDER BY id LIMIT %d' % MEDIA_BATCH,
+                                        (state['media'],)).fetchall()
+                except sqlite3.OperationalError:
+                    return
+                for media_id, kind, filename in rows:
+                    self.copy_file(os.path.join(self.data_dir, kind, filename),
+                                   os.path.join(volume, kind, filename), throttle)
+                    state['media'] = media_id
+                if len(rows) < MEDIA_BATCH:
+                    return
+        finally:
+            conn.close()
+
+    def copy_file(self, source, target, throttle):
+        try:
+            st = os.stat(source)
+        except OSError:
+            return  # removed by a retention policy since
+        try:
+            copy = os.stat(target)
+            if copy.st_size == st.st_size and int(copy.st_mtime) == int(st.st_mtime):
+                return
+        except OSError:
+            pass
+        directory = os.path.dirname(target)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(source, 'rb') as src:
+            with open(target + '.part', 'wb') as dst:
+                for data in iter(lambda: src.read(BLOCK_SIZE), ''):
+                    dst.write(data)
+                    throttle.wrote(len(data))
+        os.utime(target + '.part', (st.st_atime, st.st_mtime))
+        os.rename(target + '.part', target)
@@ -22,21 +22,64 @@ import zlib
 import json
 
 import datetime
+from urlparse import urlparse
 
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
-from sqlalchemy import Index, Column, Boolean, Integer, Unicode, Binary, ForeignKey, create_engine
+from sqlalchemy import Index, Column, Boolean, Integer, Float, Unicode, Binary, ForeignKey, create_engine
 from sqlalchemy.orm import sessionmaker, relationship, backref
 
 ENCRYPTER = None
 Base = declarative_base()
 
+# tables whose inserts are written to the Change feed
+FEED_TABLES = ('process', 'window', 'processevent', 'windowevent', 'click', 'keys',
+               'snapshot', 'location', 'recordingevent', 'bookmark', 'experience',
+               'debrief', 'mediafile')
+
 
 def initialize(fname):
     engine = create_engine('sqlite:///%s' % fname)
-    Base.metadata.create_all(engine)
+    conn = engine.connect()
+    if not engine.dialect.get_table_names(conn):
+        # only takes effect before the first table is created, existing
+        # databases are only converted on request, by maintenance.convert
+        # or python -m selfspy.maintenance --convert
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    Base.metadata.create_all(conn)
+    conn.close()
+    migrate(engine)
+    create_feed_triggers(engine, FEED_TABLES)
     return sessionmaker(bind=engine)
 
 
+def create_feed_triggers(conn, tables, temp=False):
+    """ Makes SQLite add a Change row for every row inserted in tables.
+        Triggers can only write to their own database file, temporary
+        ones, which last as long as the connection, can write to any. """
+    for table in tables:
+        conn.execute("CREATE %sTRIGGER IF NOT EXISTS change_%s AFTER INSERT ON %s "
+                     "BEGIN INSERT INTO change (table_name, row_id, created_at) "
+                     "VALUES ('%s', NEW.id, NEW.created_at); END"
+                     % ('TEMP ' if temp else '', table, table, table))
+
+
+def migrate(engine, tables=None):
+    """ Adds the columns and indexes that were introduced after a database
+        was created. create_all only creates missing tables, and SQLite can
+        ADD COLUMN, which is all our schema changes need. """
+    for table in tables or Base.metadata.sorted_tables:
+        existing = set(row[1] for row in engine.execute('PRAGMA table_info("%s")' % table.name))
+        for column in table.columns:
+            if column.name not in existing:
+                coltype = column.type.compile(dialect=engine.dialect)
+                engine.execute('ALTER TABLE "%s" ADD COLUMN "%s" %s' % (table.name, column.name, coltype))
+
+        indexes = set(row[1] for row in engine.execute('PRAGMA index_list("%s")' % table.name))
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(engine)
+
+
 class SpookMixin(object):
 
     @declared_attr
@@ -47,6 +90,17 @@ class SpookMixin(object):
     created_at = Column(Unicode, default=datetime.datetime.now, index=True)
 
 
+class Change(SpookMixin, Base):
+    # Append-only feed of inserted rows, written by triggers. The id is the
+    # sequence number consumers follow and is never handed out twice.
+    __table_args__ = {'sqlite_autoincrement': True}
+    table_name = Column(Unicode, nullable=False)
+    row_id = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return "<Change %d: %s %d>" % (self.id, self.table_name, self.row_id)
+
+
 class RecordingEvent(SpookMixin, Base):
     event_type = Column(Unicode, index=True)
     time = Column(Unicode, index=True)
@@ -77,6 +131,49 @@ class Snapshot(SpookMixin, Base):
         return "<Snapshot '%s'>" % (self.state)
 
 
+class MediaFile(SpookMixin, Base):
+    # Screenshots and audio recordings, so the retention engine can find
+    # them by time without listing their directories. kind is the
+    # directory under the data directory the file is in.
+    kind = Column(Unicode, nullable=False, index=True)
+    filename = Column(Unicode, nullable=False)
+
+    def __init__(self, kind, filename, created_at=None):
+        self.kind = kind
+        self.filename = filename
+        if created_at is not None:
+            self.created_at = created_at
+
+    def __repr__(self):
+        return "<MediaFile '%s/%s'>" % (self.kind, self.filename)
+
+
+class DatabaseStats(SpookMixin, Base):
+    # size of the database file over time, written by maintenance.Maintenance
+    file_size = Column(Integer, nullable=False)
+    page_count = Column(Integer, nullable=False)
+    freelist_count = Column(Integer, nullable=False)
+    fragmentation = Column(Float, nullable=False)
+    # space left on the drive, used by selfspy and the recording tier,
+    # see storage_budget.StorageBudget
+    free_bytes = Column(Integer)
+    usage_bytes = Column(Integer)
+    tier = Column(Unicode)
+
+    def __init__(self, file_size, page_count, freelist_count, fragmentation,
+                 free_bytes=None, usage_bytes=None, tier=None):
+        self.file_size = file_size
+        self.page_count = page_count
+        self.freelist_count = freelist_count
+        self.fragmentation = fragmentation
+        self.free_bytes = free_bytes
+        self.usage_bytes = usage_bytes
+        self.tier = tier
+
+    def __repr__(self):
+        return "<DatabaseStats %d bytes, %d free pages>" % (self.file_size, self.freelist_count)
+
+
 class Process(SpookMixin, Base):
     name = Column(Unicode, index=True, unique=True)
     authorized_recording = Column(Boolean, nullable=False)
@@ -105,9 +202,37 @@ class ProcessEvent(SpookMixin, Base):
     def __repr__(self):
         return "<Process '%s' '%s'>" % (self.process_id, self.event_type)
 
+class ProcessInterval(SpookMixin, Base):
+    # Active periods of a process, materialized from ProcessEvent by
+    # timeline.Timeline. Times are in seconds, end_time is None while the
+    # process is still the active one.
+    process_id = Column(Integer, ForeignKey('process.id'), nullable=False, index=True)
+    process = relationship("Process", backref=backref('intervals'))
+    start_time = Column(Float, nullable=False, index=True)
+    end_time = Column(Float, index=True)
+    start_event_id = Column(Integer, nullable=False)
+    end_event_id = Column(Integer)
+
+    def __init__(self, process_id, start_time, start_event_id):
+        self.process_id = process_id
+        self.start_time = start_time
+        self.start_event_id = start_event_id
+
+    def __repr__(self):
+        return "<ProcessInterval '%s' %s - %s>" % (self.process_id, self.start_time, self.end_time)
+
+
+def url_hostname(url):
+    """ hostname browser tabs are grouped by, '' for windows without a URL """
+    if not url or url == 'NO_URL':
+        return u''
+    return urlparse(url).hostname or u''
+
+
 class Window(SpookMixin, Base):
     title = Column(Unicode, index=True)
     browser_url = Column(Unicode, index=True)
+    hostname = Column(Unicode, index=True)
     process_id = Column(Integer, ForeignKey('process.id'), nullable=False, index=True)
     process = relationship("Process", backref=backref('windows'))
 
@@ -115,6 +240,7 @@ class Window(SpookMixin, Base):
         self.title = title
         self.process_id = process_id
         self.browser_url = browser_url
+        self.hostname = url_hostname(browser_url)
 
     def __repr__(self):
         return "<Window '%s'>" % (self.title)
@@ -333,7 +459,21 @@ class Keys(SpookMixin, Base):
     keys = Column(Binary)
     timings = Column(Binary)
 
-    def __init__(self, text, keys, timings, nrkeys, started, process_id, window_id, geometry_id):
+    # typing statistics from keystats.KeyStats, so analysis does not have to
+    # decompress and parse timings
+    nrpresses = Column(Integer)
+    nrbackspaces = Column(Integer)
+    nrbursts = Column(Integer)
+    typing_time = Column(Float)
+    wpm = Column(Float)
+    iki_lt100 = Column(Integer)
+    iki_lt200 = Column(Integer)
+    iki_lt400 = Column(Integer)
+    iki_lt800 = Column(Integer)
+    iki_lt1600 = Column(Integer)
+    iki_ge1600 = Column(Integer)
+
+    def __init__(self, text, keys, timings, nrkeys, started, process_id, window_id, geometry_id, stats=None):
         ztimings = zlib.compress(json.dumps(timings))
 
         self.encrypt_text(text)
@@ -347,6 +487,10 @@ class Keys(SpookMixin, Base):
         self.window_id = window_id
         self.geometry_id = geometry_id
 
+        if stats is not None:
+            for name, value in stats.columns().iteritems():
+                setattr(self, name, value)
+
     def encrypt_text(self, text, other_encrypter=None):
         ztext = maybe_encrypt(text, other_encrypter=other_encrypter)
         self.text = ztext
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from selfspy.models import Process, Window
+
+
+class NameCache:
+    """ Process and window names by id, loaded once and then extended with
+        the rows added since the highest id seen. Process and Window rows
+        are never updated, only deleted when clearing data, after which
+        invalidate() must be called as SQLite may hand out their ids again.
+
+        Names without a Process row, background processes that never get
+        one, are remembered as missing until a new row shows up, so they
+        are not looked for again on every snapshot. """
+
+    def __init__(self, session):
+        self.session = session
+        self.invalidate()
+
+    def invalidate(self):
+        self.processes = {}
+        self.process_ids = {}
+        self.missing = set()  # names without a row, up to process_watermark
+        self.windows = {}
+        self.process_watermark = 0
+        self.window_watermark = 0
+
+    def refresh(self):
+        self.refresh_processes()
+        self.refresh_windows()
+
+    def refresh_processes(self):
+        q = (self.session.query(Process.id, Process.name)
+             .filter(Process.id > self.process_watermark))
+        for process_id, name in q:
+            self.add_process(process_id, name)
+
+    def add_process(self, process_id, name):
+        """ notes a Process row, called by the recorder when it adds one """
+        self.processes[process_id] = name
+        self.process_ids[name] = process_id
+        if process_id > self.process_watermark:
+            self.process_watermark = process_id
+            self.missing.clear()
+
+    def refresh_windows(self):
+        q = (self.session.query(Window.id, Window.title, Window.process_id, Window.browser_url)
+             .filter(Window.id > self.window_watermark))
+        for window_id, title, process_id, browser_url in q:
+            self.windows[window_id] = (title, process_id, browser_url)
+            self.window_watermark = max(self.window_watermark, window_id)
+
+    def process_names(self, ids):
+        """ {id: name} for all of ids, None for ids that do not exist """
+        if any(i not in self.processes for i in ids):
+            self.refresh_processes()
+        return dict((i, self.processes.get(i)) for i in ids)
+
+    def process_name(self, process_id):
+        return self.process_names([process_id])[process_id]
+
+    def process_id(self, name):
+        if name not in self.process_ids and name not in self.missing:
+            self.refresh_processes()
+            if name not in self.process_ids:
+                self.missing.add(name)
+        return self.process_ids.get(name)
+
+    def window_infos(self, ids):
+        """ {id: (title, process_id, browser_url)} for all of ids, None for
+            ids that do not exist """
+        if any(i not in self.windows for i in ids):
+            self.refresh_windows()
+        return dict((i, self.windows.get(i)) for i in ids)
+
+    def window_info(self, window_id):
+        return self.window_infos([window_id])[window_id]
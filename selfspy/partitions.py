@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import datetime
+import threading
+
+from sqlalchemy import create_engine, event, MetaData, Table, Column
+from sqlalchemy.orm import sessionmaker
+
+from selfspy import models
+
+# tables written to the monthly partition files, everything else stays in
+# the main database file
+RAW_TABLES = ('keys', 'click', 'windowevent', 'processevent', 'snapshot', 'location')
+HOT = 'hot'  # name the current month's partition is attached under
+
+
+def month_of(t):
+    """ 'YYYY-MM' of a datetime or a created_at string """
+    return unicode(t)[0:7]
+
+
+def current_month():
+    return month_of(datetime.datetime.now())
+
+
+def initialize(fname):
+    """ Like models.initialize, but with the raw event tables in monthly
+        partition files next to fname. The current month is attached to
+        every connection, and as the main file has no table of that name,
+        the models read and write it without being aware of it.
+
+        Databases that already have raw tables in the main file keep them
+        there. Returns the sessionmaker and the Partitions, None for those. """
+    engine = create_engine('sqlite:///%s' % fname)
+    conn = engine.connect()
+    existing = engine.dialect.get_table_names(conn)
+    if any(name in existing for name in RAW_TABLES):
+        conn.close()
+        print "Database has unpartitioned event tables, not partitioning it"
+        return models.initialize(fname), None
+
+    if not existing:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    shared = [t for t in models.Base.metadata.sorted_tables if t.name not in RAW_TABLES]
+    models.Base.metadata.create_all(conn, tables=shared)
+    conn.close()
+    models.migrate(engine, shared)
+    models.create_feed_triggers(engine, [t for t in models.FEED_TABLES if t not in RAW_TABLES])
+
+    partitions = Partitions(fname)
+    event.listen(engine, 'connect', partitions.attach_hot)
+    return sessionmaker(bind=engine), partitions
+
+
+class Partitions:
+    """ The monthly files holding the raw event tables of a database. Row
+        ids continue from one month to the next, so code following a table
+        by id does not see them start over. """
+
+    def __init__(self, db_path):
+        base, ext = os.path.splitext(db_path)
+        self.prefix = base + '-'
+        self.ext = ext
+        self.pattern = re.compile(re.escape(os.path.basename(base)) + r'-(\d{4}-\d{2})' + re.escape(ext) + '$')
+
+        # copies of the raw tables without foreign keys, as the tables they
+        # point to are in another file
+        self.metadata = MetaData()
+        for table in models.Base.metadata.sorted_tables:
+            if table.name in RAW_TABLES:
+                columns = [Column(c.name, c.type, primary_key=c.primary_key,
+                                  nullable=c.nullable, index=c.index)
+                           for c in table.columns]
+                Table(table.name, self.metadata, *columns, sqlite_autoincrement=True)
+
+        self.engines = {}
+        self.max_ids = {}  # (month, table) -> highest id, for past months only
+        # query service workers attach the current month too, creating its
+        # file and engine only once. Reentrant, as creating a month looks
+        # at the previous ones.
+        self.lock = threading.RLock()
+
+    def path(self, month):
+        return self.prefix + month + self.ext
+
+    def months(self, since=None, until=None):
+        """ months that have a partition file, oldest first, limited to
+            those overlapping [since, until] if given """
+        directory = os.path.dirname(self.prefix) or '.'
+        months = []
+        for filename in os.listdir(directory):
+            match = self.pattern.match(filename)
+            if match:
+                months.append(match.group(1))
+        months.sort()
+        if since is not None:
+            months = [m for m in months if m >= month_of(since)]
+        if until is not None:
+            months = [m for m in months if m <= month_of(until)]
+        return months
+
+    def engine(self, month):
+        """ engine on the partition file of month, created if needed """
+        engine = self.engines.get(month)
+        if engine is not None:
+            return engine
+        with self.lock:
+            engine = self.engines.get(month)
+            if engine is None:
+                exists = os.path.exists(self.path(month))
+                engine = create_engine('sqlite:///%s' % self.path(month))
+                if not exists:
+                    self.create(engine, [m for m in self.months() if m < month])
+                else:
+                    models.migrate(engine, self.metadata.sorted_tables)
+                self.engines[month] = engine
+            return engine
+
+    def create(self, engine, previous):
+        """ creates the tables of a new month, with ids following those
+            of the previous months """
+        conn = engine.connect()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self.metadata.create_all(conn)
+        for table in self.metadata.sorted_tables:
+            last = max([self.max_id(m, table.name) for m in previous] or [None])
+            if last:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                                 (table.name, last))
+        conn.close()
+
+    def max_id(self, month, table):
+        key = (month, table)
+        if month == current_month() or key not in self.max_ids:
+            last = self.engine(month).execute('SELECT max(id) FROM "%s"' % table).scalar()
+            if month == current_month():
+                return last
+            self.max_ids[key] = last
+        return self.max_ids[key]
+
+    def attach_hot(self, dbapi_connection, connection_record):
+        month = current_month()
+        self.engine(month)
+        dbapi_connection.execute('ATTACH DATABASE ? AS %s' % HOT, (self.path(month),))
+        models.create_feed_triggers(dbapi_connection,
+                                    [t for t in models.FEED_TABLES if t in RAW_TABLES],
+                                    temp=True)
+
+    def select(self, sql, params=None, since=None, until=None, session=None):
+        """ runs sql on each partition overlapping [since, until], oldest
+            first, and yields the rows. The current month is read through
+            session if given, so uncommitted writes are seen. The time range
+            only prunes whole months, sql has to filter the rows itself. """
+        for month in self.months(since, until):
+            if session is not None and month == current_month():
+                rows = session.execute(sql, params or {})
+            else:
+                rows = self.engine(month).execute(sql, params or {})
+            for row in rows:
+                yield row
+
+    def select_since(self, table, watermark, sql, params=None, session=None):
+        """ like select, skipping the past months whose ids of table are all
+            below watermark """
+        for month in self.months():
+            if month != current_month():
+                last = self.max_id(month, table)
+                if last is None or last <= watermark:
+                    continue
+            for row in self.select(sql, params, since=month, until=month, session=session):
+                yield row
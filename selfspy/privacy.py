@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Decides what may be recorded, before anything is written. The rules are
+# compiled once when they change, so the recorder's hooks only pay for a
+# set lookup, a regex search and a comparison of timestamps per event:
+#
+#   - processes whose authorized_recording is off are never recorded
+#   - window titles and URLs matching PRIVACY_TITLE_PATTERNS or
+#     PRIVACY_URL_PATTERNS of config are not recorded, nor is anything
+#     typed or clicked while such a window is active. The patterns match
+#     regardless of case. When they are all lowercase the lowercased title
+#     and URL are matched instead, case-insensitive matching costing twice
+#     as much
+#   - nothing is recorded during PrivacyTimeInterval rows
+#   - nothing is recorded within PRIVACY_RADIUS of PrivacyLocation places,
+#     found through a grid of cells as wide as the radius
+#
+# Only the standard library is imported here, so the rules can be
+# benchmarked without the recorder, see benchmarks/privacy_filter.py.
+
+import re
+import math
+import time
+import datetime
+
+MINUTES_PER_WEEK = 7 * 24 * 60
+WINDOW_CACHE = 1024  # window decisions remembered
+PLACE_RADIUS = 200  # meters around a PrivacyLocation in which nothing is recorded
+EARTH_RADIUS = 6371000.0  # meters
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180  # of latitude
+
+
+def combine(patterns):
+    """ search(text) for any of patterns regardless of case, None if there
+        are none """
+    if not patterns:
+        return None
+    pattern = '|'.join('(?:%s)' % p for p in patterns)
+    if all(p == p.lower() for p in patterns):
+        search = re.compile(pattern, re.UNICODE).search
+        return lambda text: search(text.lower())
+    return re.compile(pattern, re.IGNORECASE | re.UNICODE).search
+
+
+def quiet_week(intervals):
+    """ a bytearray with a 1 for each minute of the week, from Monday 00:00,
+        in which nothing is recorded. intervals are (fromHour, fromMinute,
+        toHour, toMinute, weekend) of PrivacyTimeInterval rows, the same way
+        sampling.quiet_ranges reads them: without weekend they only start
+        Monday to Friday, and one ending before it starts runs past midnight. """
+    week = bytearray(MINUTES_PER_WEEK)
+    for from_hour, from_minute, to_hour, to_minute, weekend in intervals:
+        start = from_hour * 60 + from_minute
+        # an interval ending when it starts lasts the whole day
+        length = (to_hour * 60 + to_minute - start) % (24 * 60) or 24 * 60
+        for day in xrange(7 if weekend else 5):
+            first = day * 24 * 60 + start
+            for minute in xrange(first, first + length):
+                week[minute % MINUTES_PER_WEEK] = 1
+    return week
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """ meters between two points, by the haversine formula """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class GeofenceIndex:
+    """ Places bucketed in a grid of cells radius meters high, so whether a
+        point is within radius of one of them is answered by looking at the
+        places of a single cell. Each place is put in every cell its circle
+        overlaps, more of them away from the equator where degrees of
+        longitude shrink. """
+
+    def __init__(self, places=(), radius=PLACE_RADIUS):
+        self.radius = radius
+        self.cell = radius / METERS_PER_DEGREE  # degrees
+        # columns a whole number of which goes round the earth
+        self.columns = int(math.ceil(360 / self.cell))
+        self.column = 360.0 / self.columns
+        self.cells = {}
+        for lat, lon in places:
+            self.add(lat, lon)
+
+    def key(self, lat, lon):
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.column)) % self.columns
+
+    def add(self, lat, lon):
+        # the circle's bounding box, as wide as it is on its side nearest
+        # the pole, all the way round if it reaches the pole
+        cos = math.cos(math.radians(min(abs(lat) + self.cell, 90)))
+        dlon = self.cell / cos if cos > 1e-9 else 360
+        top, left = self.key(lat - self.cell, lon - dlon)
+        bottom = self.key(lat + self.cell, lon)[0]
+        width = int(math.ceil(2 * dlon / self.column)) + 1
+        for row in xrange(top, bottom + 1):
+            for column in xrange(left, left + min(width, self.columns)):
+                self.cells.setdefault((row, column % self.columns), []).append((lat, lon))
+
+    def inside(self, lat, lon):
+        """ if the point is within radius of a place """
+        for place_lat, place_lon in self.cells.get(self.key(lat, lon), ()):
+            if distance(lat, lon, place_lat, place_lon) <= self.radius:
+                return True
+        return False
+
+
+class PrivacyFilter:
+    """ The compiled privacy rules, and whether recording is allowed right
+        now. The recorder calls window() on every screen change and place()
+        on every location update, which decide if the active window and
+        the current place may be recorded, and allows() before recording
+        anything else. """
+
+    def __init__(self, processes=(), titles=(), urls=(), intervals=(), places=(),
+                 radius=PLACE_RADIUS):
+        self.processes = frozenset(processes)
+        self.titles = combine(titles)
+        self.urls = combine(urls)
+        self.week = quiet_week(intervals)
+        self.places = GeofenceIndex(places, radius)
+        self.cache = {}
+
+        self.window_allowed = True
+        self.place_allowed = True
+        self.minute_end = 0  # until when quiet holds
+        self.quiet = False
+
+    @classmethod
+    def load(cls, session, titles=(), urls=(), radius=PLACE_RADIUS):
+        """ the rules kept in the database, with the title and URL patterns """
+        from selfspy.models import Process, PrivacyTimeInterval, PrivacyLocation
+
+        processes = [name for name, in session.query(Process.name).filter(Process.authorized_recording == False)]
+        intervals = [(t.fromHour, t.fromMinute, t.toHour, t.toMinute, t.weekend)
+                     for t in session.query(PrivacyTimeInterval)]
+        places = [(p.lat, p.lon) for p in session.query(PrivacyLocation)]
+        return cls(processes, titles, urls, intervals, places, radius)
+
+    def allows_window(self, process, title, url=None):
+        """ if a window of process with title and url may be recorded """
+        key = (process, title, url)
+        allowed = self.cache.get(key)
+        if allowed is None:
+            allowed = not (process in self.processes
+                           or (self.titles is not None and title and self.titles(title))
+                           or (self.urls is not None and url and self.urls(url)))
+            if len(self.cache) >= WINDOW_CACHE:
+                self.cache.clear()
+            self.cache[key] = allowed
+        return allowed
+
+    def window(self, process, title, url=None):
+        """ notes the active window, returns if it may be recorded """
+        self.window_allowed = self.allows_window(process, title, url)
+        return self.window_allowed
+
+    def allows_place(self, lat, lon):
+        return not self.places.inside(lat, lon)
+
+    def place(self, lat, lon):
+        """ notes the current location, returns if it may be recorded """
+        self.place_allowed = self.allows_place(lat, lon)
+        return self.place_allowed
+
+    def quiet_at(self, now):
+        """ if now, a timestamp, is in a PrivacyTimeInterval. The week is
+            only looked up once per minute. """
+        if now >= self.minute_end or now < self.minute_end - 60:
+            t = datetime.datetime.fromtimestamp(now)
+            self.quiet = self.week[(t.weekday() * 24 + t.hour) * 60 + t.minute] == 1
+            self.minute_end = now - t.second - t.microsecond / 1e6 + 60
+        return self.quiet
+
+    def allows(self, now=None):
+        """ if anything may be recorded now """
+        return (self.window_allowed and self.place_allowed
+                and not self.quiet_at(time.time() if now is None else now))
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import Queue
+import random
+import sqlite3
+import datetime
+import threading
+import traceback
+
+from sqlalchemy import create_engine, event, func, exists, and_
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from selfspy import app_tree
+from selfspy.timeline import Timeline, ActiveWindows, now_seconds
+from selfspy.models import Process, Experience, Debrief
+
+WORKERS = 2
+POOL_RECYCLE = 600  # seconds, so connections attach the current month again
+DEBRIEF_SAMPLE = 7  # experiences shown in a debrief
+WINDOWS_RANGE = 3600  # seconds of window activations read around a reviewed time
+
+
+class Future:
+    """ The result of a query run by the QueryService """
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def done(self):
+        return self.event.is_set()
+
+    def result(self, timeout=None):
+        """ waits for the query, raises what it raised """
+        if not self.event.wait(timeout):
+            raise RuntimeError("query did not finish in %s seconds" % timeout)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def add_done_callback(self, fn, errback=None):
+        """ calls fn(result) through dispatch once the query succeeded, or
+            errback(error) if it raised, so the caller can clear what it
+            set up for the result """
+        with self.lock:
+            if not self.done():
+                self.callbacks.append((fn, errback))
+                return
+        self.notify(fn, errback)
+
+    def finish(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        with self.lock:
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for fn, errback in callbacks:
+            self.notify(fn, errback)
+
+    def notify(self, fn, errback=None):
+        if self.error is None:
+            self.dispatch(fn, self.value)
+        elif errback is not None:
+            self.dispatch(errback, self.error)
+
+
+def direct(fn, *args):
+    fn(*args)
+
+
+class QueryService:
+    """ Runs the reviewer's and debriefer's queries on worker threads, each
+        with a read-only session of its own, so loading the UI never holds
+        up recording on the main thread.
+
+        Queries are functions taking a session as first argument. Callbacks
+        are run through dispatch, AppHelper.callAfter to get them on the
+        main thread where the UI can be updated. """
+
+    def __init__(self, db_path, partitions=None, workers=WORKERS, dispatch=direct):
+        self.dispatch = dispatch
+        self.engine = create_engine('sqlite:///%s' % db_path, poolclass=QueuePool,
+                                    pool_size=workers, pool_recycle=POOL_RECYCLE,
+                                    connect_args={'check_same_thread': False})
+        if partitions is not None:
+            event.listen(self.engine, 'connect', partitions.attach_hot)
+        event.listen(self.engine, 'connect', read_only)
+        self.session_maker = sessionmaker(bind=self.engine)
+
+        self.jobs = Queue.Queue()
+        self.threads = []
+        for _ in xrange(workers):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, query, *args, **kwargs):
+        """ queues query(session, *args), returns its Future. callback and
+            errback keyword arguments are added as its done callbacks. """
+        callback = kwargs.pop('callback', None)
+        errback = kwargs.pop('errback', None)
+        future = Future(self.dispatch)
+        if callback is not None:
+            future.add_done_callback(callback, errback)
+        self.jobs.put((future, query, args))
+        return future
+
+    def work(self):
+        session = self.session_maker()
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            future, query, args = job
+            try:
+                value = query(session, *args)
+            except Exception as e:
+                traceback.print_exc(file=sys.stdout)
+                future.finish(error=e)
+            else:
+                future.finish(value)
+            finally:
+                # end the read transaction, the next query sees new rows
+                session.close()
+
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+
+
+def read_only(dbapi_connection, connection_record):
+    # older SQLite versions do not know query_only, the sessions are only
+    # used for SELECTs anyway
+    if sqlite3.sqlite_version_info >= (3, 8, 0):
+        dbapi_connection.execute('PRAGMA query_only = 1')
+
+
+# queries
+
+def apps(session, offset, limit=app_tree.APP_PAGE_SIZE):
+    return app_tree.app_page(session, offset, limit)
+
+
+def app_windows(session, process_id, offset, limit=app_tree.WINDOW_PAGE_SIZE):
+    return app_tree.window_page(session, process_id, offset, limit)
+
+
+def process_times(session, resolution):
+    """ (first start, last end, [(process_id, start, end, name)]) of the
+        timeline at resolution columns, None if nothing was recorded """
+    timeline = Timeline(session)
+    bounds = timeline.bounds()
+    if bounds is None:
+        return None
+    segments = timeline.segments(bounds[0], bounds[1], resolution)
+    ids = list(set(s[0] for s in segments))
+    names = dict(session.query(Process.id, Process.name).filter(Process.id.in_(ids))) if ids else {}
+    return bounds[0], bounds[1], [(p, start, end, names.get(p)) for p, start, end in segments]
+
+
+def active_windows(session, partitions, t, span=WINDOWS_RANGE):
+    """ the ActiveWindows of span seconds on each side of t, up to now """
+    until = max(t, min(t + span, now_seconds()))
+    return ActiveWindows(session, partitions, t - span, until)
+
+
+def experiences_of_day(session, day=None, limit=DEBRIEF_SAMPLE):
+    """ [{id, created_at, message, screenshot}] of up to limit experiences
+        of day, a date, today if None, picked at random and in random
+        order. The sample is spread over the hours of the day, and
+        experiences that were not debriefed yet are picked first. """
+    day = day or datetime.date.today()
+    start = unicode(day.strftime("%Y-%m-%d"))
+    end = unicode((day + datetime.timedelta(days=1)).strftime("%Y-%m-%d"))
+    hour = func.substr(Experience.created_at, 12, 2)
+    debriefed = exists().where(Debrief.experience_id == Experience.id)
+    # a range rather than LIKE, so the created_at index is used
+    in_day = and_(Experience.created_at >= start, Experience.created_at < end)
+
+    strata = {}
+    for h, done, n in session.query(hour, debriefed, func.count(Experience.id)).filter(in_day).group_by(hour, debriefed):
+        strata[(bool(done), h)] = n
+
+    # hand out the sample a row per hour in turn, hours in random order
+    taken = dict.fromkeys(strata, 0)
+    left = limit
+    for done in (False, True):
+        keys = [key for key in strata if key[0] == done]
+        random.shuffle(keys)
+        while left and keys:
+            for key in list(keys):
+                if not left:
+                    break
+                taken[key] += 1
+                left -= 1
+                if taken[key] == strata[key]:
+                    keys.remove(key)
+
+    rows = []
+    for (done, h), n in taken.items():
+        if n:
+            q = session.query(Experience).filter(in_day).filter(hour == h)
+            q = q.filter(debriefed if done else ~debriefed)
+            rows.extend(q.order_by(func.random()).limit(n))
+    random.shuffle(rows)
+    return [{'id': row.id, 'created_at': row.created_at, 'message': row.message,
+             'screenshot': row.screenshot} for row in rows]
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+
+from selfspy.mirror import database_files, read_consistent
+
+REPLICA_DIR = 'replica'
+MAX_AGE = 300  # seconds a snapshot is used before it is taken again
+STATE_FILE = '_replica.json'
+
+
+class Replica:
+    """ A copy of the database, and of its partitions, taken at one point in
+        time, for analysis that should neither lock the live database nor
+        see it change while it runs.
+
+        Snapshots are taken by copying the blocks that changed since the
+        previous one into a new file, with read_consistent over all database
+        files at once, and renaming it over the previous snapshot.
+        A connection opened on a snapshot keeps reading that snapshot, with
+        repeatable reads, even once a newer one was taken. """
+
+    def __init__(self, db_path, directory=None, max_age=MAX_AGE):
+        self.data_dir, self.db_name = os.path.split(db_path)
+        self.directory = directory or os.path.join(self.data_dir, REPLICA_DIR)
+        self.max_age = max_age
+        self.state_path = os.path.join(self.directory, STATE_FILE)
+
+    def path(self, name=None):
+        return os.path.join(self.directory, name or self.db_name)
+
+    def age(self):
+        """ seconds since the snapshot was taken, None if there is none """
+        try:
+            return time.time() - os.path.getmtime(self.state_path)
+        except OSError:
+            return None
+
+    def load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def refresh(self, force=False):
+        """ takes a new snapshot if the last one is older than max_age,
+            returns the path of the main database file of the snapshot """
+        age = self.age()
+        if force or age is None or age > self.max_age:
+            self.snapshot()
+        return self.path()
+
+    def snapshot(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        state = self.load_state()
+        names = database_files(self.data_dir, self.db_name)
+
+        # start from copies of the previous snapshot, so only the changed
+        # blocks are read again
+        tmp = {}
+        for name in names:
+            tmp[name] = self.path(name) + '.%d.tmp' % os.getpid()
+            known = state.get(name)
+            if known and self.unchanged(name, known):
+                shutil.copyfile(self.path(name), tmp[name])
+            else:
+                state[name] = {'blocks': []}
+                open(tmp[name], 'wb').close()
+
+        paths = dict((os.path.join(self.data_dir, name), name) for name in names)
+        files = dict((path, open(tmp[name], 'r+b')) for path, name in paths.items())
+        try:
+            def write(path, offset, data):
+                files[path].seek(offset)
+                files[path].write(data)
+
+            read = read_consistent(sorted(paths), dict((path, state[name]['blocks'])
+                                                       for path, name in paths.items()), write)
+            for path, (blocks, size) in read.items():
+                files[path].truncate(size)
+                state[paths[path]] = {'blocks': blocks}
+        finally:
+            for f in files.values():
+                f.close()
+
+        for name in names:
+            os.rename(tmp[name], self.path(name))
+            st = os.stat(self.path(name))
+            state[name].update({'size': st.st_size, 'mtime': st.st_mtime})
+        with open(self.state_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.rename(self.state_path + '.tmp', self.state_path)
+
+    def unchanged(self, name, known):
+        """ the snapshot file is still the one known describes """
+        try:
+            st = os.stat(self.path(name))
+        except OSError:
+            return False
+        return st.st_size == known.get('size') and st.st_mtime == known.get('mtime')
+
+    def connect(self):
+        """ a read-only sqlite3 connection on a recent snapshot """
+        conn = sqlite3.connect(self.refresh())
+        if sqlite3.sqlite_version_info >= (3, 8, 0):
+            conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    def session(self):
+        """ a read-only SQLAlchemy session on a recent snapshot, with
+            Partitions for it if the database is partitioned """
+        from sqlalchemy import create_engine, event
+        from sqlalchemy.orm import sessionmaker
+        from selfspy.partitions import Partitions
+        from selfspy.query_service import read_only
+
+        path = self.refresh()
+        engine = create_engine('sqlite:///%s' % path)
+        event.listen(engine, 'connect', read_only)
+        partitions = Partitions(path)
+        return sessionmaker(bind=engine)(), partitions if partitions.months() else None
+
+
+def snapshot(db_path, max_age=MAX_AGE):
+    """ a read-only connection on a snapshot of the database at db_path at
+        most max_age seconds old """
+    return Replica(db_path, max_age=max_age).connect()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import zlib
+import datetime
+
+from selfspy import config as cfg
+from selfspy.image_cache import THUMBNAIL_DIR
+from selfspy.timeline import to_seconds
+from selfspy.maintenance import INCREMENTAL, auto_vacuum, incremental_vacuum
+from selfspy.partitions import RAW_TABLES
+from selfspy.models import (Click, Debrief, Experience, Geometry, Keys, Location,
+                            Process, Snapshot, Window, WindowEvent, ProcessEvent,
+                            ProcessInterval, MediaFile, Change, maybe_encrypt)
+
+BATCH_SIZE = 500  # rows deleted or files removed per transaction
+STEP_TIME = 0.05  # seconds of batches run_for does at most, give or take a batch
+POLICY_INTERVAL = datetime.timedelta(hours=6)  # between checks of the policies
+MEDIA_KINDS = ('screenshots', 'audio')
+
+# tables emptied from a point in time when the user clears their history
+PURGED = (Click, Debrief, Experience, Geometry, Keys, Location, Snapshot,
+          WindowEvent, ProcessEvent, Window, Process, Change)
+
+# raw events dropped by the 'raw' policy, with the change feed entries of
+# the same age. Keys rows are kept for their typing statistics, only their
+# text, keys and timings are emptied.
+RAW = (Click, Location, Snapshot, Change)
+
+
+def filename_time(filename):
+    """ time a screenshot or recording was taken from its yymmdd-HHMMSSffffff
+        name prefix, None if it does not have one """
+    try:
+        return datetime.datetime.strptime(filename[0:19], "%y%m%d-%H%M%S%f")
+    except ValueError:
+        return None
+
+
+class RetentionEngine:
+    """ Deletes recorded data in small batches, each in its own transaction,
+        so the recorder is never kept waiting on a long write. Work is queued
+        as tasks and done one batch per step(), the recorder's retention
+        timer doing a few of them at a time with run_for(). """
+
+    def __init__(self, session, batch_size=BATCH_SIZE, partitions=None):
+        self.session = session
+        self.batch_size = batch_size
+        self.partitions = partitions
+        self.tasks = []
+        self.last_policy_run = None
+
+    def busy(self):
+        return bool(self.tasks)
+
+    def step(self):
+        """ does one batch of the current task, True if work remains """
+        while self.tasks:
+            try:
+                next(self.tasks[0])
+                return True
+            except StopIteration:
+                self.tasks.pop(0)
+        return False
+
+    def run_all(self):
+        while self.step():
+            pass
+
+    def run_for(self, seconds=STEP_TIME):
+        """ steps until seconds have passed, True if work remains """
+        end = time.time() + seconds
+        while self.step():
+            if time.time() >= end:
+                return True
+        return False
+
+    def then(self, fn):
+        """ queues calling fn once the tasks queued before are done """
+        def task():
+            fn()
+            return
+            yield
+        self.tasks.append(task())
+
+    # media index
+
+    def add_media(self, kind, path, created_at=None):
+        """ records a file written under the kind directory of the data
+            directory. The session is committed with the next batch of
+            recorded data. """
+        filename = os.path.basename(path)
+        if created_at is None:
+            created_at = filename_time(filename) or datetime.datetime.now()
+        self.session.add(MediaFile(kind, filename, created_at))
+
+    def backfill_media(self):
+        """ queues indexing the files written before MediaFile existed, only
+            done while the index is empty """
+        if self.session.query(MediaFile.id).first() is None:
+            self.tasks.append(self._backfill_media())
+
+    def _backfill_media(self):
+        for kind in MEDIA_KINDS:
+            directory = os.path.join(cfg.CURRENT_DIR, kind)
+            try:
+                filenames = os.listdir(directory)
+            except OSError:
+                continue
+            for i, filename in enumerate(filenames):
+                path = os.path.join(directory, filename)
+                if not os.path.isfile(path):
+                    continue
+                created_at = filename_time(filename)
+                if created_at is None:
+                    created_at = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+                self.add_media(kind, filename, created_at)
+                if (i + 1) % self.batch_size == 0:
+                    self.session.commit()
+                    yield
+            self.session.commit()
+
+    # purge and policies
+
+    def purge_since(self, since=None, until=None):
+        """ queues deleting everything recorded after since, everything if
+            since is None, up to until, now if None. What is recorded while
+            the purge goes on is kept. """
+        until = until or datetime.datetime.now()
+        self.tasks.append(self._purge_since(since, until))
+
+    def _purge_since(self, since, until):
+        params = {'t': unicode(since or datetime.datetime.min), 'u': unicode(until)}
+        for model in PURGED:
+            table = model.__tablename__
+            for target in self.targets(table, since=since, until=until):
+                for _ in self.delete_rows(table, 'created_at > :t AND created_at <= :u', params, target):
+                    yield
+
+        # intervals materialized from the events just deleted
+        seconds = {'t': to_seconds(str(since)) if since else float('-inf'),
+                   'u': to_seconds(str(until))}
+        for _ in self.delete_rows(ProcessInterval.__tablename__,
+                                  'start_time >= :t AND start_time <= :u', seconds):
+            yield
+        # intervals that started earlier end at the purge, and point back
+        # to their start event so the timeline reads the next events again
+        self.session.execute("UPDATE processinterval SET end_time = :t, end_event_id = start_event_id "
+                             "WHERE end_time > :t AND start_time < :t", seconds)
+        self.session.commit()
+
+        for _ in self.delete_media('created_at > :t AND created_at <= :u', params):
+            yield
+
+    def apply_policies(self, now=None):
+        """ queues expiring the data older than the configured number of days """
+        now = now or datetime.datetime.now()
+        self.last_policy_run = now
+        if cfg.RETENTION_RAW_DAYS is not None:
+            before = now - datetime.timedelta(days=cfg.RETENTION_RAW_DAYS)
+            self.tasks.append(self._expire_raw(before))
+        if cfg.RETENTION_MEDIA_DAYS is not None:
+            before = now - datetime.timedelta(days=cfg.RETENTION_MEDIA_DAYS)
+            self.tasks.append(self.delete_media('created_at < :t', {'t': unicode(before)}))
+
+    def policies_due(self, now=None):
+        if cfg.RETENTION_RAW_DAYS is None and cfg.RETENTION_MEDIA_DAYS is None:
+            return False
+        now = now or datetime.datetime.now()
+        return self.last_policy_run is None or now - self.last_policy_run > POLICY_INTERVAL
+
+    def _expire_raw(self, before):
+        params = {'t': unicode(before)}
+        for model in RAW:
+            table = model.__tablename__
+            for target in self.targets(table, until=before):
+                for _ in self.delete_rows(table, 'created_at < :t', params, target):
+                    yield
+
+        empty_timings = zlib.compress(json.dumps([]))
+        params = {'t': unicode(before), 'text': buffer(maybe_encrypt('')),
+                  'keys': buffer(maybe_encrypt(zlib.compress(json.dumps([])))),
+                  'timings': buffer(empty_timings), 'n': len(empty_timings)}
+        sql = ("UPDATE keys SET text = :text, keys = :keys, timings = :timings "
+               "WHERE id IN (SELECT id FROM keys WHERE created_at < :t "
+               "AND length(timings) > :n LIMIT %d)" % self.batch_size)
+        for target in self.targets('keys', until=before):
+            while self.execute(target, sql, params) == self.batch_size:
+                yield
+
+    # batches
+
+    def targets(self, table, since=None, until=None):
+        """ what to run statements on table through: the session, or for
+            the raw tables of a partitioned database the engines of the
+            months between since and until """
+        if self.partitions is None or table not in RAW_TABLES:
+            return [self.session]
+        return [self.partitions.engine(m) for m in self.partitions.months(since, until)]
+
+    def execute(self, target, sql, params):
+        """ runs a statement in its own transaction, returns the row count """
+        count = target.execute(sql, params).rowcount
+        if target is self.session:
+            self.session.commit()
+        return count
+
+    def delete_rows(self, table, condition, params, target=None):
+        """ deletes the rows of table matching condition, a batch per
+            iteration. condition should be on an indexed column. """
+        sql = ("DELETE FROM %s WHERE id IN (SELECT id FROM %s WHERE %s LIMIT %d)"
+               % (table, table, condition, self.batch_size))
+        while self.execute(target or self.session, sql, params) == self.batch_size:
+            yield
+
+    def delete_media(self, condition, params):
+        """ removes the indexed files matching condition along with their
+            thumbnails, then their index rows """
+        sql = ("SELECT id, kind, filename FROM mediafile WHERE %s LIMIT %d"
+               % (condition, self.batch_size))
+        while True:
+            rows = self.session.execute(sql, params).fetchall()
+            for media_id, kind, filename in rows:
+                paths = [os.path.join(cfg.CURRENT_DIR, kind, filename)]
+                if kind == 'screenshots':
+                    paths.append(os.path.join(cfg.CURRENT_DIR, kind, THUMBNAIL_DIR, filename))
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            if rows:
+                self.session.execute("DELETE FROM mediafile WHERE id IN (%s)"
+                                     % ','.join(str(r[0]) for r in rows))
+                self.session.commit()
+            if len(rows) < self.batch_size:
+                return
+            yield
+
+    def vacuum(self):
+        """ queues releasing the free pages left by the deletes, a few at a
+            time. Only does something on databases with incremental
+            auto_vacuum. """
+        self.tasks.append(self._vacuum())
+
+    def _vacuum(self):
+        if auto_vacuum(self.session) != INCREMENTAL:
+            return
+        while incremental_vacuum(self.session) > 0:
+            yield
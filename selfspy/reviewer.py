@@ -27,12 +27,31 @@ from AppKit import *
 from CBGraphView import CBGraphView
 
 from selfspy.helpers import *
+from selfspy.image_cache import ImageCache
 
 
 SCREENSHOT_WIDTH = 960
 SCREENSHOT_HEIGHT = 600
 
 
+def applyDefaults(defaults, results):
+    """ restore app checkbox states saved in NSUserDefaults, window states
+        are kept aside and applied when the windows get loaded """
+
+    saved = {}
+    for d in defaults or []:
+        saved[d['appName']] = d
+
+    for result in results:
+        d = saved.get(result['appName'])
+        if d:
+            try:
+                result['checked'] = int(d['checked'])
+                result['savedWindows'] = NSMutableDictionary(dict((w['windowName'], int(w['checked'])) for w in d['windows']))
+            except:
+                pass
+
+
 class WindowListController(NSArrayController):
 
     @IBAction
@@ -62,6 +81,12 @@ class WindowListController(NSArrayController):
             except:
                 print "Error: Could not update App Checkbox"
 
+    def tableView_didAddRowView_forRow_(self, tableView, rowView, row):
+        """ load the next page of windows when the last one scrolls into view """
+        app_data = self.review_controller.windowQuery
+        if app_data and not app_data['windowsExhausted'] and row >= len(app_data['windows']) - 1:
+            self.review_controller.loadWindows(app_data)
+
 
 # Review window controller
 class ReviewController(NSWindowController):
@@ -80,17 +105,27 @@ class ReviewController(NSWindowController):
     dateQuery = ""
     processNameQuery = ""
 
-    # data for app and window tables
+    # data for app and window tables, apps are loaded in pages and their
+    # windows when the app is selected
     results = []
-
-    # let activity_store write query results into those
+    appsLoaded = 0
+    appsExhausted = False
+    appsPending = False  # a page of apps was asked for and did not arrive yet
+    windowQuery = None
+    savedDefaults = None
+
+    # let activity_store write query results into those, the lists filled
+    # by queries run off the main thread are then shown by the show* and
+    # draw* methods
     queryResponse = []
     queryResponse2 = []
     processTimesResponse = []
+    timelineWidth = TIMELINE_WIDTH
     processNameResponse = []
 
-    # lists of image files
+    # lists of image files, and the images loaded from them
     list_of_files = []
+    imageCache = None
 
     # timeline values in UTC seconds
     timeline_value = 0
@@ -170,6 +205,7 @@ class ReviewController(NSWindowController):
                 screenshot_found = True
                 filename = s=self.list_of_files[self.currentScreenshot]
                 self.displayScreenshot(self, s=filename)
+                self.imageCache.prefetch(self.list_of_files, self.currentScreenshot, direction)
                 normalized_current_value =  unixTimeFromString(self, mapFilenameDateToNumber(self, s=filename)) - self.slider_min
                 self.timeline_value = normalized_current_value
 
@@ -184,7 +220,9 @@ class ReviewController(NSWindowController):
     def displayScreenshot(self, self2=None, s=None):
         """ draw screenshot at right size """
 
-        experienceImage = NSImage.alloc().initByReferencingFile_(getScreenshotPath(self) + s)
+        experienceImage = self.imageCache.get(s)
+        if experienceImage is None:
+            return
         width = experienceImage.size().width
         height = experienceImage.size().height
         ratio = width / height
@@ -203,87 +241,86 @@ class ReviewController(NSWindowController):
 
 
     def getApplicationsAndWindowsForTable(self):
-        """ query database for apps and windows """
+        """ query database for the next page of apps, shown by showApps """
 
+        if self.reviewController.appsPending:
+            return
+        self.reviewController.appsPending = True
         NSNotificationCenter.defaultCenter().postNotificationName_object_('getAppsAndWindows',self)
 
 
-    def applyDefaults(self, defaults, results):
-        """ restore app and window checkbox states saved in NSUserDefaults """
+    def showApps(self, self2=None, first_new=0):
+        """ called by the activity store once a page of apps was added to results """
 
-        for d in defaults:
-            try:
-                result = (r for r in results if r['appName'] == d['appName']).next()
-                result['checked'] = int(d['checked'])
-                for w in d['windows']:
-                    result_w = (rw for rw in result['windows'] if rw['windowName'] == w['windowName']).next()
-                    if result_w:
-                        result_w['checked'] = int(w['checked'])
-            except:
-                pass
+        self.reviewController.appsPending = False
+        applyDefaults(self.savedDefaults, self.reviewController.results[first_new:])
+        self.reviewController.arrayController.rearrangeObjects()
 
 
-    def manageTimeline(self):
-        """ get timeline limits and draw elements """
+    def loadWindows(self, app_data):
+        """ query the next page of windows of an app, shown by showWindows """
 
-        bounds_detected = 0
-        front_bound = 0
-        drawn_textlabels = []
+        self.windowQuery = app_data
+        if app_data.get('windowsPending'):
+            return
+        app_data['windowsPending'] = True
+        NSNotificationCenter.defaultCenter().postNotificationName_object_('getAppWindows',self)
 
-        NSNotificationCenter.defaultCenter().postNotificationName_object_('getProcessTimes', self)
 
-        self.slider_min = unixTimeFromString(self, s=str(datetime.datetime.now()))
+    def showWindows(self, self2=None, app_data=None):
+        """ called by the activity store once a page of windows was added to app_data """
 
-        for app in self.processTimesResponse:
-            for time in app:
-                if unixTimeFromString(self, str(time[2])) < self.slider_min:
-                    self.slider_min = unixTimeFromString(self, str(time[2]))
+        app_data['windowsPending'] = False
+        if app_data is self.windowQuery:
+            self.windowListController.setContent_(app_data['windows'])
+            self.windowList.reloadData()
 
-                if unixTimeFromString(self, str(time[2])) > self.slider_max:
-                    self.slider_max = unixTimeFromString(self, str(time[2]))
 
-        self.normalized_max_value = self.slider_max - self.slider_min
-        self.reviewController.slider.setMaxValue_(self.normalized_max_value)
+    def tableView_didAddRowView_forRow_(self, tableView, rowView, row):
+        """ load the next page of apps when the last one scrolls into view """
 
-        reordered_process_times = []
+        if tableView == self.appList and not self.appsExhausted and row >= len(self.results) - 1:
+            self.getApplicationsAndWindowsForTable()
 
-        for entry in self.processTimesResponse[0]:
-            reordered_process_times.append([entry[3], entry[1], unixTimeFromString(self, str(entry[2]))])
 
-        # reorder list
-        reordered_process_times.sort(key=lambda tup: tup[2])
+    def manageTimeline(self):
+        """ get timeline limits, drawn by drawTimeline """
 
-        first_bound = True
-        front_bound = 0
-        back_bound = 0
+        # activity store answers with the timeline bounds and segments
+        # already merged down to one per pixel column
+        del self.processTimesResponse[:]
+        NSNotificationCenter.defaultCenter().postNotificationName_object_('getProcessTimes', self)
 
-        for event in reordered_process_times:
-            process_id = event[0]
-            event_type = event[1]
-            time = event[2]
 
-            if str(event[1]) == "Active":
-                if first_bound:
-                    front_bound = event[2]
-                    first_bound = False
-                else:
-                    back_bound = event[2]
-                    next_front_bound = event[2]
-                    addProcessTimelineSegment(self, process_id, front_bound, back_bound, self)
+    def drawTimeline(self, self2=None):
+        """ called by the activity store once processTimesResponse was filled """
 
-                    front_bound = next_front_bound
+        if not self.processTimesResponse:
+            return
+
+        self.slider_min, self.slider_max, segments = self.processTimesResponse[0]
+        del self.processTimesResponse[:]
+
+        self.normalized_max_value = self.slider_max - self.slider_min
+        self.reviewController.slider.setMaxValue_(self.normalized_max_value)
+
+        for process_id, front_bound, back_bound, name in segments:
+            addProcessTimelineSegment(self, process_id, front_bound, back_bound, self, name)
 
 
     def populateElements(self):
         """ get app/window data, list of screenshots, and draw timeline """
 
         # prepare data for app and window tables
+        self.savedDefaults = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('appWindowList')
         self.getApplicationsAndWindowsForTable(self)
-        defaults = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('appWindowList')
-        self.applyDefaults(self, defaults, self.reviewController.results)
 
         # get list of image files
         self.list_of_files = generateScreenshotList(self)
+        if self.imageCache:
+            self.imageCache.close()
+        self.imageCache = ImageCache(getScreenshotPath(self), loader=loadScreenshotImage,
+                                     cost=screenshotImageCost, thumbnailer=writeScreenshotThumbnail)
 
         # prepare timeline
         self.manageTimeline(self)
@@ -300,8 +337,12 @@ class ReviewController(NSWindowController):
 
         if selected_view:
             app_data = selected_view.objectValue()
-            self.windowListController.setContent_(app_data['windows'])
-            self.windowList.reloadData()
+            if app_data['windowsLoaded'] == 0 and not app_data['windowsExhausted']:
+                self.loadWindows(app_data)
+            else:
+                self.windowQuery = app_data
+                self.windowListController.setContent_(app_data['windows'])
+                self.windowList.reloadData()
 
             # self.current_timeline_process = app_index_in_dict # TODO potential future bug because we do not know if the order is always the same
             # self.manageTimeline() # TODO do not query file list and so on every time
@@ -310,7 +351,31 @@ class ReviewController(NSWindowController):
     def windowWillClose_(self, notification):
         """ save state of tables to user defaults when window closes """
 
-        NSUserDefaultsController.sharedUserDefaultsController().defaults().setObject_forKey_(self.results, 'appWindowList')
+        if self.imageCache:
+            self.imageCache.close()
+
+        # apps past the last page loaded, and windows that were never
+        # loaded, keep the state they were saved with
+        loaded = {}
+        for app in self.results:
+            windows = NSMutableArray([])
+            names = set()
+            for w in app['windows']:
+                windows.append({'windowName': w['windowName'], 'checked': w['checked']})
+                names.add(w['windowName'])
+            for name, checked in (app.get('savedWindows') or {}).items():
+                if name not in names:
+                    windows.append({'windowName': name, 'checked': checked})
+            loaded[app['appName']] = {'appName': app['appName'], 'checked': app['checked'], 'windows': windows}
+
+        saved = NSMutableArray([])
+        for d in self.savedDefaults or []:
+            saved.append(loaded.pop(d['appName'], d))
+        for app in self.results:
+            if app['appName'] in loaded:
+                saved.append(loaded.pop(app['appName']))
+
+        NSUserDefaultsController.sharedUserDefaultsController().defaults().setObject_forKey_(saved, 'appWindowList')
 
 
     def show(self):
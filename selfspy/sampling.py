@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import random
+import datetime
+
+TICK = 15  # seconds between two looks at the schedule
+MIN_SPACING = 600  # seconds between two prompts at least, at most half the interval
+IDLE_TIME = 120  # seconds without input after which prompts are held back
+DAY = 24 * 3600
+
+
+def quiet_ranges(intervals, day):
+    """ [(start, end)] seconds of day, a date, in which no prompt is shown.
+        intervals are (fromHour, fromMinute, toHour, toMinute, weekend) of
+        PrivacyTimeInterval rows, those without weekend only apply Monday
+        to Friday. An interval ending before it starts runs past midnight,
+        into the next day. """
+    def applies(d, weekend):
+        return weekend or d.weekday() < 5
+
+    yesterday = day - datetime.timedelta(days=1)
+    ranges = []
+    for from_hour, from_minute, to_hour, to_minute, weekend in intervals:
+        start = from_hour * 3600 + from_minute * 60
+        end = to_hour * 3600 + to_minute * 60
+        if end > start:
+            if applies(day, weekend):
+                ranges.append((start, end))
+        else:
+            if applies(day, weekend):
+                ranges.append((start, DAY))
+            if applies(yesterday, weekend):
+                ranges.append((0, end))
+    return ranges
+
+
+def plan(day, interval, quiet=(), seed=0):
+    """ the prompt times of day, in seconds since midnight. Each slot of
+        interval seconds gets a prompt at a random time within it, unless
+        it falls in a quiet range or too close to the previous one. The
+        same day, interval and seed always give the same times. """
+    rng = random.Random(day.toordinal() * 1000003 + int(interval) * 101 + seed)
+    spacing = min(MIN_SPACING, interval / 2.0)
+    times = []
+    for slot in xrange(0, DAY, int(interval)):
+        t = slot + rng.random() * min(interval, DAY - slot)
+        if times and t - times[-1] < spacing:
+            continue
+        if any(start <= t < end for start, end in quiet):
+            continue
+        times.append(int(t))
+    return times
+
+
+def midnight(day):
+    return time.mktime(day.timetuple())
+
+
+class ExperienceSchedule:
+    """ The times at which the experience sampling window shows up, planned
+        a day at a time and kept in a file, so prompts are not replanned
+        when selfspy restarts. The recorder asks due() every TICK seconds
+        and shows the window when it answers True.
+
+        quiet_hours is called once per plan for the PrivacyTimeInterval
+        rows, see quiet_ranges. A prompt coming due while the user is away
+        waits for them to come back, and is dropped once it is more than
+        half an interval late. """
+
+    def __init__(self, path, interval, enabled=True, quiet_hours=list):
+        self.path = path
+        self.interval = interval
+        self.enabled = enabled
+        self.quiet_hours = quiet_hours
+        self.state = self.load()
+        if 'seed' not in self.state:
+            self.state = {'seed': random.getrandbits(32)}
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def save(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.state, f)
+        os.rename(self.path + '.tmp', self.path)
+
+    def configure(self, interval, enabled):
+        """ called when the preferences change, replans the rest of the day
+            if the interval did """
+        self.enabled = enabled
+        if interval != self.interval:
+            self.interval = interval
+            self.state.pop('day', None)
+
+    def times(self, now):
+        """ the remaining prompt times of the day of now, as timestamps,
+            planned first if the day has none yet """
+        today = datetime.date.fromtimestamp(now)
+        if self.state.get('day') != today.isoformat() or self.state.get('interval') != self.interval:
+            base = midnight(today)
+            times = plan(today, self.interval, quiet_ranges(self.quiet_hours(), today),
+                         self.state['seed'])
+            self.state.update({'day': today.isoformat(), 'interval': self.interval,
+                               'times': [base + t for t in times if base + t >= now]})
+            self.save()
+        return self.state['times']
+
+    def next_prompt(self, now):
+        """ the timestamp of the next prompt, None if there is none left today """
+        times = self.times(now)
+        return times[0] if times else None
+
+    def due(self, now, idle=0):
+        """ True if a prompt should be shown now, idle being the seconds
+            since the last input """
+        if not self.enabled or not self.interval:
+            return False
+        times = self.times(now)
+        if not times or times[0] > now:
+            return False
+        late = [t for t in times if t <= now]
+        if idle > IDLE_TIME and now - late[-1] <= self.interval / 2.0:
+            return False
+        self.state['times'] = times[len(late):]
+        self.save()
+        return now - late[-1] <= self.interval / 2.0
@@ -52,12 +52,9 @@ import config as cfg
 import time
 from datetime import datetime
 
-import mutagen.mp4
-
-from selfspy import locationTracking
-from selfspy import debriefer
-from selfspy import reviewer
-from selfspy import preferences
+# The reviewer, debriefer, preferences and location modules pull in
+# dateutil, CoreLocation and WebKit. They are imported where they are first
+# used so recording can start as soon as the store and the sniffer are up.
 
 from urlparse import urlparse
 
@@ -164,10 +161,7 @@ class Sniffer:
         self.screenRatio = self.screenSize[0]/self.screenSize[1]
 
         self.location_hook = lambda x: True
-        
-        self.geo = locationTracking.LocationTracking()
-        self.geo.startTracking()
-        self.geo.locationchange_hook = self.got_location_change
+        self.geo = None
 
         self.delegate = None
 
@@ -213,6 +207,11 @@ class Sniffer:
                 NSNotificationCenter.defaultCenter().postNotificationName_object_('checkLoops',self)
                 NSNotificationCenter.defaultCenter().postNotificationName_object_('noteRecordingState',self)
 
+                # location tracking is not needed to start recording, bring it
+                # up once the run loop is idle
+                s = objc.selector(sc.startLocationTracking,signature='v@:')
+                NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(0, sc, s, None, False)
+
             def applicationWillTerminate_(self, application):
                 # need to release the lock here as when the application terminates it does not run the rest the
                 # original main, only the code that has crossed the pyobc bridge.
@@ -288,10 +287,12 @@ class Sniffer:
 
             def showDebrief_(self, notification):
                 NSLog("Showing Daily Debrief Window...")
+                from selfspy import debriefer
                 debriefer.DebriefController.show()
 
             def showReview_(self, notification):
                 NSLog("Showing Review Window...")
+                from selfspy import reviewer
                 reviewer.ReviewController.show()
 
             def showExperience_(self, notification):
@@ -300,6 +301,7 @@ class Sniffer:
 
             def showPreferences_(self, notification):
                 NSLog("Showing Preference Window...")
+                from selfspy import preferences
                 preferences.PreferencesController.show()
 
             def createStatusMenu(self):
@@ -578,6 +580,12 @@ class Sniffer:
             AppHelper.stopEventLoop()
             raise
 
+    def startLocationTracking(self):
+        from selfspy import locationTracking
+        self.geo = locationTracking.LocationTracking()
+        self.geo.startTracking()
+        self.geo.locationchange_hook = self.got_location_change
+
     def makeAppActive_(self, notification):
         self.app.activateIgnoringOtherApps_(True)
         
@@ -654,7 +662,7 @@ class Sniffer:
     	# print type(window_name)
     	return window_name
 
-    def screenshot(self, path, region = None):
+    def screenshot(self, path, region = None, scale = 1.0):
     #https://pythonhosted.org/pyobjc/examples/Quartz/Core%20Graphics/CGRotation/index.html
       try:
         # record how long it takes to take screenshot
@@ -693,7 +701,7 @@ class Sniffer:
         nativeRatio = nativeWidth/nativeHeight
 
         prefHeight = NSUserDefaultsController.sharedUserDefaultsController().values().valueForKey_('imageSize')
-        height = int(prefHeight) #int(prefHeight/scr[0].frame().size.height*nativeHeight)
+        height = int(int(prefHeight) * scale) #int(prefHeight/scr[0].frame().size.height*nativeHeight)
         width = int(nativeRatio * height)
 
         # Computes the scale factor between the user resolution and the native screen resolution
@@ -812,6 +820,8 @@ class Sniffer:
         stop = time.time()
         # print 'took ' + str(height) + 'px image in ' + str(stop-start)[:5] + ' seconds'
 
+        return pathStr
+
       except KeyboardInterrupt:
         print "Keyboard interrupt"
         AppHelper.stopEventLoop()
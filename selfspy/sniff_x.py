@@ -21,13 +21,27 @@ along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
 
 # This file is loosely based on examples/record_demo.py in python-xlib
 
+import os
 import sys
+import marshal
+import threading
 
 from Xlib import X, XK, display
 from Xlib.ext import record
 from Xlib.error import XError
 from Xlib.protocol import rq
 
+from selfspy import config as cfg
+
+
+# Pointer motion is coalesced at the source: within a RECORD reply only the
+# last MotionNotify is kept, and across replies a point is only handed to
+# mouse_move_hook once MOTION_INTERVAL has passed since the last delivered one.
+# A point held back is delivered by a timer if no event follows, so the end
+# of a movement is not lost when the pointer stops.
+MOTION_INTERVAL = 100  # ms of X server time, matches ActivityStore's 10Hz
+MOTION_MIN_DISTANCE = 0  # px, > 0 drops points closer than this to the last one
+
 
 def state_to_idx(state):  # this could be a dict, but I might want to extend it.
     if state == 1:
@@ -39,12 +53,47 @@ def state_to_idx(state):  # this could be a dict, but I might want to extend it.
     return 0
 
 
+# Modifier states get_key_name distinguishes; anything else reads as state 0.
+# Key names are kept in a flat table of len(keymap) * len(KEY_STATES) entries
+# so translating a key press is a single index.
+KEY_STATES = (0, 1, 128, 129)
+STATE_SLOTS = dict((state, slot) for slot, state in enumerate(KEY_STATES))
+
+
+def load_key_names(keymap, path):
+    """ Returns the serialized name table for keymap, or None if there is no
+        cache or it was built for a different keymap """
+    try:
+        f = open(path, 'rb')
+        try:
+            cached_keymap, names = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    if cached_keymap != keymap:
+        return None
+    return names
+
+
+def save_key_names(keymap, names, path):
+    tmp_path = path + '.tmp'
+    try:
+        f = open(tmp_path, 'wb')
+        try:
+            marshal.dump((keymap, names), f)
+        finally:
+            f.close()
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        print "Could not write keymap cache to", path
+
+
 class Sniffer:
-    def __init__(self):
-        self.keysymdict = {}
-        for name in dir(XK):
-            if name.startswith("XK_"):
-                self.keysymdict[getattr(XK, name)] = name[3:]
+    def __init__(self, motion_interval=MOTION_INTERVAL,
+                 motion_min_distance=MOTION_MIN_DISTANCE):
+        # only filled from XK when a keymap is not found in the cache
+        self.keysymdict = None
 
         self.key_hook = lambda x: True
         self.mouse_button_hook = lambda x: True
@@ -53,9 +102,37 @@ class Sniffer:
 
         self.contextEventMask = [X.KeyPress, X.MotionNotify]
 
+        self.motion_interval = motion_interval
+        self.motion_min_distance = motion_min_distance
+        self.pending_motion = None
+        self.last_motion = None
+        self.motion_timer = None
+        # the hooks are called from the record thread and the motion timer
+        self.lock = threading.Lock()
+
         self.the_display = display.Display()
         self.record_display = display.Display()
-        self.keymap = self.the_display._keymap_codes
+        self.keymap_cache = os.path.join(os.path.expanduser(cfg.LOCAL_DIR),
+                                         cfg.KEYMAP_CACHE)
+        self.set_keymap(self.the_display._keymap_codes)
+
+    def set_keymap(self, keymap):
+        """ Builds the keycode x modifier state -> name table for keymap,
+            reusing the serialized one if the keymap has not changed """
+        self.keymap = [list(codes) for codes in keymap]
+        names = load_key_names(self.keymap, self.keymap_cache)
+        if names is None:
+            names = []
+            for codes in self.keymap:
+                for state in KEY_STATES:
+                    idx = state_to_idx(state)
+                    cn = codes[idx] if idx < len(codes) else 0
+                    if cn < 256:
+                        names.append(unichr(cn))
+                    else:
+                        names.append(self.lookup_keysym(cn))
+            save_key_names(self.keymap, names, self.keymap_cache)
+        self.key_names = names
 
     def run(self):
         # Check if the extension is present
@@ -92,6 +169,10 @@ class Sniffer:
         self.the_display.flush()
 
     def processevents(self, reply):
+        with self.lock:
+            self.process_reply(reply)
+
+    def process_reply(self, reply):
         if reply.category != record.FromServer:
             return
         if reply.client_swapped:
@@ -121,22 +202,61 @@ class Sniffer:
                 self.key_hook(*self.key_event(event))
             elif event.type in [X.ButtonPress]:
                 # X.ButtonRelease we don't log this anyway.
+                # the path leading up to a click should end where it happened
+                self.flush_motion(force=True)
                 self.mouse_button_hook(*self.button_event(event))
             elif event.type == X.MotionNotify:
-                self.mouse_move_hook(event.root_x, event.root_y)
+                self.pending_motion = (event.root_x, event.root_y, event.time)
             elif event.type == X.MappingNotify:
                 self.the_display.refresh_keyboard_mapping()
-                newkeymap = self.the_display._keymap_codes
+                newkeymap = [list(codes) for codes in self.the_display._keymap_codes]
                 print 'Change keymap!', newkeymap == self.keymap
-                self.keymap = newkeymap
+                if newkeymap != self.keymap:
+                    self.set_keymap(newkeymap)
+
+        self.flush_motion()
+
+    def flush_motion(self, force=False):
+        """ Hands the latest coalesced pointer position to mouse_move_hook.
+            Unless force is set, nothing is delivered before motion_interval
+            has elapsed since the last delivered point, a timer delivering
+            it then if no other event came, and points closer than
+            motion_min_distance to it are dropped as path simplification. """
+        if self.pending_motion is None:
+            return
+        x, y, t = self.pending_motion
+
+        if self.last_motion is not None and not force:
+            last_x, last_y, last_t = self.last_motion
+            # X server time is in ms and wraps around at 32 bits
+            elapsed = (t - last_t) & 0xffffffff
+            if elapsed < self.motion_interval:
+                self.flush_later((self.motion_interval - elapsed) / 1000.0)
+                return
+            dx = x - last_x
+            dy = y - last_y
+            if dx * dx + dy * dy < self.motion_min_distance ** 2:
+                self.pending_motion = None
+                return
+
+        self.pending_motion = None
+        self.last_motion = (x, y, t)
+        self.mouse_move_hook(x, y)
+
+    def flush_later(self, delay):
+        if self.motion_timer is not None:
+            return
+        self.motion_timer = threading.Timer(delay, self.flush_pending)
+        self.motion_timer.daemon = True
+        self.motion_timer.start()
+
+    def flush_pending(self):
+        with self.lock:
+            self.motion_timer = None
+            self.flush_motion(force=True)
 
     def get_key_name(self, keycode, state):
-        state_idx = state_to_idx(state)
-        cn = self.keymap[keycode][state_idx]
-        if cn < 256:
-            return chr(cn).decode('latin1')
-        else:
-            return self.lookup_keysym(cn)
+        return self.key_names[keycode * len(KEY_STATES) + STATE_SLOTS.get(state, 0)]
 
     def key_event(self, event):
         flags = event.state
@@ -158,6 +278,11 @@ class Sniffer:
         return event.detail, event.root_x, event.root_y
 
     def lookup_keysym(self, keysym):
+        if self.keysymdict is None:
+            self.keysymdict = {}
+            for name in dir(XK):
+                if name.startswith("XK_"):
+                    self.keysymdict[getattr(XK, name)] = name[3:]
         if keysym in self.keysymdict:
             return self.keysymdict[keysym]
         return "[%d]" % keysym
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Moves recorded data off the machine in segment files. A segment is a zip
+# holding rows.json, an upload in the format of aggregator.py, and the
+# screenshots and recordings taken since the previous segment. Its name
+# carries the SHA-1 of its content, checked once it has fully arrived:
+#
+#     segment-00000042-<sha1>.zip
+#
+# Segments are written to a spool directory and shipped from there a chunk
+# at a time, to a directory (a mounted share) or an HTTP receiver, which
+# this module also runs, without needing the rest of selfspy, with
+#
+#     python selfspy/spooler.py --dir /srv/selfspy-spool --port 8766
+
+import os
+import re
+import json
+import time
+import random
+import socket
+import httplib
+import hashlib
+import zipfile
+import argparse
+import threading
+import BaseHTTPServer
+import SocketServer
+
+SEGMENT_ROWS = 20000  # changes, or rows per table recorded before the first segment, per segment
+SEGMENT_MEDIA_BYTES = 32 * 1024 * 1024  # screenshots and audio per segment
+CHUNK_BYTES = 256 * 1024  # bytes sent per request
+SPOOL_MAX_BYTES = 512 * 1024 * 1024  # no new segments beyond this
+BACKOFF_BASE = 5  # seconds before the first retry
+BACKOFF_MAX = 3600  # longest wait between two attempts
+
+WATERMARK_FILE = '_watermark.json'
+MEDIA = ('mediafile', ('kind', 'filename'))
+SEGMENT = re.compile(r'^segment-(\d{8})-([0-9a-f]{40})\.zip$')
+
+
+def checksum(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), ''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DirectorySink:
+    """ Collects segments in a directory. Chunks are appended to a .part
+        file, renamed to the segment name once the checksum matches. """
+
+    def __init__(self, path):
+        self.path = path
+
+    def part(self, name):
+        return os.path.join(self.path, name + '.part')
+
+    def received(self, name):
+        """ bytes of name the sink already has, None if it has all of it """
+        if os.path.exists(os.path.join(self.path, name)):
+            return None
+        try:
+            return os.path.getsize(self.part(name))
+        except OSError:
+            return 0
+
+    def write(self, name, offset, data, total):
+        match = SEGMENT.match(name)
+        if match is None:
+            raise ValueError("not a segment name: %s" % name)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        part = self.part(name)
+        if offset != (self.received(name) or 0):
+            raise IOError("chunk of %s at %d, expected %d" % (name, offset, self.received(name)))
+        with open(part, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if offset + len(data) >= total:
+            if checksum(part) != match.group(2):
+                os.remove(part)
+                raise IOError("checksum of %s does not match, starting over" % name)
+            os.rename(part, os.path.join(self.path, name))
+
+
+class HttpSink:
+    """ Sends segments to a receiver run by main(), at http://host:port or
+        unix:///path. HEAD /spool/<name> answers the number of bytes
+        received in X-Received, PUT /spool/<name> appends a chunk. """
+
+    def __init__(self, url):
+        self.url = url
+
+    def call(self, method, name, body=None, headers=None):
+        from selfspy.aggregator import connection
+
+        conn = connection(self.url)
+        try:
+            conn.request(method, '/spool/' + name, body, headers or {})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                raise IOError("spool receiver answered %d %s" % (response.status, response.reason))
+            return response
+        finally:
+            conn.close()
+
+    def received(self, name):
+        received = self.call('HEAD', name).getheader('X-Received')
+        return None if received == 'all' else int(received)
+
+    def write(self, name, offset, data, total):
+        self.call('PUT', name, data, {'Content-Range': 'bytes %d-%d/%d'
+                                      % (offset, offset + len(data) - 1, total)})
+
+
+def sink_for(target):
+    """ HttpSink for http:// and unix:// targets, DirectorySink otherwise """
+    if target.startswith('http://') or target.startswith('unix://'):
+        return HttpSink(target)
+    return DirectorySink(os.path.expanduser(target))
+
+
+class Spooler:
+    """ Packages the rows and media recorded since the last segment, and
+        ships the segments to a sink. Nothing here waits on the sink: when
+        it is unreachable attempts back off exponentially, and once the
+        spool holds max_bytes no new segments are written, the data stays
+        in the database until there is room again. """
+
+    def __init__(self, db_path, data_dir, spool_dir, sink, host=None,
+                 max_bytes=SPOOL_MAX_BYTES, rows=SEGMENT_ROWS):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.spool_dir = spool_dir
+        self.sink = sink
+        self.host = host or socket.gethostname()
+        self.max_bytes = max_bytes
+        self.rows = rows
+        self.failures = 0
+        self.next_attempt = 0
+
+        if not os.path.isdir(spool_dir):
+            os.makedirs(spool_dir)
+        self.watermark_path = os.path.join(spool_dir, WATERMARK_FILE)
+        self.watermarks = {}
+        if os.path.exists(self.watermark_path):
+            with open(self.watermark_path) as f:
+                self.watermarks = json.load(f)
+
+    def segments(self):
+        """ names of the segments waiting to be shipped, oldest first """
+        return sorted(n for n in os.listdir(self.spool_dir) if SEGMENT.match(n))
+
+    def spool_size(self):
+        return sum(os.path.getsize(os.path.join(self.spool_dir, n)) for n in self.segments())
+
+    def run(self):
+        """ packages and ships what it can, unless backing off after a
+            failure. Returns the number of segments shipped. """
+        if time.time() < self.next_attempt:
+            return 0
+        while self.spool_size() < self.max_bytes and self.package():
+            pass
+        try:
+            shipped = self.ship()
+        except (IOError, OSError, socket.error, httplib.HTTPException) as e:
+            self.failures += 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+            self.next_attempt = time.time() + delay * random.uniform(0.5, 1.0)
+            print "Could not ship spooled data, retrying in %d s: %s" % (self.next_attempt - time.time(), e)
+            return 0
+        self.failures = 0
+        return shipped
+
+    # packaging
+
+    def read(self):
+        """ (tables, media, watermarks) of the next segment, following the
+            change feed like aggregator.read_feed, media being the
+            [seq, id, created_at, kind, filename] of the files indexed.
+            A segment is cut after SEGMENT_MEDIA_BYTES of files, None if
+            nothing was recorded since the last one. """
+        from selfspy.aggregator import DIMENSIONS, EVENTS, read_feed
+
+        feed = read_feed(self.db_path, self.watermarks, self.rows, DIMENSIONS + EVENTS + (MEDIA,))
+        if feed is None:
+            return None
+        tables, marks = feed
+        media = tables.pop('mediafile', [])
+
+        size = 0
+        for i, (seq, media_id, _, kind, filename) in enumerate(media):
+            if i and size > SEGMENT_MEDIA_BYTES:
+                media = media[:i]
+                if seq < 0:
+                    # files indexed before the first segment, read by id
+                    marks['history:mediafile'] = media[-1][1]
+                else:
+                    tables = dict((t, [r for r in rows if r[0] < seq]) for t, rows in tables.items())
+                    tables = dict((t, rows) for t, rows in tables.items() if rows)
+                    marks['change'] = seq - 1
+                break
+            try:
+                size += os.path.getsize(os.path.join(self.data_dir, kind, filename))
+            except OSError:
+                pass  # removed by a retention policy since
+        return tables, media, marks
+
+    def package(self):
+        """ writes the next segment, False if nothing was recorded since
+            the last one """
+        new = self.read()
+        if new is None:
+            return False
+        tables, media, marks = new
+
+        seq = self.watermarks.get('segment', 0) + 1
+        tmp = os.path.join(self.spool_dir, 'segment.tmp')
+        with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as segment:
+            segment.writestr('rows.json', json.dumps({'host': self.host, 'segment': seq,
+                                                      'tables': tables}))
+            for _, _, _, kind, filename in media:
+                path = os.path.join(self.data_dir, kind, filename)
+                if os.path.isfile(path):
+                    # already compressed, deflating them again only costs time
+                    segment.write(path, '%s/%s' % (kind, filename), zipfile.ZIP_STORED)
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.rename(tmp, os.path.join(self.spool_dir, 'segment-%08d-%s.zip' % (seq, checksum(tmp))))
+
+        self.watermarks = marks
+        self.watermarks['segment'] = seq
+        self.save_watermarks()
+        return True
+
+    def save_watermarks(self):
+        tmp = self.watermark_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.watermarks, f, indent=1, sort_keys=True)
+        os.rename(tmp, self.watermark_path)
+
+    # shipping
+
+    def ship(self):
+        """ sends the spooled segments oldest first, resuming each where
+            the sink left off, and removes them once received """
+        shipped = 0
+        for name in self.segments():
+            path = os.path.join(self.spool_dir, name)
+            offset = self.sink.received(name)
+            if offset is not None:
+                total = os.path.getsize(path)
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    while offset < total:
+                        data = f.read(CHUNK_BYTES)
+                        self.sink.write(name, offset, data, total)
+                        offset += len(data)
+            os.remove(path)
+            shipped += 1
+        return shipped
+
+
+class ReceiverHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def segment_name(self):
+        name = self.path[len('/spool/'):]
+        if not self.path.startswith('/spool/') or not SEGMENT.match(name):
+            self.send_error(404)
+            return None
+        return name
+
+    def do_HEAD(self):
+        name = self.segment_name()
+        if name is None:
+            return
+        received = self.server.sink.received(name)
+        self.send_response(200)
+        self.send_header('X-Received', 'all' if received is None else str(received))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_PUT(self):
+        name = self.segment_name()
+        if name is None:
+            return
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+)$', self.headers.getheader('Content-Range', ''))
+        if match is None:
+            return self.send_error(400)
+        offset, total = int(match.group(1)), int(match.group(3))
+        data = self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        try:
+            with self.server.lock:
+                self.server.sink.write(name, offset, data, total)
+        except IOError as e:
+            return self.send_error(409, str(e))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Receiver(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ stands in for a collection server, storing segments in a directory """
+    daemon_threads = True
+
+    def __init__(self, address, directory):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ReceiverHandler)
+        self.sink = DirectorySink(directory)
+        self.lock = threading.Lock()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Receive the segments spooled '
+        'by selfspy recorders into a directory.')
+    parser.add_argument('--dir', required=True, help='Directory to store segments in')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    server = Receiver((args.host, args.port), args.dir)
+    print "Receiving segments into %s on %s:%d" % (args.dir, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
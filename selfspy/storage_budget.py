@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import threading
+
+from selfspy import config as cfg
+
+# tiers, each recording less than the one before
+NORMAL = 0
+REDUCED = 1  # smaller screenshots, taken less often
+MINIMAL = 2  # no screenshots, no mouse paths or key timings
+ROLLUPS = 3  # only window and process changes and typing counts
+
+TIER_NAMES = ('normal', 'reduced', 'minimal', 'rollups')
+
+# screenshot size and minimum interval factors of each tier
+SCREENSHOT_SCALE = (1.0, 0.5, 0, 0)
+SCREENSHOT_INTERVAL = (1, 4, None, None)
+
+CHECK_INTERVAL = 10  # seconds between two looks at the free space
+USAGE_INTERVAL = 600  # seconds between two walks of the data directory
+HYSTERESIS = 1.1  # a tier is left once there is 10% more room than its threshold
+MB = 1024 * 1024
+
+
+def free_bytes(path):
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+def directory_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class StorageBudget:
+    """ Chooses how much to record from the free space on the data drive
+        and the space selfspy uses, so recording degrades a step at a time
+        instead of stopping when the disk is full. The thresholds are the
+        STORAGE_* settings of config.
+
+        Free space is looked at every CHECK_INTERVAL seconds, the data
+        directory is only walked every USAGE_INTERVAL seconds, in a thread
+        of its own so the recorder does not wait for it, with the files
+        written in between added as they are noted. """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.tier = NORMAL
+        self.last_check = 0
+        self.last_usage = 0
+        self.free = None
+        self.usage = 0
+        self.noted = 0  # bytes noted since the walk in progress started
+        self.walker = None
+        self.since = time.time()
+        self.seconds = [0.0] * len(TIER_NAMES)  # time spent in each tier
+        self.changes = 0
+
+    def note_written(self, path):
+        """ adds a file just written to the usage """
+        try:
+            size = os.path.getsize(path)
+        except (OSError, TypeError):
+            return
+        self.usage += size
+        self.noted += size
+
+    def walk(self):
+        """ updates the usage from a walk of the data directory, in a
+            thread unless one is still walking """
+        if self.walker is not None and self.walker.is_alive():
+            return
+        self.noted = 0
+
+        def walk():
+            size = directory_size(self.data_dir)
+            self.usage = size + self.noted
+
+        self.walker = threading.Thread(target=walk)
+        self.walker.daemon = True
+        self.walker.start()
+
+    def thresholds(self):
+        """ [(tier, free space below which it applies, share of the usage
+            budget above which it applies)], most degraded first """
+        return [(ROLLUPS, cfg.STORAGE_ROLLUPS_MB * MB, 1.0),
+                (MINIMAL, cfg.STORAGE_MINIMAL_MB * MB, 0.95),
+                (REDUCED, cfg.STORAGE_REDUCED_MB * MB, 0.8)]
+
+    def check(self, force=False):
+        """ the current tier, after updating it if it is time to """
+        now = time.time()
+        if not force and now - self.last_check < CHECK_INTERVAL:
+            return self.tier
+        self.last_check = now
+        try:
+            self.free = free_bytes(self.data_dir)
+        except OSError:
+            return self.tier
+        if cfg.STORAGE_BUDGET_MB is not None and (force or now - self.last_usage > USAGE_INTERVAL):
+            self.walk()
+            self.last_usage = now
+
+        tier = NORMAL
+        for candidate, min_free, share in self.thresholds():
+            # staying in a tier takes less than entering it, so recording
+            # does not switch back and forth around a threshold
+            margin = HYSTERESIS if candidate <= self.tier else 1.0
+            if self.free < min_free * margin or self.over_budget(share / margin):
+                tier = candidate
+                break
+        if tier != self.tier:
+            self.set_tier(tier, now)
+        return self.tier
+
+    def over_budget(self, share):
+        if cfg.STORAGE_BUDGET_MB is None:
+            return False
+        return self.usage >= cfg.STORAGE_BUDGET_MB * MB * share
+
+    def set_tier(self, tier, now=None):
+        now = now or time.time()
+        self.seconds[self.tier] += now - self.since
+        self.since = now
+        self.changes += 1
+        print "Storage: %d MB free, %d MB used, recording %s data" % (
+            (self.free or 0) / MB, self.usage / MB, TIER_NAMES[tier])
+        self.tier = tier
+
+    def metrics(self):
+        """ the active tier, space figures and seconds spent in each tier """
+        seconds = list(self.seconds)
+        seconds[self.tier] += time.time() - self.since
+        return {'tier': TIER_NAMES[self.tier],
+                'free_bytes': self.free,
+                'usage_bytes': self.usage,
+                'tier_changes': self.changes,
+                'seconds': dict(zip(TIER_NAMES, seconds))}
+
+    # what to record
+
+    def screenshot_scale(self):
+        return SCREENSHOT_SCALE[self.check()]
+
+    def screenshot_interval(self, interval):
+        """ the minimum interval between screenshots, None if none should be taken """
+        factor = SCREENSHOT_INTERVAL[self.check()]
+        return None if factor is None else interval * factor
+
+    def mouse_paths(self):
+        return self.check() < MINIMAL
+
+    def key_timings(self):
+        return self.check() < MINIMAL
+
+    def raw_events(self):
+        """ clicks, locations and snapshots """
+        return self.check() < ROLLUPS
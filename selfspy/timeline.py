@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Selfspy: Track your computer activity
+Copyright (C) 2012 Bjarte Johansen
+Modified 2014 by Adam Rule, Aurélien Tabard, and Jonas Keper
+
+Selfspy is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Selfspy is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Selfspy. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import calendar
+import datetime
+
+from sqlalchemy import func, or_
+
+from selfspy.models import ProcessInterval
+
+
+def to_seconds(s):
+    """ Converts a created_at string to seconds. Like the reviewer, the local
+        time is read as if it were UTC. """
+    if '.' in s:
+        dt = datetime.datetime.strptime(s, '%Y-%m-%d %H:%M:%S.%f')
+    else:
+        dt = datetime.datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
+    return calendar.timegm(dt.timetuple()) + dt.microsecond / 1e6
+
+
+def now_seconds():
+    return to_seconds(str(datetime.datetime.now()))
+
+
+def mark(interval):
+    """ what tells an interval apart once it was written, None for none """
+    if interval is None:
+        return None
+    return interval.id, interval.start_event_id, interval.end_event_id
+
+
+def created_at(t):
+    """ the created_at string of t in seconds, the inverse of to_seconds """
+    return unicode(datetime.datetime.utcfromtimestamp(t))
+
+
+def last_activation(session, partitions, before):
+    """ created_at of the last Active window event before the created_at
+        string before, None if there is none """
+    sql = ("SELECT max(created_at) FROM windowevent "
+           "WHERE event_type = 'Active' AND created_at < :t")
+    if partitions is None:
+        return session.execute(sql, {'t': before}).scalar()
+    found = [row[0] for row in partitions.select(sql, {'t': before}, until=before, session=session)]
+    return max([t for t in found if t is not None] or [None])
+
+
+def window_events(session, partitions, since, until):
+    """ (id, window_id, event_type, created_at) of the window events
+        created between the created_at strings since and until, in id order """
+    sql = ("SELECT id, window_id, event_type, created_at FROM windowevent "
+           "WHERE created_at >= :s AND created_at <= :u ORDER BY id")
+    params = {'s': since, 'u': until}
+    if partitions is None:
+        return session.execute(sql, params)
+    return partitions.select(sql, params, since=since, until=until, session=session)
+
+
+def events_since(session, partitions, table, owner, watermark):
+    """ (id, owner id, event_type, created_at) of the rows of an event
+        table with an id above watermark, in id order, read from all
+        partitions if the database is partitioned """
+    sql = ("SELECT id, %s, event_type, created_at FROM %s WHERE id > :w ORDER BY id"
+           % (owner, table))
+    if partitions is None:
+        return session.execute(sql, {'w': watermark})
+    return partitions.select_since(table, watermark, sql, {'w': watermark}, session)
+
+
+class Timeline:
+    """ Active periods of processes, materialized from ProcessEvent rows
+        into the indexed ProcessInterval table. Only events written since the
+        last refresh are read: the last interval tells which events it was
+        made from, and the highest event id read is remembered along with
+        it, so events that neither start nor end an interval are not read
+        again. """
+
+    def __init__(self, session, partitions=None):
+        self.session = session
+        self.partitions = partitions
+        self.read = None  # (mark of the last interval, highest event id read)
+
+    def reset(self):
+        """ forgets the events read, after some of them were deleted """
+        self.read = None
+
+    def refresh(self):
+        last = self.session.query(ProcessInterval).order_by(ProcessInterval.id.desc()).first()
+        watermark = 0
+        current = None
+        if last:
+            watermark = max(last.start_event_id, last.end_event_id or 0)
+            if last.end_time is None:
+                current = last
+        if self.read and self.read[0] == mark(last):
+            watermark = max(watermark, self.read[1])
+
+        events = events_since(self.session, self.partitions, 'processevent', 'process_id', watermark)
+
+        changed = False
+        for event_id, process_id, event_type, created_at in events:
+            watermark = event_id
+            if event_type == "Active":
+                t = to_seconds(created_at)
+                if current:
+                    self.close(current, t, event_id)
+                current = last = ProcessInterval(process_id, t, event_id)
+                self.session.add(current)
+                changed = True
+            elif event_type in ("Inactive", "Close"):
+                if current and current.process_id == process_id:
+                    self.close(current, to_seconds(created_at), event_id)
+                    current = None
+                    changed = True
+
+        if changed:
+            self.session.commit()
+        self.read = (mark(last), watermark)
+
+    def close(self, interval, t, event_id):
+        # pauses are written after the fact and can end before the last start
+        interval.end_time = max(t, interval.start_time)
+        interval.end_event_id = event_id
+
+    def bounds(self):
+        """ (first start, last end) in seconds, None if nothing was recorded """
+        first, last = self.session.query(func.min(ProcessInterval.start_time),
+                                         func.max(ProcessInterval.end_time)).one()
+        if first is None:
+            return None
+        still_open = (self.session.query(ProcessInterval.id)
+                      .filter(ProcessInterval.end_time == None).first())
+        if still_open or last is None:
+            last = max(last, now_seconds())
+        return first, last
+
+    def intervals(self, t0, t1):
+        """ (process_id, start, end) of the intervals overlapping [t0, t1] """
+        now = None
+        q = (self.session.query(ProcessInterval.process_id,
+                                ProcessInterval.start_time,
+                                ProcessInterval.end_time)
+             .filter(ProcessInterval.start_time < t1)
+             .filter(or_(ProcessInterval.end_time > t0,
+                         ProcessInterval.end_time == None))
+             .order_by(ProcessInterval.start_time))
+        for process_id, start, end in q:
+            if end is None:
+                if now is None:
+                    now = now_seconds()
+                end = now
+            yield process_id, max(start, t0), min(end, t1)
+
+    def segments(self, t0, t1, resolution):
+        """ Downsamples the intervals overlapping [t0, t1] to `resolution`
+            columns, each owned by the process active longest in it, and
+            merges neighbouring columns of the same process. Returns at most
+            `resolution` (process_id, start, end) segments. """
+        if t1 <= t0 or resolution < 1:
+            return []
+        width = (t1 - t0) / float(resolution)
+        owner = [None] * resolution
+        coverage = [0.0] * resolution
+
+        for process_id, start, end in self.intervals(t0, t1):
+            first = min(int((start - t0) / width), resolution - 1)
+            last = min(int((end - t0) / width), resolution - 1)
+            for col in xrange(first, last + 1):
+                col_start = t0 + col * width
+                covered = min(end, col_start + width) - max(start, col_start)
+                if covered > coverage[col]:
+                    coverage[col] = covered
+                    owner[col] = process_id
+
+        segments = []
+        col = 0
+        while col < resolution:
+            process_id = owner[col]
+            run_start = col
+            while col < resolution and owner[col] == process_id:
+                col += 1
+            if process_id is not None:
+                segments.append((process_id, t0 + run_start * width, t0 + col * width))
+        return segments
+
+
+class ActiveWindows:
+    """ Which window was active at a given time between since and until,
+        both in seconds, answered by a binary search over the activation
+        periods read from the WindowEvent rows of that range. Only the
+        range being reviewed is read, the query service builds another one
+        when the reviewer moves out of it. """
+
+    def __init__(self, session, partitions=None, since=0, until=None):
+        self.since = since
+        self.until = now_seconds() if until is None else until
+        self.starts = []
+        self.ends = []  # None while the window is still active
+        self.window_ids = []
+        self.current = None  # index of the period still open
+
+        # the period going on at since started with the last activation
+        # before it
+        first = last_activation(session, partitions, created_at(self.since)) or created_at(self.since)
+        events = window_events(session, partitions, first, created_at(self.until))
+        for event_id, window_id, event_type, created in events:
+            if event_type == "Active":
+                t = to_seconds(created)
+                if self.current is not None:
+                    self.close(t)
+                self.current = self.insert(t, window_id)
+            elif event_type in ("Inactive", "Close"):
+                if self.current is not None and self.window_ids[self.current] == window_id:
+                    self.close(to_seconds(created))
+
+    def covers(self, t):
+        return self.since <= t <= self.until
+
+    def insert(self, t, window_id):
+        # events written after a pause can be older than the last start
+        i = bisect.bisect_right(self.starts, t)
+        self.starts.insert(i, t)
+        self.ends.insert(i, None)
+        self.window_ids.insert(i, window_id)
+        return i
+
+    def close(self, t):
+        i = self.current
+        self.ends[i] = max(t, self.starts[i])
+        self.current = None
+
+    def at(self, t):
+        """ id of the window active at t in seconds, None if there was none """
+        i = bisect.bisect_right(self.starts, t) - 1
+        if i < 0:
+            return None
+        end = self.ends[i]
+        if end is not None and end < t:
+            return None
+        return self.window_ids[i]
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from selfspy import aggregator, models
+from selfspy.aggregator import FleetStore, Uploader
+from selfspy.models import Process, Window, WindowEvent, ProcessEvent
+from selfspy.retention import RetentionEngine
+
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.dir, 'selfspy.sqlite')
+        self.session = models.initialize(self.db_path)()
+        self.store = FleetStore(os.path.join(self.dir, 'fleet.sqlite'))
+        self.uploader = Uploader(self.db_path, None, host=u'laptop', rows=3)
+        self.minute = 0
+
+    def tearDown(self):
+        self.session.close()
+        self.store.conn.close()
+        shutil.rmtree(self.dir)
+
+    def upload(self):
+        """ what Uploader.upload does, without HTTP in between """
+        marks = self.store.watermarks(u'laptop')
+        while True:
+            batch = self.uploader.batch(marks)
+            if batch is None:
+                return
+            marks = self.store.apply(aggregator.unpack(aggregator.pack(batch)))
+
+    def record(self, app, title, events=2):
+        """ a process and window with a few events, returns the window id """
+        process = self.session.query(Process).filter_by(name=app).first()
+        if process is None:
+            process = Process(app)
+            self.session.add(process)
+            self.session.flush()
+        window = Window(title, process.id, u'')
+        self.session.add(window)
+        self.session.flush()
+        for _ in range(events):
+            self.minute += 1
+            at = u'2014-05-01 %02d:%02d:00' % (10 + self.minute // 60, self.minute % 60)
+            self.session.add(ProcessEvent(process.id, u'Active', at))
+            self.session.add(WindowEvent(window.id, u'Active', at))
+        self.session.commit()
+        return window.id
+
+    def uploaded(self):
+        """ (process name, window title) of every window event stored """
+        return sorted(self.store.conn.execute(
+            'SELECT p.name, w.title FROM windowevent e JOIN window w ON w.id = e.window_id '
+            'JOIN process p ON p.id = w.process_id'))
+
+    def test_upload_once(self):
+        self.record(u'Safari', u'News', events=5)
+        self.upload()
+        self.upload()
+        self.assertEqual(self.uploaded(), [(u'Safari', u'News')] * 5)
+
+    def test_history(self):
+        # rows recorded before the feed existed, or before the first upload
+        self.session.execute('DROP TRIGGER change_windowevent')
+        self.record(u'Safari', u'News', events=4)
+        models.create_feed_triggers(self.session.connection(), ['windowevent'])
+        self.session.commit()
+        self.upload()
+        self.record(u'Safari', u'News', events=2)
+        self.upload()
+        self.assertEqual(self.uploaded(), [(u'Safari', u'News')] * 6)
+
+    def test_purge_record_upload(self):
+        self.record(u'Safari', u'News')
+        self.upload()
+        # new rows now get the ids of the deleted ones
+        retention = RetentionEngine(self.session)
+        retention.purge_since(None)
+        retention.run_all()
+        self.assertEqual(self.record(u'Mail', u'Inbox', events=3), 1)
+        self.upload()
+        self.assertEqual(self.uploaded(), [(u'Mail', u'Inbox')] * 3 + [(u'Safari', u'News')] * 2)
+
+    def test_purge_before_upload(self):
+        self.record(u'Safari', u'News')
+        self.upload()
+        self.record(u'Safari', u'Private', events=2)
+        retention = RetentionEngine(self.session)
+        retention.purge_since(u'2014-05-01 10:02:00')
+        retention.run_all()
+        self.record(u'Mail', u'Inbox', events=1)
+        self.upload()
+        self.assertEqual(self.uploaded(), [(u'Mail', u'Inbox')] + [(u'Safari', u'News')] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from selfspy.buffers import KeyBuffer, MousePath
+
+
+class KeyBufferTest(unittest.TestCase):
+
+    def test_plain_keys(self):
+        keys = KeyBuffer()
+        for i, key in enumerate('abc'):
+            keys.append(key, float(i), i == 2)
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(keys.filtered(), ([0.0, 1.0, 2.0], 2))
+
+    def test_special_runs_collapse(self):
+        keys = KeyBuffer()
+        for i, key in enumerate(['a', 'Shift_L', 'Shift_L', 'Shift_L', 'b', 'Up', 'Down']):
+            keys.append(key, float(i), False)
+        # a run of the same special key keeps its last press
+        self.assertEqual(keys.filtered(), ([0.0, 3.0, 4.0, 5.0, 6.0], 5))
+
+    def test_grows(self):
+        keys = KeyBuffer(capacity=2)
+        for i in range(5):
+            keys.append('a', float(i), False)
+        self.assertEqual(keys.filtered(), ([0.0, 1.0, 2.0, 3.0, 4.0], 5))
+
+    def test_clear(self):
+        keys = KeyBuffer()
+        keys.append('Return', 1.0, False)
+        keys.clear()
+        keys.append('a', 2.0, False)
+        self.assertFalse(keys.has_special)
+        self.assertEqual(keys.filtered(), ([2.0], 1))
+
+
+class MousePathTest(unittest.TestCase):
+
+    def test_path(self):
+        path = MousePath()
+        path.append(1, 2, 0.5)
+        path.append(3, 4, 1.5)
+        self.assertEqual(path.path(), [[1.0, 2.0], [3.0, 4.0]])
+        self.assertEqual(path.timings(), [0.5, 1.5])
+
+    def test_overwrites_oldest(self):
+        path = MousePath(capacity=3)
+        for i in range(5):
+            path.append(i, -i, float(i))
+        self.assertEqual(len(path), 3)
+        self.assertEqual(path.path(), [[2.0, -2.0], [3.0, -3.0], [4.0, -4.0]])
+        self.assertEqual(path.timings(), [2.0, 3.0, 4.0])
+        path.clear()
+        self.assertEqual(path.path(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
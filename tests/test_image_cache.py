@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+
+from selfspy.image_cache import ImageCache
+
+
+class ImageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.names = ['%02d.jpg' % i for i in range(10)]
+        for name in self.names:
+            with open(os.path.join(self.dir, name), 'wb') as f:
+                f.write('screenshot %s' % name)
+        self.thumbnailed = []
+        self.delay = 0
+        self.cache = ImageCache(self.dir, thumbnailer=self.thumbnail, budget=100)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def thumbnail(self, src, dst):
+        self.thumbnailed.append(os.path.basename(src))
+        with open(dst, 'wb') as f:
+            f.write('thumb ')
+            time.sleep(self.delay)  # half written for a while
+            f.write(os.path.basename(src))
+        return True
+
+    def loaded(self, names, timeout=5):
+        end = time.time() + timeout
+        while time.time() < end:
+            with self.cache.lock:
+                if all(name in self.cache.images for name in names):
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def test_thumbnail(self):
+        self.assertEqual(self.cache.get('00.jpg'), 'thumb 00.jpg')
+        self.assertEqual(self.cache.get('00.jpg'), 'thumb 00.jpg')
+        self.assertEqual(self.thumbnailed, ['00.jpg'])
+        self.assertEqual(os.listdir(self.cache.thumbnail_directory), ['00.jpg'])
+
+    def test_failed_thumbnail(self):
+        def fail(src, dst):
+            with open(dst, 'wb') as f:
+                f.write('half')
+            return False
+        cache = ImageCache(self.dir, thumbnailer=fail)
+        # the screenshot itself, and no thumbnail left behind
+        self.assertEqual(cache.get('00.jpg'), 'screenshot 00.jpg')
+        self.assertEqual(os.listdir(cache.thumbnail_directory), [])
+
+    def test_lru_eviction(self):
+        # 12 bytes each, 100 bytes hold 8 of them
+        for name in self.names[:8]:
+            self.cache.get(name)
+        self.cache.get('00.jpg')
+        self.cache.get('08.jpg')
+        self.assertEqual(list(self.cache.images), self.names[2:8] + ['00.jpg', '08.jpg'])
+        self.assertTrue(self.cache.used <= 100)
+
+    def test_prefetch_order(self):
+        self.cache.prefetch(self.names, 5, direction=-1)
+        self.assertTrue(self.loaded(['04.jpg', '03.jpg', '02.jpg', '01.jpg', '06.jpg', '07.jpg']))
+        self.assertEqual(self.thumbnailed, ['04.jpg', '03.jpg', '02.jpg', '01.jpg', '06.jpg', '07.jpg'])
+
+    def test_get_while_prefetching(self):
+        self.delay = 0.2
+        self.cache.prefetch(self.names, 0)
+        images = []
+        threads = [threading.Thread(target=lambda: images.append(self.cache.get('01.jpg')))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(images, ['thumb 01.jpg'] * 3)
+        self.assertTrue(self.loaded(['02.jpg', '03.jpg', '04.jpg']))
+        self.assertEqual(sorted(self.thumbnailed), ['01.jpg', '02.jpg', '03.jpg', '04.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from selfspy.keystats import KeyStats, IKI_COLUMNS
+
+
+class KeyStatsTest(unittest.TestCase):
+
+    def test_empty(self):
+        stats = KeyStats()
+        self.assertEqual(stats.wpm(), 0.0)
+        self.assertEqual(stats.backspace_ratio(), 0.0)
+        self.assertEqual(stats.columns()['nrpresses'], 0)
+
+    def test_bursts_and_typing_time(self):
+        stats = KeyStats()
+        for key, interval in [('a', 0), ('b', 0.15), ('c', 0.25), ('d', 3.0), ('e', 0.5)]:
+            stats.add(key, interval, False)
+        # the first press and the one after a 3s pause start bursts, the
+        # intervals between them are typing time
+        self.assertEqual(stats.bursts, 2)
+        self.assertAlmostEqual(stats.typing_time, 0.9)
+        self.assertAlmostEqual(stats.wpm(), (5 / 5.0) / (0.9 / 60))
+
+    def test_histogram(self):
+        stats = KeyStats()
+        for interval in [0.05, 0.1, 0.15, 0.3, 0.5, 1.0, 2.0]:
+            stats.add('a', interval, False)
+        columns = stats.columns()
+        self.assertEqual([columns[c] for c in IKI_COLUMNS], [2, 1, 1, 1, 1, 1])
+
+    def test_backspaces_and_repeats(self):
+        stats = KeyStats()
+        stats.add('a', 0.1, False)
+        stats.add('Backspace', 0.1, False)
+        stats.add('Backspace', 0.05, True)
+        stats.add('BackSpace', 0.1, False)
+        self.assertEqual(stats.backspaces, 3)
+        self.assertEqual(stats.nonrepeats, 3)
+        self.assertAlmostEqual(stats.backspace_ratio(), 0.75)
+
+    def test_reset(self):
+        stats = KeyStats()
+        stats.add('a', 0.1, False)
+        stats.reset()
+        self.assertEqual(stats.columns()['nrpresses'], 0)
+        self.assertEqual(stats.iki_hist, [0] * len(IKI_COLUMNS))
+
+
+if __name__ == '__main__':
+    unittest.main()
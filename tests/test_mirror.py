@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from selfspy import mirror
+from selfspy.mirror import Mirror, Throttle, read_consistent
+
+
+class MirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.dir, 'data')
+        self.volume = os.path.join(self.dir, 'volume')
+        os.makedirs(self.data_dir)
+        os.makedirs(self.volume)
+        self.db_path = os.path.join(self.data_dir, 'selfspy.sqlite')
+        self.conn = sqlite3.connect(self.db_path, timeout=0)
+        self.conn.execute('CREATE TABLE row (id INTEGER PRIMARY KEY, text TEXT)')
+        self.conn.execute('CREATE TABLE mediafile (id INTEGER PRIMARY KEY, kind TEXT, filename TEXT)')
+        self.insert(200)
+        # a lock per block, so there is room for commits in between
+        self.addCleanup(setattr, mirror, 'CHUNK_BLOCKS', mirror.CHUNK_BLOCKS)
+        mirror.CHUNK_BLOCKS = 1
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.dir)
+
+    def insert(self, n):
+        self.conn.executemany('INSERT INTO row (text) VALUES (?)', [('x' * 1000,)] * n)
+        self.conn.commit()
+
+    def copy(self, commits):
+        """ the copy read_consistent makes while committing commits times
+            in between its reads, and the checksums it returned """
+        copy = os.path.join(self.dir, 'copy.sqlite')
+        left = [commits]
+
+        def write(path, offset, data):
+            # timeout=0, raises if the read held the lock
+            if left[0]:
+                left[0] -= 1
+                self.insert(20)
+            with open(copy, 'r+b' if os.path.exists(copy) else 'wb') as f:
+                f.seek(offset)
+                f.write(data)
+
+        sums, size = read_consistent([self.db_path], {}, write)[self.db_path]
+        with open(copy, 'r+b') as f:
+            f.truncate(size)
+        return copy, sums
+
+    def rows(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            self.assertEqual(conn.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+            return conn.execute('SELECT count(*) FROM row').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_commits_in_between(self):
+        copy, sums = self.copy(commits=3)
+        self.assertEqual(self.rows(copy), 260)
+        self.assertEqual(os.path.getsize(copy), os.path.getsize(self.db_path))
+        self.assertEqual(len(sums), -(-os.path.getsize(copy) // mirror.BLOCK_SIZE))
+
+    def test_files_at_one_time(self):
+        other = os.path.join(self.data_dir, 'selfspy-2014-05.sqlite')
+        conn = sqlite3.connect(other)
+        conn.execute('CREATE TABLE row (id INTEGER PRIMARY KEY, text TEXT)')
+        conn.commit()
+        copies = {}
+        left = [2]
+
+        def write(path, offset, data):
+            # commits to the partition while reading the main file
+            if path == self.db_path and left[0]:
+                left[0] -= 1
+                conn.execute('INSERT INTO row (text) VALUES (?)', ('x' * 1000,))
+                conn.commit()
+            copies.setdefault(path, {})[offset] = data
+
+        read = read_consistent([self.db_path, other], {}, write)
+        conn.close()
+        copy = os.path.join(self.dir, 'copy.sqlite')
+        with open(copy, 'wb') as f:
+            for offset, data in sorted(copies[other].items()):
+                f.seek(offset)
+                f.write(data)
+            f.truncate(read[other][1])
+        self.assertEqual(self.rows(copy), 2)
+
+    def test_last_pass_holds_lock(self):
+        # commits in every pass, the last one is read under the lock
+        self.assertRaises(sqlite3.OperationalError, self.copy, commits=100)
+
+    def test_mirror(self):
+        volumes = Mirror(self.data_dir, 'selfspy.sqlite', os.path.join(self.dir, 'state'))
+        volumes.run(self.volume)
+        target = os.path.join(self.volume, 'selfspy.sqlite')
+        self.assertEqual(self.rows(target), 200)
+        self.insert(5)
+        state = volumes.load_state(volumes.mirror_id(self.volume))
+        volumes.mirror_db(self.volume, 'selfspy.sqlite', state, Throttle(volumes.rate))
+        self.assertEqual(self.rows(target), 205)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import event
+
+from selfspy import models
+from selfspy.models import Process, Window
+from selfspy.names import NameCache
+
+
+class NameCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.session = models.initialize(os.path.join(self.dir, 'test.sqlite'))()
+        self.safari = self.add(Process(u'Safari'))
+        self.add(Window(u'Home', self.safari.id, None))
+        self.names = NameCache(self.session)
+        self.queries = []
+        event.listen(self.session.bind, 'before_cursor_execute', self.executed)
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.dir)
+
+    def executed(self, conn, cursor, statement, *args):
+        self.queries.append(statement)
+
+    def add(self, row):
+        self.session.add(row)
+        self.session.commit()
+        return row
+
+    def test_lookups(self):
+        self.assertEqual(self.names.process_id(u'Safari'), self.safari.id)
+        self.assertEqual(self.names.process_name(self.safari.id), u'Safari')
+        self.assertEqual(self.names.window_info(1), (u'Home', self.safari.id, None))
+
+    def test_process_miss_reads_processes_only(self):
+        del self.queries[:]
+        self.assertEqual(self.names.process_id(u'loginwindow'), None)
+        self.assertEqual(len(self.queries), 1)
+        self.assertTrue('FROM process' in self.queries[0])
+
+    def test_miss_remembered(self):
+        self.names.process_id(u'loginwindow')
+        del self.queries[:]
+        for _ in range(3):
+            self.assertEqual(self.names.process_id(u'loginwindow'), None)
+        self.assertEqual(self.queries, [])
+
+    def test_miss_forgotten_once_rows_added(self):
+        self.names.process_id(u'Mail')
+        mail = self.add(Process(u'Mail'))
+        # still remembered as missing, until a new row is seen
+        self.assertEqual(self.names.process_id(u'Mail'), None)
+        self.names.add_process(mail.id, mail.name)
+        self.assertEqual(self.names.process_id(u'Mail'), mail.id)
+
+        self.names.process_id(u'Notes')
+        notes = self.add(Process(u'Notes'))
+        self.names.process_name(notes.id)
+        self.assertEqual(self.names.process_id(u'Notes'), notes.id)
+
+    def test_invalidate(self):
+        self.names.process_id(u'Mail')
+        self.names.invalidate()
+        mail = self.add(Process(u'Mail'))
+        self.assertEqual(self.names.process_id(u'Mail'), mail.id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from selfspy import partitions
+from selfspy.models import Click
+
+
+class PartitionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.sqlite')
+        session_maker, self.partitions = partitions.initialize(self.path)
+        self.session = session_maker()
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.dir)
+
+    def insert(self, month, n):
+        engine = self.partitions.engine(month)
+        for i in range(n):
+            engine.execute("INSERT INTO click (button, press, x, y, nrmoves, timings, path, "
+                           "process_id, window_id, geometry_id, created_at) "
+                           "VALUES (1, 1, 0, 0, 0, '', '', 1, 1, 1, ?)", (u'%s-01 10:00:%02d' % (month, i),))
+
+    def test_ids_continue(self):
+        self.insert('2014-01', 3)
+        self.insert('2014-02', 2)
+        ids = [row[0] for row in self.partitions.select("SELECT id FROM click ORDER BY id")]
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+        self.assertEqual(self.partitions.months(since=u'2014-02-01', until=u'2014-12-31'), ['2014-02'])
+
+    def test_select_since(self):
+        self.insert('2014-01', 3)
+        self.insert('2014-02', 2)
+        sql = "SELECT id FROM click WHERE id > :w ORDER BY id"
+        rows = self.partitions.select_since('click', 3, sql, {'w': 3}, self.session)
+        self.assertEqual([row[0] for row in rows], [4, 5])
+
+    def test_current_month_attached(self):
+        self.session.add(Click(1, True, 0, 0, 0, [], [], 1, 1, 1))
+        self.session.commit()
+        path = self.partitions.path(partitions.current_month())
+        count = self.partitions.engine(partitions.current_month()).execute("SELECT count(*) FROM click").scalar()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(count, 1)
+
+    def test_engine_created_once(self):
+        engines = []
+        threads = [threading.Thread(target=lambda: engines.append(self.partitions.engine('2014-03')))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(map(id, engines))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
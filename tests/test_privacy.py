@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import datetime
+import unittest
+
+from selfspy.privacy import PrivacyFilter, GeofenceIndex, combine, quiet_week, distance
+
+
+def timestamp(*args):
+    return float(datetime.datetime(*args).strftime('%s'))
+
+
+class PrivacyTest(unittest.TestCase):
+
+    def test_patterns_regardless_of_case(self):
+        for patterns in ([r'private browsing'], [r'Private Browsing'], [r'PRIVATE', r'incognito']):
+            search = combine(patterns)
+            self.assertTrue(search(u'Safari - Private Browsing'))
+            self.assertTrue(search(u'safari - PRIVATE BROWSING'))
+            self.assertFalse(search(u'Safari - Bookmarks'))
+        self.assertEqual(combine([]), None)
+
+    def test_capitalized_pattern(self):
+        rules = PrivacyFilter(titles=[r'Bank Statement'], urls=[r'^https://MyBank\.com/'])
+        self.assertFalse(rules.window(u'Preview', u'Bank Statement.pdf'))
+        self.assertFalse(rules.allows(timestamp(2014, 5, 5, 12, 0)))
+        self.assertFalse(rules.allows_window(u'Safari', u'Home', 'https://mybank.com/accounts'))
+        self.assertTrue(rules.window(u'Preview', u'Holidays.pdf'))
+        self.assertTrue(rules.allows(timestamp(2014, 5, 5, 12, 0)))
+
+    def test_unicode_title(self):
+        rules = PrivacyFilter(titles=[u'ÉCOLE'])
+        self.assertFalse(rules.allows_window(u'Mail', u'Réunion de l\'école'))
+
+    def test_processes(self):
+        rules = PrivacyFilter(processes=[u'1Password'])
+        self.assertFalse(rules.allows_window(u'1Password', u'Vault'))
+        self.assertTrue(rules.allows_window(u'Safari', u'Vault'))
+
+    def test_quiet_week(self):
+        # 22:00 to 07:00 every day, 12:00 to 13:00 Monday to Friday
+        week = quiet_week([(22, 0, 7, 0, True), (12, 0, 13, 0, False)])
+        minute = lambda day, hour, m: (day * 24 + hour) * 60 + m
+        self.assertEqual(week[minute(0, 23, 0)], 1)
+        self.assertEqual(week[minute(1, 6, 59)], 1)
+        self.assertEqual(week[minute(1, 7, 0)], 0)
+        self.assertEqual(week[minute(4, 12, 30)], 1)
+        self.assertEqual(week[minute(5, 12, 30)], 0)
+        # Sunday night runs into Monday morning
+        self.assertEqual(week[minute(0, 3, 0)], 1)
+
+    def test_quiet_hours(self):
+        rules = PrivacyFilter(intervals=[(12, 0, 13, 0, False)])
+        # 2014-05-05 was a Monday
+        self.assertFalse(rules.allows(timestamp(2014, 5, 5, 12, 30)))
+        self.assertTrue(rules.allows(timestamp(2014, 5, 5, 13, 0)))
+        self.assertTrue(rules.allows(timestamp(2014, 5, 10, 12, 30)))
+
+    def test_geofence(self):
+        places = GeofenceIndex([(48.8566, 2.3522)], radius=200)
+        self.assertTrue(places.inside(48.8566, 2.3522))
+        self.assertTrue(places.inside(48.8576, 2.3532))
+        self.assertFalse(places.inside(48.8606, 2.3522))
+
+    def test_geofence_antimeridian(self):
+        places = GeofenceIndex([(-16.5, 179.9995)], radius=200)
+        # 100 meters east, across the antimeridian
+        lon = 179.9995 + 100 / distance(-16.5, 0, -16.5, 1) - 360
+        self.assertTrue(places.inside(-16.5, lon))
+        self.assertFalse(places.inside(-16.5, -179.99))
+
+    def test_geofence_near_pole(self):
+        places = GeofenceIndex([(89.999, 0)], radius=200)
+        self.assertTrue(places.inside(89.999, 90))
+
+
+if __name__ == '__main__':
+    unittest.main()
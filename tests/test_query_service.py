@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+
+from selfspy import models
+from selfspy.models import Process
+from selfspy.query_service import QueryService
+
+
+def process_names(session):
+    return [name for name, in session.query(Process.name)]
+
+
+def broken(session):
+    raise ValueError('broken')
+
+
+class QueryServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        db_path = os.path.join(self.dir, 'selfspy.sqlite')
+        session = models.initialize(db_path)()
+        session.add(Process(u'Safari'))
+        session.commit()
+        session.close()
+        self.queries = QueryService(db_path)
+        self.called = []
+        # callbacks run on the worker, once result() returned
+        self.notified = threading.Event()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def callback(self, value):
+        self.called.append(('callback', value))
+        self.notified.set()
+
+    def errback(self, error):
+        self.called.append(('errback', str(error)))
+        self.notified.set()
+
+    def test_callback(self):
+        future = self.queries.submit(process_names, callback=self.callback, errback=self.errback)
+        self.assertEqual(future.result(5), [u'Safari'])
+        self.notified.wait(5)
+        self.assertEqual(self.called, [('callback', [u'Safari'])])
+
+    def test_errback(self):
+        future = self.queries.submit(broken, callback=self.callback, errback=self.errback)
+        self.assertRaises(ValueError, future.result, 5)
+        self.notified.wait(5)
+        self.assertEqual(self.called, [('errback', 'broken')])
+
+    def test_added_once_done(self):
+        future = self.queries.submit(broken)
+        self.assertRaises(ValueError, future.result, 5)
+        future.add_done_callback(self.callback)
+        future.add_done_callback(self.callback, self.errback)
+        self.assertEqual(self.called, [('errback', 'broken')])
+
+
+if __name__ == '__main__':
+    unittest.main()
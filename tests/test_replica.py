@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from selfspy import mirror
+from selfspy.replica import Replica
+
+
+class ReplicaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(setattr, mirror, 'CHUNK_BLOCKS', mirror.CHUNK_BLOCKS)
+        mirror.CHUNK_BLOCKS = 1
+        self.db_path = os.path.join(self.dir, 'selfspy.sqlite')
+        self.partition = os.path.join(self.dir, 'selfspy-2014-05.sqlite')
+        for path in (self.db_path, self.partition):
+            conn = sqlite3.connect(path)
+            conn.execute('CREATE TABLE row (id INTEGER PRIMARY KEY, text TEXT)')
+            conn.commit()
+            conn.close()
+        self.insert(100)
+        self.replica = Replica(self.db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def insert(self, n):
+        for path in (self.db_path, self.partition):
+            conn = sqlite3.connect(path)
+            conn.executemany('INSERT INTO row (text) VALUES (?)', [('x' * 1000,)] * n)
+            conn.commit()
+            conn.close()
+
+    def rows(self):
+        counts = []
+        for name in ('selfspy.sqlite', 'selfspy-2014-05.sqlite'):
+            conn = sqlite3.connect(self.replica.path(name))
+            self.assertEqual(conn.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+            counts.append(conn.execute('SELECT count(*) FROM row').fetchone()[0])
+            conn.close()
+        return counts
+
+    def test_snapshot(self):
+        self.replica.refresh()
+        self.assertEqual(self.rows(), [100, 100])
+        self.insert(50)
+        # the snapshot is recent, taken again only when forced
+        self.replica.refresh()
+        self.assertEqual(self.rows(), [100, 100])
+        self.replica.refresh(force=True)
+        self.assertEqual(self.rows(), [150, 150])
+
+    def test_connection_keeps_snapshot(self):
+        conn = self.replica.connect()
+        self.insert(10)
+        self.replica.refresh(force=True)
+        self.assertEqual(conn.execute('SELECT count(*) FROM row').fetchone()[0], 100)
+        conn.close()
+        self.assertEqual(self.rows(), [110, 110])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+
+from selfspy import config as cfg
+from selfspy import models, partitions
+from selfspy.models import Click, Process, ProcessEvent, ProcessInterval, MediaFile
+from selfspy.retention import RetentionEngine
+from selfspy.timeline import to_seconds
+
+# recent, as rows are written to the partition of the current month
+T0 = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(hours=1)
+
+
+def at(minutes):
+    return T0 + datetime.timedelta(minutes=minutes)
+
+
+class RetentionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.current_dir = cfg.CURRENT_DIR
+        cfg.CURRENT_DIR = self.dir
+        os.makedirs(os.path.join(self.dir, 'screenshots'))
+
+    def tearDown(self):
+        cfg.CURRENT_DIR = self.current_dir
+        shutil.rmtree(self.dir)
+
+    def open(self, partitioned=False):
+        path = os.path.join(self.dir, 'test.sqlite')
+        if partitioned:
+            session_maker, parts = partitions.initialize(path)
+        else:
+            session_maker, parts = models.initialize(path), None
+        self.session = session_maker()
+        self.retention = RetentionEngine(self.session, batch_size=2, partitions=parts)
+        self.addCleanup(self.session.close)
+
+    def click(self, minutes):
+        click = Click(1, True, 0, 0, 0, [], [], 1, 1, 1)
+        click.created_at = unicode(at(minutes))
+        self.session.add(click)
+
+    def clicks(self):
+        return sorted(c.created_at for c in self.session.query(Click))
+
+    def screenshot(self, minutes):
+        filename = at(minutes).strftime("%y%m%d-%H%M%S%f") + '.jpg'
+        open(os.path.join(self.dir, 'screenshots', filename), 'w').close()
+        self.retention.add_media('screenshots', filename)
+        return filename
+
+    def check_purge(self, partitioned):
+        self.open(partitioned)
+        for minutes in range(10):
+            self.click(minutes)
+        kept = self.screenshot(2)
+        deleted = self.screenshot(7)
+        self.session.commit()
+
+        self.retention.purge_since(at(4), until=at(8))
+        done = []
+        self.retention.then(lambda: done.append(True))
+        steps = 0
+        while self.retention.step():
+            steps += 1
+        self.assertEqual(done, [True])
+        # batches of two rows, and what came after until is kept
+        self.assertTrue(steps > 2)
+        self.assertEqual(self.clicks(), [unicode(at(m)) for m in (0, 1, 2, 3, 4, 9)])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir, 'screenshots'))), [kept])
+        self.assertEqual([m.filename for m in self.session.query(MediaFile)], [kept])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'screenshots', deleted)))
+
+    def test_purge(self):
+        self.check_purge(False)
+
+    def test_purge_partitioned(self):
+        self.check_purge(True)
+
+    def test_purge_cuts_intervals(self):
+        self.open()
+        self.session.add(Process(u'Safari'))
+        for minutes, event_type in [(0, u'Active'), (10, u'Inactive')]:
+            self.session.add(ProcessEvent(1, event_type, unicode(at(minutes))))
+        interval = ProcessInterval(1, to_seconds(str(at(0))), 1)
+        interval.end_time = to_seconds(str(at(10)))
+        interval.end_event_id = 2
+        self.session.add(interval)
+        self.session.commit()
+
+        self.retention.purge_since(at(5), until=at(20))
+        self.retention.run_all()
+        interval = self.session.query(ProcessInterval).one()
+        self.assertEqual((interval.end_time, interval.end_event_id), (to_seconds(str(at(5))), 1))
+        self.assertEqual(self.session.query(ProcessEvent).count(), 1)
+
+    def test_run_for(self):
+        self.open()
+        for minutes in range(10):
+            self.click(minutes)
+        self.session.commit()
+        self.retention.purge_since(None)
+        # a single batch when there is no time for more
+        self.assertTrue(self.retention.run_for(0))
+        self.assertEqual(len(self.clicks()), 8)
+        self.assertFalse(self.retention.run_for(10))
+        self.assertEqual(self.clicks(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+
+from selfspy.sampling import (ExperienceSchedule, quiet_ranges, plan, midnight,
+                              DAY, MIN_SPACING, IDLE_TIME)
+
+MONDAY = datetime.date(2014, 5, 5)
+NIGHTS = (22, 0, 7, 0, False)  # Monday to Friday nights
+
+
+class PlanTest(unittest.TestCase):
+
+    def test_quiet_ranges(self):
+        # Monday night starts, Sunday night did not
+        self.assertEqual(quiet_ranges([NIGHTS], MONDAY), [(22 * 3600, DAY)])
+        tuesday = MONDAY + datetime.timedelta(days=1)
+        self.assertEqual(quiet_ranges([NIGHTS], tuesday), [(22 * 3600, DAY), (0, 7 * 3600)])
+        # Friday night runs into Saturday
+        saturday = MONDAY + datetime.timedelta(days=5)
+        self.assertEqual(quiet_ranges([NIGHTS], saturday), [(0, 7 * 3600)])
+        self.assertEqual(quiet_ranges([(12, 0, 13, 0, True)], saturday), [(12 * 3600, 13 * 3600)])
+
+    def test_plan_same_every_time(self):
+        self.assertEqual(plan(MONDAY, 3600, seed=1), plan(MONDAY, 3600, seed=1))
+        self.assertNotEqual(plan(MONDAY, 3600, seed=1), plan(MONDAY, 3600, seed=2))
+        self.assertNotEqual(plan(MONDAY, 3600, seed=1),
+                            plan(MONDAY + datetime.timedelta(days=1), 3600, seed=1))
+
+    def test_plan_spacing(self):
+        for interval in (600, 1800, 3600):
+            times = plan(MONDAY, interval, seed=3)
+            self.assertTrue(len(times) <= DAY // interval)
+            self.assertTrue(all(0 <= t < DAY for t in times))
+            spacing = min(MIN_SPACING, interval / 2.0)
+            self.assertTrue(all(b - a >= spacing - 1 for a, b in zip(times, times[1:])))
+
+    def test_plan_quiet(self):
+        quiet = quiet_ranges([NIGHTS], MONDAY + datetime.timedelta(days=1))
+        times = plan(MONDAY, 1800, quiet, seed=4)
+        self.assertTrue(times)
+        self.assertTrue(all(7 * 3600 <= t < 22 * 3600 for t in times))
+
+
+class ExperienceScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'experience_schedule.json')
+        self.schedule = ExperienceSchedule(self.path, 3600)
+        self.schedule.state['seed'] = 0
+        self.start = midnight(MONDAY)
+        self.first = self.schedule.next_prompt(self.start)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_due(self):
+        self.assertFalse(self.schedule.due(self.first - 1))
+        self.assertTrue(self.schedule.due(self.first))
+        # shown once
+        self.assertFalse(self.schedule.due(self.first))
+        self.assertTrue(self.schedule.next_prompt(self.first) > self.first)
+
+    def test_kept_across_restarts(self):
+        times = list(self.schedule.times(self.start))
+        self.assertEqual(ExperienceSchedule(self.path, 3600).times(self.start), times)
+
+    def test_idle_waits(self):
+        self.assertFalse(self.schedule.due(self.first + 60, idle=IDLE_TIME + 1))
+        self.assertTrue(self.schedule.due(self.first + 120, idle=0))
+
+    def test_late_dropped(self):
+        self.schedule.state['times'] = [self.first, self.first + 3000]
+        # more than half an interval late, dropped without showing it
+        self.assertFalse(self.schedule.due(self.first + 1801))
+        self.assertEqual(self.schedule.next_prompt(self.first + 1801), self.first + 3000)
+        self.assertTrue(self.schedule.due(self.first + 3000))
+
+    def test_disabled(self):
+        self.schedule.configure(3600, False)
+        self.assertFalse(self.schedule.due(self.first))
+
+    def test_configure_replans(self):
+        self.schedule.configure(1800, True)
+        self.assertNotEqual(self.schedule.times(self.start), [])
+        self.assertEqual(self.schedule.state['interval'], 1800)
+
+
+if __name__ == '__main__':
+    unittest.main()
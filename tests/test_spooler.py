@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+from selfspy import config as cfg
+from selfspy import models, spooler
+from selfspy.models import Process, ProcessEvent
+from selfspy.retention import RetentionEngine
+from selfspy.spooler import Spooler, DirectorySink
+
+
+class SpoolerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.current_dir = cfg.CURRENT_DIR
+        cfg.CURRENT_DIR = self.dir
+        os.makedirs(os.path.join(self.dir, 'screenshots'))
+        self.db_path = os.path.join(self.dir, 'selfspy.sqlite')
+        self.session = models.initialize(self.db_path)()
+        self.retention = RetentionEngine(self.session)
+        self.target = os.path.join(self.dir, 'target')
+        self.spooler = Spooler(self.db_path, self.dir, os.path.join(self.dir, 'spool'),
+                               DirectorySink(self.target), host=u'laptop')
+        self.minute = 0
+
+    def tearDown(self):
+        cfg.CURRENT_DIR = self.current_dir
+        self.session.close()
+        shutil.rmtree(self.dir)
+
+    def record(self, app, events=2, screenshots=0, size=10):
+        process = Process(app)
+        self.session.add(process)
+        self.session.flush()
+        for _ in range(events):
+            self.minute += 1
+            self.session.add(ProcessEvent(process.id, u'Active', u'2014-05-01 10:%02d:00' % self.minute))
+        for _ in range(screenshots):
+            self.minute += 1
+            filename = '140501-10%02d00000000.jpg' % self.minute
+            with open(os.path.join(self.dir, 'screenshots', filename), 'w') as f:
+                f.write('x' * size)
+            self.retention.add_media('screenshots', filename)
+        self.session.commit()
+
+    def shipped(self):
+        """ {table: [rows]} and media names of the segments shipped """
+        self.spooler.run()
+        tables = {}
+        media = []
+        for name in sorted(os.listdir(self.target)):
+            with zipfile.ZipFile(os.path.join(self.target, name)) as segment:
+                for table, rows in json.loads(segment.read('rows.json'))['tables'].items():
+                    tables.setdefault(table, []).extend(rows)
+                media.extend(n for n in segment.namelist() if n != 'rows.json')
+        return tables, media
+
+    def test_segments(self):
+        self.record(u'Safari', screenshots=1)
+        self.record(u'Mail', screenshots=1)
+        tables, media = self.shipped()
+        self.assertEqual(sorted(row[3] for row in tables['process']), [u'Mail', u'Safari'])
+        self.assertEqual(len(tables['processevent']), 4)
+        self.assertEqual(len(media), 2)
+        # nothing new, no segment
+        self.assertFalse(self.spooler.package())
+
+    def test_purge_record_spool(self):
+        self.record(u'Safari', events=5)
+        self.shipped()
+        self.retention.purge_since(None)
+        self.retention.run_all()
+        # the deleted ids are handed out again
+        self.record(u'Mail', events=1)
+        self.assertEqual(self.session.query(Process.id).scalar(), 1)
+        tables, _ = self.shipped()
+        self.assertEqual([row[3] for row in tables['process']], [u'Safari', u'Mail'])
+        self.assertEqual([row[1] for row in tables['processevent']], [1, 2, 3, 4, 5, 1])
+
+    def test_media_cut(self):
+        self.addCleanup(setattr, spooler, 'SEGMENT_MEDIA_BYTES', spooler.SEGMENT_MEDIA_BYTES)
+        spooler.SEGMENT_MEDIA_BYTES = 100
+        size = 51
+        self.record(u'Safari', events=0)
+        self.shipped()
+        self.record(u'Preview', events=1, screenshots=4, size=size)
+        self.spooler.package()
+        self.spooler.package()
+        self.assertEqual(self.spooler.package(), False)
+        media = []
+        for name in self.spooler.segments():
+            with zipfile.ZipFile(os.path.join(self.spooler.spool_dir, name)) as segment:
+                media.append(len(segment.namelist()) - 1)
+        self.assertEqual(media, [2, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from selfspy import config as cfg
+from selfspy.storage_budget import StorageBudget
+
+
+class StorageBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.budget_mb = cfg.STORAGE_BUDGET_MB
+        cfg.STORAGE_BUDGET_MB = 1
+        self.storage = StorageBudget(self.dir)
+
+    def tearDown(self):
+        cfg.STORAGE_BUDGET_MB = self.budget_mb
+        shutil.rmtree(self.dir)
+
+    def write(self, name, size):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write('x' * size)
+        return path
+
+    def test_walk_in_thread(self):
+        self.write('a.jpg', 1000)
+        self.storage.check(force=True)
+        self.storage.walker.join()
+        self.assertEqual(self.storage.usage, 1000)
+
+    def test_noted_during_walk(self):
+        self.write('a.jpg', 1000)
+        self.storage.walk()
+        self.storage.note_written(self.write('b.jpg', 500))
+        self.storage.walker.join()
+        # b.jpg may have been walked too, it is counted at least once
+        self.assertTrue(1500 <= self.storage.usage <= 2000)
+
+    def test_over_budget(self):
+        self.write('a.jpg', 1024 * 1024)
+        self.storage.check(force=True)
+        self.storage.walker.join()
+        self.assertTrue(self.storage.check(force=True) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
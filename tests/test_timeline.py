@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from selfspy import models, timeline
+from selfspy.models import ProcessEvent, ProcessInterval
+from selfspy.timeline import Timeline, ActiveWindows, to_seconds
+
+
+def at(second):
+    return u'2014-05-01 10:00:%02d.000000' % second
+
+
+class TimelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.session = models.initialize(os.path.join(self.dir, 'test.sqlite'))()
+        self.timeline = Timeline(self.session)
+        self.read = []
+        self.events_since = timeline.events_since
+
+        def counting(*args):
+            rows = list(self.events_since(*args))
+            self.read.extend(row[0] for row in rows)
+            return rows
+        timeline.events_since = counting
+
+    def tearDown(self):
+        timeline.events_since = self.events_since
+        self.session.close()
+        shutil.rmtree(self.dir)
+
+    def record(self, process_id, event_type, second):
+        self.session.add(ProcessEvent(process_id, event_type, at(second)))
+        self.session.commit()
+
+    def intervals(self):
+        return [(i.process_id, i.start_time, i.end_time)
+                for i in self.session.query(ProcessInterval).order_by(ProcessInterval.id)]
+
+    def test_intervals(self):
+        self.record(1, u'Active', 0)
+        self.record(2, u'Active', 10)
+        self.record(2, u'Inactive', 15)
+        self.timeline.refresh()
+        self.assertEqual(self.intervals(), [(1, to_seconds(at(0)), to_seconds(at(10))),
+                                            (2, to_seconds(at(10)), to_seconds(at(15)))])
+
+    def test_events_read_once(self):
+        self.record(1, u'Active', 0)
+        self.timeline.refresh()
+        # an event of another process neither starts nor ends an interval
+        self.record(2, u'Inactive', 5)
+        self.timeline.refresh()
+        self.timeline.refresh()
+        self.assertEqual(self.read, [1, 2])
+        self.record(2, u'Active', 10)
+        self.timeline.refresh()
+        self.assertEqual(self.read, [1, 2, 3])
+        self.assertEqual(len(self.intervals()), 2)
+
+    def test_reset_after_delete(self):
+        self.record(1, u'Active', 0)
+        self.record(2, u'Inactive', 5)
+        self.timeline.refresh()
+        self.session.query(ProcessEvent).filter(ProcessEvent.id == 2).delete()
+        self.session.commit()
+        self.timeline.reset()
+        # the deleted id is handed out again
+        self.record(1, u'Inactive', 8)
+        self.timeline.refresh()
+        self.assertEqual(self.intervals(), [(1, to_seconds(at(0)), to_seconds(at(8)))])
+
+
+class ActiveWindowsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.session = models.initialize(os.path.join(self.dir, 'test.sqlite'))()
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.dir)
+
+    def record(self, events):
+        for window_id, event_type, second in events:
+            self.session.add(models.WindowEvent(window_id, event_type, at(second)))
+        self.session.commit()
+
+    def test_at(self):
+        self.record([(1, u'Active', 0), (2, u'Active', 10), (2, u'Inactive', 20)])
+        windows = ActiveWindows(self.session, since=to_seconds(at(0)), until=to_seconds(at(30)))
+        self.assertEqual(windows.at(to_seconds(at(5))), 1)
+        self.assertEqual(windows.at(to_seconds(at(15))), 2)
+        self.assertEqual(windows.at(to_seconds(at(25))), None)
+
+    def test_range(self):
+        self.record([(1, u'Active', 0), (2, u'Active', 10), (3, u'Active', 20),
+                     (4, u'Active', 30), (4, u'Inactive', 40)])
+        windows = ActiveWindows(self.session, since=to_seconds(at(15)), until=to_seconds(at(25)))
+        # the window activated before the range is still known, those
+        # after it are not read
+        self.assertEqual(windows.window_ids, [2, 3])
+        self.assertEqual(windows.at(to_seconds(at(16))), 2)
+        self.assertEqual(windows.at(to_seconds(at(22))), 3)
+        self.assertTrue(windows.covers(to_seconds(at(25))))
+        self.assertFalse(windows.covers(to_seconds(at(26))))
+
+
+if __name__ == '__main__':
+    unittest.main()